@@ -1,21 +1,48 @@
-from flask import Flask, request, jsonify, send_file, make_response
+from flask import Flask, Request, Response, request, jsonify, send_file, make_response
 from flask_cors import CORS
 import os
 import sys
+import json
 import threading
 import time
-from typing import List, Dict, Any
-import tempfile
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
+from io import BytesIO
+from PIL import Image
 import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.image_processor_service import ImageFeatureExtractor
-from services.search_service import SemanticSearchService
+from services.search_service import SemanticSearchService, parse_fields
+from services.job_store import JobStore
+from services.folder_scanner import FolderScanner, IMAGE_EXTENSIONS
+from services.folder_watcher import FolderWatcher, watch_supported
+from services.image_decode import (
+    THUMBNAIL_FORMATS, choose_thumbnail_format, encode_thumbnail, thumbnail_mimetype, thumbnail_tier
+)
+from services.metadata_filter import parse_filters
+import config
+
+class InMemoryUploadRequest(Request):
+    """
+    上传的文件始终保存在内存中（werkzeug 默认超过 500KB 时写入临时文件），以图搜图直接从内存解码；
+    请求体超过 UPLOAD_MAX_MB 时不再缓冲，由接口返回 413
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is None or total_content_length > config.UPLOAD_MAX_MB * 1024 * 1024:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return BytesIO()
+
 
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
+# 部署在 nginx / Apache 之后时，原图由前端服务器通过 X-Sendfile 直接发送
+app.config['USE_X_SENDFILE'] = config.USE_X_SENDFILE
 # 配置CORS以允许前端访问，支持所有来源和方法
 CORS(app, resources={
     r"/api/*": {
@@ -32,6 +59,15 @@ search_service = SemanticSearchService()
 # 用于跟踪处理进度的字典
 processing_status = {}
 
+# 持久化的索引任务记录，用于服务重启后恢复被中断的任务
+job_store = JobStore(config.INDEX_JOBS_PATH)
+
+# 已登记文件夹的实时监听，文件变化后增量更新索引
+folder_watcher = FolderWatcher(search_service)
+
+# 批量缩略图接口使用的线程池
+thumbnail_executor = ThreadPoolExecutor(max_workers=config.THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
 @app.after_request
 def after_request(response):
     """为所有响应添加CORS头部"""
@@ -59,18 +95,64 @@ def extract_features():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def request_filters(raw) -> Dict[str, Any]:
+    """
+    解析请求中的过滤条件（对象，或上传表单中的 JSON 字符串），格式错误时抛出 ValueError
+    例如 {"folder": "/photos/2023", "dateFrom": "2023-06-01", "dateTo": "2023-08-31",
+          "formats": ["jpeg"], "minWidth": 1920}
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw) if raw.strip() else None
+        except json.JSONDecodeError:
+            raise ValueError("filters 不是有效的 JSON")
+    return parse_filters(raw)
+
+def request_int(raw, name: str, default: Optional[int] = None, maximum: int = None) -> Optional[int]:
+    """
+    解析请求中的正整数参数（JSON 数值、表单或查询字符串），超过 maximum 时取 maximum；
+    缺省时返回 default，不是正整数时抛出 ValueError
+    """
+    if raw is None or raw == "":
+        return default
+    if isinstance(raw, bool):
+        raise ValueError(f"{name} 必须是正整数")
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} 必须是正整数")
+    if value <= 0 or (isinstance(raw, float) and value != raw):
+        raise ValueError(f"{name} 必须是正整数")
+    return min(value, maximum) if maximum else value
+
 @app.route('/api/search-by-text', methods=['POST'])
 def search_by_text():
     """根据文本搜索"""
     try:
         data = request.get_json()
         query = data.get('query')
-        top_k = data.get('topK', 10)  # 获取返回结果数量，默认10
         
         if not query:
             return jsonify({"error": "Search query is required"}), 400
-        
-        results = search_service.search_by_text(query, top_k=top_k)
+        # 返回结果数量 topK（默认10），可选的过滤条件和结果字段投影（如 ["id", "path", "similarity"]，不需要元数据时不读取元数据库）；
+        # 提供 pageSize 时分页返回：第一页和游标，后续页通过 /api/search-results 获取
+        try:
+            top_k = request_int(data.get('topK'), "topK", default=10, maximum=config.SEARCH_TOP_K_MAX)
+            nprobe = request_int(data.get('nprobe'), "nprobe")
+            ef_search = request_int(data.get('efSearch'), "efSearch")
+            filters = request_filters(data.get('filters'))
+            fields = parse_fields(data.get('fields'))
+            page_size = request_int(data.get('pageSize'), "pageSize", maximum=config.RESULT_CACHE_DEPTH)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if page_size:
+            return jsonify(search_service.search_by_text_page(query, page_size=page_size, nprobe=nprobe,
+                                                              ef_search=ef_search, filters=filters, fields=fields))
+        
+        # 可选：按查询调整近似索引的召回率（IVF 的 nprobe、HNSW 的 efSearch）
+        results = search_service.search_by_text(query, top_k=top_k, nprobe=nprobe,
+                                                ef_search=ef_search, filters=filters, fields=fields)
         return jsonify({"results": results})
     except Exception as e:
         print(f"文本搜索API错误: {e}")
@@ -80,27 +162,41 @@ def search_by_text():
 def search_by_image():
     """以图搜图 - 支持上传图片或使用本地路径"""
     try:
+        max_bytes = config.UPLOAD_MAX_MB * 1024 * 1024
+        # 在解析表单之前按请求头拒绝过大的上传
+        if request.content_length is not None and request.content_length > max_bytes:
+            return jsonify({"error": f"Image file exceeds {config.UPLOAD_MAX_MB}MB"}), 413
         if 'image' in request.files:
             # 情况1: 上传图片文件
             image_file = request.files['image']
             if image_file.filename == '':
                 return jsonify({"error": "No image file provided"}), 400
             
-            # 从查询参数或表单数据获取topK
-            top_k = int(request.args.get('topK', 10))
-            
-            # 将上传的文件保存到临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(image_file.filename)[1]) as temp_file:
-                image_file.save(temp_file.name)
-                temp_path = temp_file.name
+            # 直接读取内存中的文件数据（没有 Content-Length 的请求也按上限截断检查）
+            image_data = image_file.read(max_bytes + 1)
+            if len(image_data) > max_bytes:
+                return jsonify({"error": f"Image file exceeds {config.UPLOAD_MAX_MB}MB"}), 413
+            if not image_data:
+                return jsonify({"error": "No image file provided"}), 400
             
             try:
-                # 使用临时文件进行搜索
-                results = search_service.search_by_image(temp_path, top_k=top_k)
-                return jsonify({"results": results})
-            finally:
-                # 删除临时文件
-                os.unlink(temp_path)
+                top_k = request_int(request.args.get('topK'), "topK", default=10, maximum=config.SEARCH_TOP_K_MAX)
+                nprobe = request_int(request.args.get('nprobe'), "nprobe")
+                ef_search = request_int(request.args.get('efSearch'), "efSearch")
+                page_size = request_int(request.args.get('pageSize'), "pageSize", maximum=config.RESULT_CACHE_DEPTH)
+                filters = request_filters(request.form.get('filters') or request.args.get('filters'))
+                fields = parse_fields(request.form.get('fields') or request.args.get('fields'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            # 图片数据直接交给搜索服务在内存中缩小解码，不写临时文件
+            if page_size:
+                return jsonify(search_service.search_by_image_page(image_data, page_size=page_size, nprobe=nprobe,
+                                                                   ef_search=ef_search, filters=filters,
+                                                                   fields=fields))
+            results = search_service.search_by_image(image_data, top_k=top_k, nprobe=nprobe, ef_search=ef_search,
+                                                     filters=filters, fields=fields)
+            return jsonify({"results": results})
         else:
             # 情况2: 使用本地路径
             data = request.get_json()
@@ -108,18 +204,103 @@ def search_by_image():
                 return jsonify({"error": "No data provided"}), 400
                 
             image_path = data.get('imagePath')
-            top_k = data.get('topK', 10)  # 获取返回结果数量，默认10
             
             if not image_path:
                 return jsonify({"error": "Image path or file is required"}), 400
+            try:
+                top_k = request_int(data.get('topK'), "topK", default=10, maximum=config.SEARCH_TOP_K_MAX)
+                nprobe = request_int(data.get('nprobe'), "nprobe")
+                ef_search = request_int(data.get('efSearch'), "efSearch")
+                filters = request_filters(data.get('filters'))
+                fields = parse_fields(data.get('fields'))
+                page_size = request_int(data.get('pageSize'), "pageSize", maximum=config.RESULT_CACHE_DEPTH)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             
-            results = search_service.search_by_image(image_path, top_k=top_k)
+            if page_size:
+                return jsonify(search_service.search_by_image_page(image_path, page_size=page_size,
+                                                                   nprobe=nprobe,
+                                                                   ef_search=ef_search, filters=filters,
+                                                                   fields=fields))
+            results = search_service.search_by_image(image_path, top_k=top_k, nprobe=nprobe,
+                                                     ef_search=ef_search, filters=filters, fields=fields)
             return jsonify({"results": results})
     except Exception as e:
         print(f"搜索图片时出错: {str(e)}")  # 添加调试日志
         return jsonify({"error": str(e)}), 500
 
-def process_folder_impl(folder_path: str, task_id: str, model: str = 'clip-vit-base-patch32'):
+@app.route('/api/search-results', methods=['POST'])
+def search_results_page():
+    """
+    分页搜索的后续页：请求体 {"cursor": "...", "offset": 20, "pageSize": 20}
+    结果集已过期或索引已变化时返回 410，客户端需重新发起搜索
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        cursor = data.get('cursor')
+        if not cursor:
+            return jsonify({"error": "cursor is required"}), 400
+        try:
+            offset = max(0, int(data.get('offset', 0)))
+        except (TypeError, ValueError):
+            return jsonify({"error": "offset must be an integer"}), 400
+        try:
+            page_size = request_int(data.get('pageSize'), "pageSize", default=20, maximum=config.RESULT_CACHE_DEPTH)
+            fields = parse_fields(data.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        page = search_service.result_page(cursor, offset, page_size, fields)
+        if page is None:
+            return jsonify({"error": "Result set expired, please search again"}), 410
+        return jsonify(page)
+    except Exception as e:
+        print(f"获取搜索结果页失败: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search-batch', methods=['POST'])
+def search_batch():
+    """
+    批量搜索：一次提交多个文本查询和/或以图搜图的图片路径
+    请求体 {"queries": [{"text": "..."} 或 {"imagePath": "..."}, ...], "topK": 10, "filters": {...}}，
+    返回 {"results": [[...], ...]}，与 queries 一一对应
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        raw_queries = data.get('queries')
+        
+        if not isinstance(raw_queries, list) or not raw_queries:
+            return jsonify({"error": "queries must be a non-empty list"}), 400
+        if len(raw_queries) > config.SEARCH_BATCH_MAX:
+            return jsonify({"error": f"At most {config.SEARCH_BATCH_MAX} queries per request"}), 400
+        
+        queries = []
+        for query in raw_queries:
+            if isinstance(query, str):
+                queries.append(("text", query))
+            elif isinstance(query, dict) and query.get('text'):
+                queries.append(("text", query['text']))
+            elif isinstance(query, dict) and query.get('imagePath'):
+                queries.append(("image", query['imagePath']))
+            else:
+                return jsonify({"error": "Each query needs text or imagePath"}), 400
+        try:
+            top_k = request_int(data.get('topK'), "topK", default=10, maximum=config.SEARCH_TOP_K_MAX)
+            nprobe = request_int(data.get('nprobe'), "nprobe")
+            ef_search = request_int(data.get('efSearch'), "efSearch")
+            filters = request_filters(data.get('filters'))
+            fields = parse_fields(data.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        results = search_service.search_batch(queries, top_k=top_k, nprobe=nprobe,
+                                              ef_search=ef_search, filters=filters, fields=fields)
+        return jsonify({"results": results})
+    except Exception as e:
+        print(f"批量搜索API错误: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def process_folder_impl(folder_path: str, task_id: str, model: str = 'clip-vit-base-patch32', workers: int = None):
     """实际的文件夹处理实现"""
     global processing_status
     try:
@@ -130,42 +311,61 @@ def process_folder_impl(folder_path: str, task_id: str, model: str = 'clip-vit-b
             "total": 0, 
             "processed": 0, 
             "folderPath": folder_path,  # 添加文件夹路径
-            "model": model  # 添加模型信息
+            "model": model,  # 添加模型信息
+            "workers": workers or config.INDEX_WORKERS,  # 索引工作进程数
+            "imagesPerSecond": 0.0
         }
-        
-        # 获取文件夹中的所有图像文件
-        image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp')
-        image_files = []
-        
+        job_store.start(task_id, {"folderPath": folder_path, "model": model, "workers": workers})
+        
+        # 使用指定模型处理图像
+        search_service.set_model(model)  # 设置模型
+        
+        # 并行扫描文件夹，扫描到的文件直接流入入库流水线，不必等整个目录树遍历完
+        scanner = FolderScanner()
+        start_time = time.time()
+        last_checkpoint = {"processed": 0, "time": start_time}
+        
+        def update_progress(processed: int, total: int, stage_stats: Dict[str, Any] = None):
+            elapsed = time.time() - start_time
+            # 数量按整个文件夹计算（含未变化的图像），扫描完成前 total 为估算值
+            processing_status[task_id]["processed"] = processed
+            processing_status[task_id]["total"] = total
+            processing_status[task_id]["progress"] = int(processed / total * 100) if total else 100
+            processing_status[task_id]["imagesPerSecond"] = round(processed / elapsed, 2) if elapsed > 0 else 0.0
+            if stage_stats:
+                # 各阶段（解码/推理/写入）的耗时统计和队列积压
+                processing_status[task_id]["stages"] = stage_stats
+            
+            # 定期在后台保存检查点；已写入的图像会记录在文件清单中，恢复任务时直接跳过
+            if (processed - last_checkpoint["processed"] >= config.CHECKPOINT_INTERVAL_IMAGES
+                    or time.time() - last_checkpoint["time"] >= config.CHECKPOINT_INTERVAL_SECONDS):
+                if search_service.checkpoint():
+                    last_checkpoint["processed"] = processed
+                    last_checkpoint["time"] = time.time()
+                    processing_status[task_id]["checkpointAt"] = processed
+                    job_store.update(task_id, processed=processed, total=total)
+        
+        # 与文件指纹清单比对，只对新增和修改过的图像走入库流水线（或多进程模式）
         try:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    if file.lower().endswith(image_extensions):
-                        image_files.append(os.path.join(root, file))
+            changes = search_service.sync_folder(folder_path, scanner.scan(folder_path),
+                                                 batch_size=config.ENCODE_BATCH_SIZE,
+                                                 progress_callback=update_progress, workers=workers,
+                                                 estimated_total=scanner.estimated_total,
+                                                 was_listed=scanner.was_listed)
+            # 子目录或文件读取失败的数量（这些路径下已索引的图像不会被删除，见 changes["skipped"]）
+            changes["errors"] = scanner.errors
         except PermissionError as e:
             print(f"权限不足，无法访问文件夹 {folder_path}: {e}")
             processing_status[task_id]["status"] = "failed"
             processing_status[task_id]["error"] = f"权限不足，无法访问文件夹: {str(e)}"
-            return
-        except Exception as e:
-            print(f"扫描文件夹失败 {folder_path}: {e}")
-            processing_status[task_id]["status"] = "failed"
-            processing_status[task_id]["error"] = f"扫描文件夹失败: {str(e)}"
+            job_store.finish(task_id, "failed")
             return
         
-        total_files = len(image_files)
+        total_files = changes["scanned"]
+        processing_status[task_id]["changes"] = changes
         processing_status[task_id]["total"] = total_files
-        
-        # 逐个处理图像
-        for i, image_path in enumerate(image_files):
-            try:
-                # 使用指定模型处理图像
-                search_service.set_model(model)  # 设置模型
-                search_service.add_image(image_path)
-                processing_status[task_id]["processed"] = i + 1
-                processing_status[task_id]["progress"] = int((i + 1) / total_files * 100)
-            except Exception as e:
-                print(f"处理图像失败 {image_path}: {e}")
+        processing_status[task_id]["processed"] = total_files
+        processing_status[task_id]["progress"] = 100
         
         # 处理完成后更新状态
         processing_status[task_id]["status"] = "completed"
@@ -173,13 +373,46 @@ def process_folder_impl(folder_path: str, task_id: str, model: str = 'clip-vit-b
         
         # 保存索引
         search_service.save_index()
+        job_store.update(task_id, processed=total_files, total=total_files)
+        job_store.finish(task_id)
         
     except Exception as e:
         processing_status[task_id]["status"] = "failed"
         processing_status[task_id]["error"] = str(e)
         processing_status[task_id]["folderPath"] = folder_path  # 确保路径仍然存在
+        job_store.finish(task_id, "failed")
         print(f"处理文件夹失败 {folder_path}: {e}")
 
+def resume_interrupted_jobs():
+    """服务启动时恢复上次被中断的文件夹索引任务，沿用原来的任务ID和参数"""
+    for job in job_store.unfinished():
+        params = job.get("params", {})
+        folder_path = params.get("folderPath")
+        if not folder_path or not os.path.isdir(folder_path):
+            print(f"无法恢复任务 {job['taskId']}，文件夹不存在: {folder_path}")
+            job_store.finish(job["taskId"], "failed")
+            continue
+        
+        print(f"恢复被中断的索引任务 {job['taskId']}: {folder_path}（上次检查点 {job.get('processed', 0)}/{job.get('total', 0)}）")
+        thread = threading.Thread(
+            target=process_folder_impl,
+            args=(folder_path, job["taskId"], params.get("model", search_service.current_model_name), params.get("workers"))
+        )
+        thread.start()
+
+def _parse_workers(data: Dict[str, Any]):
+    """解析请求中的索引工作进程数，未提供时返回 None（使用配置中的默认值）"""
+    workers = data.get('workers')
+    if workers is None:
+        return None, None
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        return None, "workers must be an integer"
+    if workers < 1 or workers > (os.cpu_count() or 1):
+        return None, f"workers must be between 1 and {os.cpu_count() or 1}"
+    return workers, None
+
 @app.route('/api/process-folder', methods=['POST'])
 def process_folder():
     """处理文件夹中的图像"""
@@ -193,6 +426,10 @@ def process_folder():
         if not os.path.isdir(folder_path):
             return jsonify({"error": "Invalid folder path"}), 400
         
+        workers, error = _parse_workers(data)
+        if error:
+            return jsonify({"error": error}), 400
+        
         # 生成任务ID
         task_id = f"task_{int(time.time())}"
         
@@ -200,7 +437,7 @@ def process_folder():
         current_model = search_service.current_model_name
         
         # 在新线程中处理文件夹
-        thread = threading.Thread(target=process_folder_impl, args=(folder_path, task_id, current_model))
+        thread = threading.Thread(target=process_folder_impl, args=(folder_path, task_id, current_model, workers))
         thread.start()
         
         return jsonify({"taskId": task_id, "message": f"Started processing folder {folder_path}"})
@@ -231,11 +468,15 @@ def reindex_folder():
         if not os.path.isdir(folder_path):
             return jsonify({"error": "Invalid folder path"}), 400
         
+        workers, error = _parse_workers(data)
+        if error:
+            return jsonify({"error": error}), 400
+        
         # 生成任务ID
         task_id = f"reindex_task_{int(time.time())}"
         
         # 在新线程中重新处理文件夹，传递模型参数
-        thread = threading.Thread(target=process_folder_impl, args=(folder_path, task_id, model))
+        thread = threading.Thread(target=process_folder_impl, args=(folder_path, task_id, model, workers))
         thread.start()
         
         return jsonify({"taskId": task_id, "message": f"Started reindexing folder {folder_path} with model {model}"})
@@ -243,6 +484,118 @@ def reindex_folder():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/remove-folder', methods=['POST'])
+def remove_folder():
+    """删除文件夹索引：一次性移除该文件夹（含子文件夹）下所有图像的向量和元数据"""
+    try:
+        data = request.get_json()
+        folder_path = data.get('folderPath')
+        
+        if not folder_path:
+            return jsonify({"error": "Folder path is required"}), 400
+        
+        # 文件夹可能已经在磁盘上被删除，这里不检查路径是否存在
+        removed = search_service.remove_folder(folder_path)
+        if removed > 0:
+            search_service.save_index()
+        
+        return jsonify({
+            "success": True,
+            "folderPath": folder_path,
+            "removed": removed,
+            "message": f"Removed {removed} images under {folder_path}"
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/watch-folder', methods=['GET', 'POST'])
+def watch_folder():
+    """查询或设置文件夹监听：POST {folderPath, enabled}，enabled 为 false 时停止监听"""
+    try:
+        if request.method == 'GET':
+            return jsonify(folder_watcher.status())
+        
+        data = request.get_json()
+        folder_path = data.get('folderPath')
+        enabled = data.get('enabled', True)
+        
+        if not folder_path:
+            return jsonify({"error": "Folder path is required"}), 400
+        
+        if enabled:
+            if not watch_supported():
+                return jsonify({"error": "Folder watching is only supported on Linux"}), 400
+            if not os.path.isdir(folder_path):
+                return jsonify({"error": "Folder does not exist"}), 400
+            folder_watcher.watch(folder_path)
+        else:
+            folder_watcher.unwatch(folder_path)
+        
+        return jsonify({"success": True, **folder_watcher.status()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def cached_thumbnail(image_path: str, tier: int, fmt: str = "jpeg", stat: os.stat_result = None) -> bytes:
+    """
+    读取缓存的缩略图，未命中时生成并写入缓存
+    已缓存同一原图更大（或同样大小、其他格式）的档位时直接从它缩放，不再解码原图
+    """
+    cache = search_service.thumbnail_cache
+    target = (tier, tier)
+    
+    def generate() -> bytes:
+        larger = cache.find_larger(image_path, target, config.THUMBNAIL_TIERS, THUMBNAIL_FORMATS, stat)
+        if larger is not None:
+            with Image.open(BytesIO(larger)) as img:
+                return encode_thumbnail(img, target, fmt)
+        return image_processor.generate_thumbnail(image_path, size=target, fmt=fmt)
+    
+    return cache.get_or_create(image_path, target, generate, fmt, stat)
+
+
+def requested_thumbnail(default=None) -> Tuple[int, str]:
+    """解析请求的缩略图档位（size 参数，像素数或档位名称）和按 Accept 头协商的输出格式，size 无效时抛出 ValueError"""
+    tier = thumbnail_tier(request.args.get('size') or default or config.THUMBNAIL_SIZE)
+    return tier, choose_thumbnail_format(request.accept_mimetypes.values())
+
+
+def thumbnail_response(image_path: str, tier: int, fmt: str, download_name: str = None):
+    """
+    返回带 ETag / Last-Modified 的缩略图
+    ETag 即缩略图缓存的键（随原图修改时间、大小、档位和格式变化）；浏览器带着匹配的 If-None-Match
+    （或不早于原图修改时间的 If-Modified-Since）重新请求时直接返回 304，不读取缓存也不生成缩略图
+    """
+    stat = os.stat(image_path)
+    cache = search_service.thumbnail_cache
+    etag = cache.etag(image_path, (tier, tier), fmt, stat=stat)
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (request.if_modified_since is not None
+                        and request.if_modified_since.timestamp() >= int(stat.st_mtime))
+    if not_modified:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.cache_control.max_age = config.THUMBNAIL_MAX_AGE
+    else:
+        thumbnail_data = cached_thumbnail(image_path, tier, fmt, stat)
+        response = send_file(
+            BytesIO(thumbnail_data),
+            mimetype=thumbnail_mimetype(fmt),
+            as_attachment=False,
+            download_name=download_name,
+            etag=etag,
+            last_modified=stat.st_mtime,
+            max_age=config.THUMBNAIL_MAX_AGE
+        )
+    # 同一URL按 Accept 返回不同格式，告知浏览器和代理分别缓存
+    response.vary.add('Accept')
+    return response
+
+
 @app.route('/api/thumbnails/<path:filename>', methods=['GET'])
 def get_thumbnail(filename: str):
     """获取缩略图"""
@@ -258,20 +611,83 @@ def get_thumbnail(filename: str):
         if not os.path.exists(full_path):
             return jsonify({"error": "File not found"}), 404
         
-        # 生成缩略图
-        thumbnail_data = image_processor.generate_thumbnail(full_path)
-        
-        # 返回缩略图
-        from io import BytesIO
-        return send_file(
-            BytesIO(thumbnail_data),
-            mimetype='image/jpeg',
-            as_attachment=False,
-            download_name=f"thumb_{os.path.basename(full_path)}"
-        )
+        # 返回缩略图（优先使用缓存）
+        try:
+            tier, fmt = requested_thumbnail()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return thumbnail_response(full_path, tier, fmt, download_name=f"thumb_{os.path.basename(full_path)}")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/thumbnails/batch', methods=['POST'])
+def get_thumbnails_batch():
+    """
+    批量获取缩略图：POST {ids 或 paths, size}，size 对应到尺寸档位，输出格式按 Accept 头协商
+    缩略图在线程池中并行生成，以 multipart/mixed 流式返回，先生成好的先返回；
+    每个部分带 Content-Length、X-Index（在请求列表中的序号）、X-Image-Path（URL编码）和 ETag，
+    无法生成的图片返回 application/json 的错误信息
+    """
+    try:
+        data = request.get_json() or {}
+        tier = thumbnail_tier(data.get('size') or config.THUMBNAIL_SIZE)
+        
+        if data.get('ids') is not None:
+            image_paths = [search_service.id_to_path.get(int(image_id)) for image_id in data['ids']]
+        else:
+            image_paths = list(data.get('paths') or [])
+        if not image_paths:
+            return jsonify({"error": "ids or paths is required"}), 400
+        if len(image_paths) > config.THUMBNAIL_BATCH_MAX:
+            return jsonify({"error": f"At most {config.THUMBNAIL_BATCH_MAX} thumbnails per request"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    fmt = choose_thumbnail_format(request.accept_mimetypes.values())
+    boundary = uuid.uuid4().hex
+    
+    def render(image_path: str):
+        if not image_path or not image_path.lower().endswith(IMAGE_EXTENSIONS):
+            raise ValueError("Invalid image")
+        stat = os.stat(image_path)
+        thumbnail_data = cached_thumbnail(image_path, tier, fmt, stat)
+        return thumbnail_data, search_service.thumbnail_cache.etag(image_path, (tier, tier), fmt, stat=stat)
+    
+    def part(index: int, image_path: str, content_type: str, body: bytes, etag: str = None) -> bytes:
+        headers = [
+            f"--{boundary}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"X-Index: {index}",
+            f"X-Image-Path: {urllib.parse.quote(image_path or '')}"
+        ]
+        if etag:
+            headers.append(f'ETag: "{etag}"')
+        return ("\r\n".join(headers) + "\r\n\r\n").encode('utf-8') + body + b"\r\n"
+    
+    def generate():
+        futures = {
+            thumbnail_executor.submit(render, image_path): (index, image_path)
+            for index, image_path in enumerate(image_paths)
+        }
+        try:
+            for future in as_completed(futures):
+                index, image_path = futures[future]
+                try:
+                    thumbnail_data, etag = future.result()
+                    yield part(index, image_path, thumbnail_mimetype(fmt), thumbnail_data, etag)
+                except Exception as e:
+                    error = json.dumps({"error": str(e)}, ensure_ascii=False).encode('utf-8')
+                    yield part(index, image_path, 'application/json', error)
+            yield f"--{boundary}--\r\n".encode('utf-8')
+        finally:
+            # 客户端提前断开时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+    
+    return Response(generate(), mimetype=f'multipart/mixed; boundary={boundary}')
+
+
 @app.route('/api/image-proxy', methods=['GET'])
 def image_proxy():
     """图片代理接口，用于前端显示本地图片"""
@@ -288,22 +704,50 @@ def image_proxy():
             return jsonify({"error": "Image not found"}), 404
         
         # 检查是否是图片文件
-        image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp')
-        if not image_path.lower().endswith(image_extensions):
+        if not image_path.lower().endswith(IMAGE_EXTENSIONS):
             return jsonify({"error": "Invalid image format"}), 400
         
-        # 生成缩略图（用于快速加载）
-        thumbnail_data = image_processor.generate_thumbnail(image_path, size=(300, 300))
+        # 返回缩略图（用于快速加载，优先使用缓存）
+        try:
+            tier, fmt = requested_thumbnail()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return thumbnail_response(image_path, tier, fmt)
+    except Exception as e:
+        print(f"图片代理错误: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/image-original', methods=['GET'])
+def image_original():
+    """
+    原图流式传输接口，用于查看原始分辨率的图片
+    直接把文件交给 send_file：支持 Range 分段请求和 ETag / If-Modified-Since 条件请求，
+    WSGI 服务器提供 wsgi.file_wrapper 时使用 sendfile 零拷贝发送，开启 USE_X_SENDFILE 时交给前端服务器发送，
+    文件内容不经过Python缓冲区
+    """
+    try:
+        image_path = request.args.get('path')
+        if not image_path:
+            return jsonify({"error": "Image path is required"}), 400
         
-        # 返回图片
-        from io import BytesIO
-        return send_file(
-            BytesIO(thumbnail_data),
-            mimetype='image/jpeg',
-            as_attachment=False
+        image_path = urllib.parse.unquote(image_path)
+        if not os.path.isfile(image_path):
+            return jsonify({"error": "Image not found"}), 404
+        
+        if not image_path.lower().endswith(IMAGE_EXTENSIONS):
+            return jsonify({"error": "Invalid image format"}), 400
+        
+        response = send_file(
+            os.path.abspath(image_path),
+            as_attachment=False,
+            conditional=True,
+            etag=True,
+            max_age=config.ORIGINAL_MAX_AGE
         )
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
     except Exception as e:
-        print(f"图片代理错误: {e}")
+        print(f"原图传输错误: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/image-info', methods=['POST'])
@@ -324,8 +768,7 @@ def get_image_info():
             return jsonify({"error": "图像文件不存在"}), 404
         
         # 验证是否为图像文件
-        image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp')
-        if not image_path.lower().endswith(image_extensions):
+        if not image_path.lower().endswith(IMAGE_EXTENSIONS):
             print(f"不是有效的图像文件: {image_path}")
             return jsonify({"error": "不是有效的图像文件"}), 400
         
@@ -406,59 +849,19 @@ def get_image_info():
 def get_photos_timeline():
     """获取按时间线组织的照片数据"""
     try:
-        # 获取所有图片路径和元数据
-        if not hasattr(search_service, 'image_paths') or not search_service.image_paths:
-            return jsonify([])
-        
+        # 拍摄时间在入库时已写入元数据库，直接按索引列倒序读取
         timeline_data = []
-        from datetime import datetime
-        import os
-        from PIL import Image
-        from PIL.ExifTags import TAGS
-        
-        for image_path in search_service.image_paths:
-            try:
-                if not os.path.exists(image_path):
-                    continue
-                
-                # 获取文件修改时间作为拍摄时间
-                file_stat = os.stat(image_path)
-                date_taken = datetime.fromtimestamp(file_stat.st_mtime)
-                
-                # 尝试从EXIF获取真实拍摄时间
-                try:
-                    with Image.open(image_path) as img:
-                        exif_data = img._getexif()
-                        if exif_data:
-                            for tag_id, value in exif_data.items():
-                                tag = TAGS.get(tag_id, tag_id)
-                                if tag == "DateTime":
-                                    try:
-                                        date_taken = datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
-                                    except:
-                                        pass
-                except:
-                    pass
-                
-                # 获取图片基本信息
-                metadata = search_service.image_metadata.get(image_path, {})
-                
-                timeline_data.append({
-                    "id": len(timeline_data),
-                    "path": image_path,
-                    "date": date_taken.isoformat(),
-                    "title": os.path.basename(image_path),
-                    "location": metadata.get("location", "未知位置"),
-                    "tags": metadata.get("tags", []),
-                    "metadata": metadata
-                })
-                
-            except Exception as e:
-                print(f"处理图片 {image_path} 时出错: {e}")
-                continue
-        
-        # 按日期排序
-        timeline_data.sort(key=lambda x: x["date"], reverse=True)
+        for row in search_service.metadata_store.timeline():
+            metadata = row["metadata"]
+            timeline_data.append({
+                "id": row["id"],
+                "path": row["path"],
+                "date": row["date_taken"],
+                "title": os.path.basename(row["path"]),
+                "location": row["location"] or "未知位置",
+                "tags": metadata.get("tags", []),
+                "metadata": metadata
+            })
         
         return jsonify(timeline_data)
         
@@ -470,36 +873,25 @@ def get_photos_timeline():
 def get_photos_location():
     """获取按地理位置组织的照片数据"""
     try:
-        if not hasattr(search_service, 'image_paths') or not search_service.image_paths:
-            return jsonify([])
-        
         location_data = {}
         
-        for image_path in search_service.image_paths:
-            try:
-                if not os.path.exists(image_path):
-                    continue
-                
-                metadata = search_service.image_metadata.get(image_path, {})
-                location = metadata.get("location", "未知位置")
-                
-                if location not in location_data:
-                    location_data[location] = {
-                        "name": location,
-                        "images": [],
-                        "count": 0
-                    }
-                
-                location_data[location]["images"].append({
-                    "path": image_path,
-                    "title": os.path.basename(image_path),
-                    "metadata": metadata
-                })
-                location_data[location]["count"] += 1
-                
-            except Exception as e:
-                print(f"处理图片 {image_path} 时出错: {e}")
-                continue
+        # 元数据库按位置列排序返回，相同位置的照片相邻
+        for row in search_service.metadata_store.by_location():
+            location = row["location"] or "未知位置"
+            
+            if location not in location_data:
+                location_data[location] = {
+                    "name": location,
+                    "images": [],
+                    "count": 0
+                }
+            
+            location_data[location]["images"].append({
+                "path": row["path"],
+                "title": os.path.basename(row["path"]),
+                "metadata": row["metadata"]
+            })
+            location_data[location]["count"] += 1
         
         # 转换为列表格式
         result = list(location_data.values())
@@ -516,9 +908,6 @@ def get_photos_location():
 def get_photos_people():
     """获取按人物组织的照片数据"""
     try:
-        if not hasattr(search_service, 'image_paths') or not search_service.image_paths:
-            return jsonify([])
-        
         # 模拟人物数据，实际应该使用人脸识别
         people_data = [
             {
@@ -529,25 +918,15 @@ def get_photos_people():
             }
         ]
         
-        for image_path in search_service.image_paths:
-            try:
-                if not os.path.exists(image_path):
-                    continue
-                
-                metadata = search_service.image_metadata.get(image_path, {})
-                
-                # 简单检测是否包含人物（基于文件名或路径）
-                if any(keyword in image_path.lower() for keyword in ['person', 'people', 'portrait', '人物', '肖像']):
-                    people_data[0]["images"].append({
-                        "path": image_path,
-                        "title": os.path.basename(image_path),
-                        "metadata": metadata
-                    })
-                    people_data[0]["count"] += 1
-                
-            except Exception as e:
-                print(f"处理图片 {image_path} 时出错: {e}")
-                continue
+        # 简单检测是否包含人物（基于文件名或路径）
+        keywords = ['person', 'people', 'portrait', '人物', '肖像']
+        for row in search_service.metadata_store.path_contains_any(keywords):
+            people_data[0]["images"].append({
+                "path": row["path"],
+                "title": os.path.basename(row["path"]),
+                "metadata": row["metadata"]
+            })
+            people_data[0]["count"] += 1
         
         # 过滤掉没有图片的人物
         result = [person for person in people_data if person["count"] > 0]
@@ -575,15 +954,16 @@ def validate_folder():
         if not os.path.isdir(folder_path):
             return jsonify({"valid": False, "error": "路径不是文件夹"}), 200
         
-        # 支持的图片格式
-        image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp')
-        
-        # 扫描文件夹中的图片文件
+        # 与处理文件夹使用同一个扫描器；文件很多时只数到上限，其余按已扫描目录估算
+        scanner = FolderScanner()
         image_files = []
+        truncated = False
         try:
-            for filename in os.listdir(folder_path):
-                if filename.lower().endswith(image_extensions):
-                    image_files.append(filename)
+            for scanned_file in scanner.scan(folder_path):
+                image_files.append(scanned_file.path)
+                if len(image_files) >= config.VALIDATE_SCAN_LIMIT:
+                    truncated = True
+                    break
         except PermissionError:
             # 权限不足时，仍然允许用户尝试添加文件夹
             # 后端处理时会再次检查权限
@@ -597,6 +977,15 @@ def validate_folder():
         if not image_files:
             return jsonify({"valid": False, "error": "该文件夹中未找到支持的图片文件"}), 200
         
+        if truncated:
+            estimated = max(scanner.estimated_total(), len(image_files))
+            return jsonify({
+                "valid": True,
+                "imageCount": estimated,
+                "estimated": True,
+                "message": f"找到超过 {len(image_files)} 个图片文件（估计约 {estimated} 个）"
+            })
+        
         return jsonify({
             "valid": True,
             "imageCount": len(image_files),
@@ -627,7 +1016,9 @@ def get_current_model():
         return jsonify({
             "model_id": current_model_name,
             "display_name": display_name,
-            "index_count": search_service.index.ntotal if search_service.index else 0
+            "index_count": search_service.image_count() if search_service.index else 0,
+            "index": search_service.index_info() if search_service.index else None,
+            "text_embedding_cache": search_service.text_embedding_cache.stats()
         })
         
     except Exception as e:
@@ -663,7 +1054,7 @@ def set_model():
         search_service.set_model(model_name)
         
         # 检查是否需要重建索引
-        needs_rebuild = search_service.index.ntotal > 0
+        needs_rebuild = search_service.image_count() > 0
         
         if needs_rebuild:
             # 生成重建任务ID
@@ -675,7 +1066,7 @@ def set_model():
                     processing_status[rebuild_task_id] = {
                         "status": "processing",
                         "progress": 0,
-                        "total": search_service.index.ntotal,
+                        "total": search_service.image_count(),
                         "processed": 0,
                         "message": f"正在使用新模型 {model_name} 重建索引..."
                     }
@@ -748,16 +1139,16 @@ def generate_story():
         story_images = []
         for photo_id in photo_ids[:10]:  # 最多处理10张照片
             try:
-                photo_index = int(photo_id)
-                if 0 <= photo_index < len(search_service.image_paths):
-                    image_path = search_service.image_paths[photo_index]
+                # 照片ID即搜索结果中的稳定向量ID
+                image_path = search_service.id_to_path.get(int(photo_id))
+                if image_path:
                     if os.path.exists(image_path):
                         story_images.append({
                             "id": photo_id,
                             "path": image_path,
                             "title": os.path.basename(image_path)
                         })
-            except (ValueError, IndexError):
+            except (ValueError, TypeError):
                 continue
         
         result = {
@@ -777,4 +1168,8 @@ def generate_story():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
+    # debug 模式下重载器会启动两个进程，只在实际提供服务的子进程中恢复任务
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_interrupted_jobs()
+        folder_watcher.restore()
     app.run(debug=True, host='127.0.0.1', port=9527)
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+图像解码性能测试脚本
+对比完整解码与按目标尺寸缩小解码（JPEG draft / reduce）在大尺寸照片上的耗时
+
+用法:
+    python benchmark_decode.py [图片或文件夹 ...] [--size 224] [--repeat 3]
+未指定图片时生成一张 24MP 和一张 48MP 的测试 JPEG
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+sys.path.append('.')
+
+import numpy as np
+from PIL import Image
+
+from services.folder_scanner import FolderScanner
+from services.image_decode import load_reduced
+
+
+def resize_shortest_edge(img: Image.Image, target) -> Image.Image:
+    """与 CLIP 预处理相同：按短边缩放到目标尺寸"""
+    scale = min(target) / min(img.width, img.height)
+    return img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.BICUBIC)
+
+
+def full_decode(image_path: str, target):
+    """原来的做法：完整解码后再缩放"""
+    with Image.open(image_path) as img:
+        return resize_shortest_edge(img.convert('RGB'), target)
+
+
+def reduced_decode(image_path: str, target):
+    return resize_shortest_edge(load_reduced(image_path, target), target)
+
+
+def make_test_images(directory: str):
+    """生成带噪声纹理的大尺寸测试图片（纯色图片解码过快，不具代表性）"""
+    paths = []
+    for width, height in [(6000, 4000), (8000, 6000)]:
+        path = os.path.join(directory, f"test_{width}x{height}.jpg")
+        noise = np.random.randint(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+        Image.fromarray(noise).resize((width, height), Image.Resampling.BILINEAR).save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def time_decode(decode_fn, image_paths, target, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for image_path in image_paths:
+            decode_fn(image_path, target)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图像解码性能测试")
+    parser.add_argument("paths", nargs="*", help="图片文件或文件夹")
+    parser.add_argument("--size", type=int, default=224, help="目标短边长度（CLIP 为 224，缩略图为 300）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快的一次")
+    parser.add_argument("--limit", type=int, default=50, help="最多测试的图片数量")
+    args = parser.parse_args()
+
+    temp_dir = None
+    image_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            image_paths.extend(scanned_file.path for scanned_file in FolderScanner().scan(path))
+        else:
+            image_paths.append(path)
+    if not image_paths:
+        temp_dir = tempfile.mkdtemp()
+        print("生成测试图片...")
+        image_paths = make_test_images(temp_dir)
+    image_paths = image_paths[:args.limit]
+
+    target = (args.size, args.size)
+    print(f"=== 解码性能测试：{len(image_paths)} 张图片，目标尺寸 {args.size}px ===")
+    for image_path in image_paths[:5]:
+        with Image.open(image_path) as img:
+            reduced = load_reduced(image_path, target)
+            print(f"  {os.path.basename(image_path)}: {img.width}x{img.height} -> 解码为 {reduced.width}x{reduced.height}")
+
+    full_time = time_decode(full_decode, image_paths, target, args.repeat)
+    reduced_time = time_decode(reduced_decode, image_paths, target, args.repeat)
+
+    print(f"完整解码: {full_time:.3f}s（{full_time / len(image_paths) * 1000:.1f} ms/张）")
+    print(f"缩小解码: {reduced_time:.3f}s（{reduced_time / len(image_paths) * 1000:.1f} ms/张）")
+    print(f"加速比: {full_time / reduced_time:.1f}x")
+
+    if temp_dir:
+        for image_path in image_paths:
+            os.remove(image_path)
+        os.rmdir(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+后端运行配置
+所有配置项都可以通过带 SEARCHPHOTO_ 前缀的同名环境变量覆盖
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数类型的环境变量"""
+    value = os.environ.get(f"SEARCHPHOTO_{name}")
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"配置项 SEARCHPHOTO_{name} 不是有效的整数: {value}，使用默认值 {default}")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """读取浮点类型的环境变量"""
+    value = os.environ.get(f"SEARCHPHOTO_{name}")
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"配置项 SEARCHPHOTO_{name} 不是有效的数字: {value}，使用默认值 {default}")
+        return default
+
+
+# 图像批量编码时每个批次包含的图片数量
+ENCODE_BATCH_SIZE = _env_int("ENCODE_BATCH_SIZE", 32)
+
+# 入库流水线：解码/预处理线程数及其输出队列深度
+INGEST_DECODE_WORKERS = _env_int("INGEST_DECODE_WORKERS", min(4, os.cpu_count() or 1))
+INGEST_DECODE_QUEUE_SIZE = _env_int("INGEST_DECODE_QUEUE_SIZE", 128)
+
+# 入库流水线：推理线程数、推理结果队列深度，以及凑批的最长等待时间（秒）
+INGEST_INFERENCE_WORKERS = _env_int("INGEST_INFERENCE_WORKERS", 1)
+INGEST_WRITE_QUEUE_SIZE = _env_int("INGEST_WRITE_QUEUE_SIZE", 8)
+INGEST_BATCH_TIMEOUT = _env_float("INGEST_BATCH_TIMEOUT", 0.5)
+
+# 多进程索引：工作进程数（1 表示使用进程内流水线）、每个分片的图片数量、进程启动方式；
+# 默认 spawn，工作进程只导入 services.parallel_indexer 并自行加载模型（不重新执行 app.py）。服务进程是多线程的且已加载 torch / FAISS，fork 可能导致子进程死锁，
+# 只在明确需要时设置为 fork（forkserver 也可用）
+INDEX_WORKERS = _env_int("INDEX_WORKERS", 1)
+INDEX_SHARD_SIZE = _env_int("INDEX_SHARD_SIZE", 256)
+INDEX_PROCESS_START_METHOD = os.environ.get("SEARCHPHOTO_INDEX_PROCESS_START_METHOD", "spawn")
+
+# 文件指纹清单：是否额外记录文件内容哈希（用于更可靠地识别重命名，但需要读取整个文件）
+MANIFEST_CONTENT_HASH = bool(_env_int("MANIFEST_CONTENT_HASH", 0))
+
+# 向量缓存：按 (文件内容哈希, 模型名称) 缓存图像向量，切换模型或重建索引时复用
+EMBEDDING_CACHE_ENABLED = bool(_env_int("EMBEDDING_CACHE_ENABLED", 1))
+EMBEDDING_CACHE_DIR = os.environ.get("SEARCHPHOTO_EMBEDDING_CACHE_DIR", "embedding_cache")
+
+# 索引压缩：删除图像只记录墓碑，墓碑数量达到下限且超过索引总量的该比例时在后台清理
+COMPACT_MIN_TOMBSTONES = _env_int("COMPACT_MIN_TOMBSTONES", 1000)
+COMPACT_TOMBSTONE_RATIO = _env_float("COMPACT_TOMBSTONE_RATIO", 0.1)
+
+# 检查点：长时间的索引任务每处理这么多张图片或经过这么多秒保存一次索引和任务进度，重启后从检查点恢复
+CHECKPOINT_INTERVAL_IMAGES = _env_int("CHECKPOINT_INTERVAL_IMAGES", 2000)
+CHECKPOINT_INTERVAL_SECONDS = _env_float("CHECKPOINT_INTERVAL_SECONDS", 300.0)
+INDEX_JOBS_PATH = os.environ.get("SEARCHPHOTO_INDEX_JOBS_PATH", "index_jobs.json")
+
+# 索引快照：保存目录、保留的历史快照数量、加载时是否校验文件校验和（关闭后只校验文件大小，启动更快）
+INDEX_SNAPSHOT_DIR = os.environ.get("SEARCHPHOTO_INDEX_SNAPSHOT_DIR", "index_snapshots")
+INDEX_SNAPSHOT_KEEP = _env_int("INDEX_SNAPSHOT_KEEP", 2)
+SNAPSHOT_VERIFY_CHECKSUMS = bool(_env_int("SNAPSHOT_VERIFY_CHECKSUMS", 1))
+
+# 以内存映射方式打开FAISS索引：启动时不读入整个索引，多个进程可共享页缓存；首次写入时才复制到内存
+INDEX_MMAP = bool(_env_int("INDEX_MMAP", 0))
+
+# 图像元数据库（SQLite），主键与向量ID一致
+METADATA_DB_PATH = os.environ.get("SEARCHPHOTO_METADATA_DB_PATH", "image_metadata.db")
+
+# 目录扫描：并行遍历子目录的线程数、是否按文件头校验图片格式、验证文件夹时最多计数的图片数量
+SCAN_WORKERS = _env_int("SCAN_WORKERS", 8)
+SCAN_CHECK_MAGIC = bool(_env_int("SCAN_CHECK_MAGIC", 0))
+VALIDATE_SCAN_LIMIT = _env_int("VALIDATE_SCAN_LIMIT", 10000)
+
+# 文件夹监听（仅 Linux inotify）：事件停止到达多少秒后开始处理、最长等待秒数、每批处理的图片数、
+# 每秒最多入库的图片数（0 表示不限速）、已登记监听文件夹的保存路径
+WATCH_DEBOUNCE_SECONDS = _env_float("WATCH_DEBOUNCE_SECONDS", 2.0)
+WATCH_MAX_DELAY_SECONDS = _env_float("WATCH_MAX_DELAY_SECONDS", 30.0)
+WATCH_BATCH_SIZE = _env_int("WATCH_BATCH_SIZE", 16)
+WATCH_MAX_IMAGES_PER_SECOND = _env_float("WATCH_MAX_IMAGES_PER_SECOND", 10.0)
+WATCH_FOLDERS_PATH = os.environ.get("SEARCHPHOTO_WATCH_FOLDERS_PATH", "watched_folders.json")
+
+# 图像解码：是否按目标尺寸缩小解码（JPEG 使用 draft，其他格式使用 reduce）、
+# 允许解码的最大像素数（超过视为解压炸弹直接拒绝，0 表示不额外限制）；
+# 该上限只在缩小解码时检查，不修改 Pillow 全局的 Image.MAX_IMAGE_PIXELS
+DECODE_DRAFT = bool(_env_int("DECODE_DRAFT", 1))
+MAX_IMAGE_PIXELS = _env_int("MAX_IMAGE_PIXELS", 250_000_000)
+
+# 缩略图缓存目录、缓存总大小上限（MB，超过后按LRU淘汰，0 表示不限制）、
+# 浏览器缓存缩略图的秒数（过期后用 If-None-Match 重新验证）；
+# 入库时是否顺便生成缩略图（与模型输入共用同一次解码）及其尺寸
+THUMBNAIL_CACHE_DIR = os.environ.get("SEARCHPHOTO_THUMBNAIL_CACHE_DIR", "thumbnail_cache")
+THUMBNAIL_CACHE_MAX_MB = _env_int("THUMBNAIL_CACHE_MAX_MB", 1024)
+THUMBNAIL_MAX_AGE = _env_int("THUMBNAIL_MAX_AGE", 300)
+INGEST_THUMBNAILS = bool(_env_int("INGEST_THUMBNAILS", 0))
+THUMBNAIL_SIZE = _env_int("THUMBNAIL_SIZE", 256)
+
+# 缩略图尺寸档位（像素）：请求的尺寸向上取整到档位，较小的档位优先从已缓存的较大档位缩放得到；
+# 缩略图格式的优先顺序（客户端 Accept 中列出时才使用，否则退回 JPEG），可加入 avif
+THUMBNAIL_TIERS = tuple(int(tier) for tier in os.environ.get("SEARCHPHOTO_THUMBNAIL_TIERS", "64,256,512,1024").split(","))
+THUMBNAIL_FORMATS = tuple(os.environ.get("SEARCHPHOTO_THUMBNAIL_FORMATS", "webp,jpeg").split(","))
+
+# 批量缩略图接口：生成缩略图的线程数、单次请求最多的图片数量
+THUMBNAIL_WORKERS = _env_int("THUMBNAIL_WORKERS", 4)
+THUMBNAIL_BATCH_MAX = _env_int("THUMBNAIL_BATCH_MAX", 500)
+
+# 原图传输：是否使用 X-Sendfile 交给前端服务器（nginx 需配合 X-Accel-Redirect 等配置）发送、浏览器缓存原图的秒数
+USE_X_SENDFILE = bool(_env_int("USE_X_SENDFILE", 0))
+ORIGINAL_MAX_AGE = _env_int("ORIGINAL_MAX_AGE", 3600)
+
+# 文本查询向量缓存的最大条目数（0 表示关闭）
+TEXT_EMBEDDING_CACHE_SIZE = _env_int("TEXT_EMBEDDING_CACHE_SIZE", 1024)
+
+# 向量索引类型（FAISS index_factory 字符串，内积度量）：Flat（精确搜索）、HNSW32、IVFauto,Flat、IVFauto,PQ64 等，
+# IVFauto 按向量数量自动选择聚类中心数（约 4√n）；向量数量达到阈值前始终使用 Flat，超过后在后台训练新索引并迁移；
+# 训练时最多抽样的向量数；搜索时 IVF 探测的聚类数（nprobe）和 HNSW 的候选队列长度（efSearch），可按查询覆盖
+INDEX_FACTORY = os.environ.get("SEARCHPHOTO_INDEX_FACTORY", "Flat")
+INDEX_TRAIN_THRESHOLD = _env_int("INDEX_TRAIN_THRESHOLD", 50000)
+INDEX_TRAIN_SAMPLE_SIZE = _env_int("INDEX_TRAIN_SAMPLE_SIZE", 200000)
+SEARCH_NPROBE = _env_int("SEARCH_NPROBE", 16)
+SEARCH_EF_SEARCH = _env_int("SEARCH_EF_SEARCH", 64)
+
+# 批量搜索接口单次请求最多的查询数量；单个查询最多返回的结果数（topK 超过时取该值）
+SEARCH_BATCH_MAX = _env_int("SEARCH_BATCH_MAX", 64)
+SEARCH_TOP_K_MAX = _env_int("SEARCH_TOP_K_MAX", 1000)
+
+# 带过滤条件的搜索：满足条件的图像不超过该数量时（且索引不是 Flat）直接对候选向量精确计算，保证返回完整的 top_k
+FILTER_EXACT_SEARCH_MAX = _env_int("FILTER_EXACT_SEARCH_MAX", 20000)
+
+# 分页搜索的结果集缓存：第一页时一次取出的结果数、缓存总大小上限（MB）、结果集未被访问多少秒后失效
+RESULT_CACHE_DEPTH = _env_int("RESULT_CACHE_DEPTH", 500)
+RESULT_CACHE_MAX_MB = _env_int("RESULT_CACHE_MAX_MB", 64)
+RESULT_CACHE_TTL = _env_float("RESULT_CACHE_TTL", 300.0)
+
+# 以图搜图上传图片的大小上限（MB），上传的图片在内存中解码，超过上限的请求返回 413
+UPLOAD_MAX_MB = _env_int("UPLOAD_MAX_MB", 20)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+测试共用的替身模型
+StubClipProcessor / StubClipModel 代替 CLIP 模型和处理器，不需要安装 torch / transformers：
+图像按像素确定性地映射为向量（内容相同的图片向量相同），用于测试索引、同步、缓存等与模型效果无关的行为
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from services import model_loader
+
+STUB_INPUT_SIZE = 16
+STUB_DIMENSION = 512
+
+
+class StubClipProcessor:
+    """把图像缩放为 (3, 16, 16) 的像素数组，接口与 CLIPProcessor 的图像部分一致"""
+
+    def __call__(self, images=None, return_tensors="np", **kwargs):
+        images = images if isinstance(images, list) else [images]
+        pixel_values = [
+            np.asarray(image.convert('RGB').resize((STUB_INPUT_SIZE, STUB_INPUT_SIZE)), dtype='float32')
+            .transpose(2, 0, 1) / 255.0
+            for image in images
+        ]
+        return {"pixel_values": np.stack(pixel_values)}
+
+
+class StubClipModel:
+    """用固定的随机投影代替图像编码器，记录每次前向推理的批次大小"""
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.projection = rng.standard_normal((3 * STUB_INPUT_SIZE * STUB_INPUT_SIZE, STUB_DIMENSION)).astype('float32')
+        self.forward_batches = []
+
+    def encode(self, pixel_values: np.ndarray) -> np.ndarray:
+        self.forward_batches.append(len(pixel_values))
+        features = pixel_values.reshape(len(pixel_values), -1) @ self.projection
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (features / norms).astype('float32')
+
+
+def stub_encode_pixel_values(model, pixel_values: np.ndarray) -> np.ndarray:
+    return model.encode(pixel_values)
+
+
+def write_image(path, seed: int, size=(64, 48), fmt: str = None):
+    """写入一张随机像素的图片，seed 相同时内容相同"""
+    pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    Image.fromarray(pixels).save(str(path), format=fmt)
+    return str(path)
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    """让模型加载返回替身模型，返回该模型以便检查前向推理次数"""
+    from services import search_service as search_service_module
+
+    model = StubClipModel()
+    monkeypatch.setattr(model_loader, "_shared_models", {})
+    monkeypatch.setattr(model_loader, "load_clip_model", lambda model_path: (model, StubClipProcessor()))
+    monkeypatch.setattr(search_service_module, "encode_pixel_values", stub_encode_pixel_values)
+    return model
+
+
+@pytest.fixture
+def search_service(tmp_path, monkeypatch, stub_model):
+    """使用替身模型、状态文件写在临时目录中的 SemanticSearchService"""
+    from services.search_service import SemanticSearchService
+
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    monkeypatch.chdir(state_dir)
+    return SemanticSearchService()
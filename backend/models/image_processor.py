@@ -11,8 +11,8 @@ class ImageProcessorInterface(ABC):
         pass
     
     @abstractmethod
-    def generate_thumbnail(self, image_path: str, size: Tuple[int, int] = (128, 128)) -> bytes:
-        """生成缩略图"""
+    def generate_thumbnail(self, image_path: str, size: Tuple[int, int] = (128, 128), fmt: str = "jpeg") -> bytes:
+        """生成缩略图，fmt 为输出格式（jpeg / webp / avif）"""
         pass
     
     @abstractmethod
@@ -0,0 +1,124 @@
+import math
+from typing import Iterable, Optional
+
+import faiss
+import numpy as np
+
+
+def resolve_factory(factory: str, ntotal: int) -> str:
+    """把 factory 字符串中的 IVFauto 换成按向量数量选择的聚类中心数（约 4√n）"""
+    if "IVFauto" not in factory:
+        return factory
+    nlist = max(1, min(65536, int(4 * math.sqrt(max(ntotal, 1)))))
+    return factory.replace("IVFauto", f"IVF{nlist}")
+
+
+def is_flat(factory: str) -> bool:
+    return factory.strip().lower() == "flat"
+
+
+def create_index(dimension: int, factory: str = "Flat", ntotal: int = 0):
+    """
+    按 FAISS factory 字符串创建按向量ID寻址的空索引（内积度量）
+    IVF 系列索引本身支持任意ID和按ID删除，直接使用并开启哈希表形式的直接映射以便按ID取回向量；
+    Flat、HNSW 等外面包一层 IndexIDMap2
+    """
+    index = faiss.index_factory(dimension, resolve_factory(factory, ntotal), faiss.METRIC_INNER_PRODUCT)
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def _extract_ivf(index) -> Optional[faiss.IndexIVF]:
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def _inner_index(index):
+    """IndexIDMap 包装下的实际索引"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_ids(index) -> np.ndarray:
+    """返回索引中实际存在的全部向量ID"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    ivf = _extract_ivf(index)
+    if ivf is None:
+        return np.arange(index.ntotal, dtype='int64')
+    invlists = ivf.invlists
+    parts = []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ids = invlists.get_ids(list_no)
+            parts.append(faiss.rev_swig_ptr(ids, size).copy())
+            invlists.release_ids(list_no, ids)
+    return np.concatenate(parts) if parts else np.zeros(0, dtype='int64')
+
+
+def reconstruct(index, ids: np.ndarray) -> np.ndarray:
+    """按向量ID取回向量（PQ 等有损编码的索引取回的是近似值）"""
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype='float32')
+    return index.reconstruct_batch(np.ascontiguousarray(ids, dtype='int64'))
+
+
+def supports_remove(index) -> bool:
+    """HNSW 不支持删除向量，清理墓碑只能重建索引"""
+    return not isinstance(_inner_index(index), faiss.IndexHNSW)
+
+
+def search_parameters(index, top_k: int, nprobe: int = None, ef_search: int = None, selector=None):
+    """
+    按索引类型生成单次查询的搜索参数（IVF 的 nprobe、HNSW 的 efSearch）；
+    selector 为 IDSelector 时只搜索其中的向量。没有需要设置的参数时返回 None
+    top_k 为调用方请求的结果数，HNSW 的候选队列至少为 top_k；不要传入为后过滤多取的数量，否则队列随之变长
+    """
+    inner = _inner_index(index)
+    options = {"sel": selector} if selector is not None else {}
+    if isinstance(inner, faiss.IndexHNSW) and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=max(int(ef_search), top_k), **options)
+    ivf = _extract_ivf(inner)
+    if ivf is not None and nprobe:
+        return faiss.SearchParametersIVF(nprobe=min(int(nprobe), ivf.nlist), **options)
+    return faiss.SearchParameters(**options) if options else None
+
+
+class ExcludeSelector:
+    """
+    排除一组向量ID（例如墓碑）的 IDSelector，在索引内部跳过这些向量，不必多取候选再过滤
+    FAISS 只保存指向内部选择器的指针，本对象需要在搜索期间保持存活
+    """
+
+    def __init__(self, ids: Iterable[int]):
+        ids = np.fromiter(ids, dtype='int64')
+        self.excluded = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+        self.selector = faiss.IDSelectorNot(self.excluded)
+
+
+def is_exact(index) -> bool:
+    """是否为精确搜索的 Flat 索引"""
+    return isinstance(_inner_index(index), faiss.IndexFlat)
+
+
+def describe(index) -> str:
+    """索引类型的简短描述，用于状态接口"""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return f"HNSW{inner.hnsw.nb_neighbors(1)}"
+    ivf = _extract_ivf(inner)
+    if ivf is not None:
+        ivf = faiss.downcast_index(ivf)
+        if isinstance(ivf, faiss.IndexIVFPQ):
+            return f"IVF{ivf.nlist},PQ{ivf.pq.M}"
+        if isinstance(ivf, faiss.IndexIVFFlat):
+            return f"IVF{ivf.nlist},Flat"
+        return f"IVF{ivf.nlist},{type(ivf).__name__}"
+    return "Flat"
@@ -0,0 +1,168 @@
+import os
+import struct
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+# 缓存文件格式：16字节文件头（magic、版本、向量维度、保留字段）+ 定长记录
+# 每条记录为 16 字节内容哈希 + dimension 个 float32
+_MAGIC = b'SPEC'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIII')
+_KEY_SIZE = 16
+
+
+def _record_dtype(dimension: int) -> np.dtype:
+    return np.dtype([('key', 'u1', (_KEY_SIZE,)), ('vec', '<f4', (dimension,))])
+
+
+class _ModelCacheFile:
+    """单个模型的缓存文件：已落盘的记录通过内存映射读取，新记录先暂存在内存中"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dimension = None
+        self.rows: Dict[bytes, int] = {}
+        self.records = None
+        self.pending: Dict[bytes, np.ndarray] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                magic, version, dimension, _ = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                print(f"向量缓存文件格式不兼容，忽略: {self.path}")
+                return
+            self.dimension = dimension
+            self._map()
+        except Exception as e:
+            print(f"加载向量缓存失败 {self.path}: {e}")
+            self.dimension = None
+            self.rows = {}
+            self.records = None
+
+    def _map(self):
+        """映射已落盘的完整记录（进程中断时可能残留的半条记录会被忽略并在下次写入时覆盖）"""
+        dtype = _record_dtype(self.dimension)
+        count = (os.path.getsize(self.path) - _HEADER.size) // dtype.itemsize
+        if count <= 0:
+            self.records = None
+            self.rows = {}
+            return
+        self.records = np.memmap(self.path, dtype=dtype, mode='r', offset=_HEADER.size, shape=(count,))
+        keys = np.ascontiguousarray(self.records['key'])
+        self.rows = {keys[i].tobytes(): i for i in range(count)}
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self.pending.get(key)
+        if vector is not None:
+            return vector.copy()
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return np.array(self.records[row]['vec'], dtype='float32')
+
+    def put(self, key: bytes, vector: np.ndarray):
+        if self.dimension is None:
+            self.dimension = int(vector.shape[0])
+        if vector.shape[0] != self.dimension or key in self.rows:
+            return
+        self.pending[key] = np.asarray(vector, dtype='float32')
+
+    def flush(self):
+        if not self.pending:
+            return
+        dtype = _record_dtype(self.dimension)
+        block = np.zeros(len(self.pending), dtype=dtype)
+        for i, (key, vector) in enumerate(self.pending.items()):
+            block[i]['key'] = np.frombuffer(key, dtype='u1')
+            block[i]['vec'] = vector
+
+        count = len(self.records) if self.records is not None else 0
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        with open(self.path, mode) as f:
+            if count == 0:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, self.dimension, 0))
+            f.seek(_HEADER.size + count * dtype.itemsize)
+            f.write(block.tobytes())
+            f.truncate()
+
+        self.pending = {}
+        self.records = None
+        self._map()
+
+
+class EmbeddingCache:
+    """
+    内容寻址的图像向量缓存
+    以 (文件内容哈希, 模型名称) 为键，每个模型一个紧凑的二进制文件；
+    切换回用过的模型或索引内容相同的照片时直接复用向量，无需再次推理
+    """
+
+    def __init__(self, cache_dir: str = "embedding_cache", enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._files: Dict[str, _ModelCacheFile] = {}
+        self._lock = threading.Lock()
+
+    def _file_for(self, model_name: str) -> _ModelCacheFile:
+        cache_file = self._files.get(model_name)
+        if cache_file is None:
+            safe_name = model_name.replace('/', '__').replace('\\', '__')
+            cache_file = _ModelCacheFile(os.path.join(self.cache_dir, f"{safe_name}.bin"))
+            self._files[model_name] = cache_file
+        return cache_file
+
+    def get(self, model_name: str, content_hash: Optional[str]) -> Optional[np.ndarray]:
+        """查询缓存的向量，未命中返回 None"""
+        if not self.enabled or not content_hash:
+            return None
+        try:
+            key = bytes.fromhex(content_hash)[:_KEY_SIZE]
+            with self._lock:
+                vector = self._file_for(model_name).get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                return vector
+        except Exception as e:
+            print(f"读取向量缓存失败: {e}")
+            return None
+
+    def put(self, model_name: str, content_hash: Optional[str], vector: np.ndarray):
+        """写入向量（暂存在内存中，调用 flush 后落盘）"""
+        if not self.enabled or not content_hash:
+            return
+        try:
+            key = bytes.fromhex(content_hash)[:_KEY_SIZE]
+            with self._lock:
+                self._file_for(model_name).put(key, vector)
+        except Exception as e:
+            print(f"写入向量缓存失败: {e}")
+
+    def flush(self):
+        """把暂存的向量追加写入缓存文件"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                for cache_file in self._files.values():
+                    cache_file.flush()
+        except Exception as e:
+            print(f"保存向量缓存失败: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": sum(len(f.rows) + len(f.pending) for f in self._files.values())
+            }
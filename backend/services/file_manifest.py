@@ -0,0 +1,160 @@
+import os
+import pickle
+import hashlib
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class FileFingerprint(NamedTuple):
+    """已索引文件的指纹"""
+    size: int
+    mtime_ns: int
+    content_hash: Optional[str] = None
+
+
+def compute_file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """计算文件内容哈希（blake2b，128位）"""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def folder_prefix(folder_path: str) -> str:
+    """返回用于前缀匹配的文件夹路径（以路径分隔符结尾）"""
+    return folder_path.rstrip(os.sep) + os.sep
+
+
+class FileManifest:
+    """
+    已索引文件的指纹清单
+    记录每个文件的 (size, mtime_ns, 可选内容哈希)，重新索引时据此找出新增、修改、删除和重命名的文件
+    """
+
+    def __init__(self, manifest_path: str = "file_manifest.pkl", use_content_hash: bool = False):
+        self.manifest_path = manifest_path
+        self.use_content_hash = use_content_hash
+        self.entries: Dict[str, FileFingerprint] = {}
+        self._lock = threading.RLock()
+
+    def load(self):
+        """加载已保存的清单"""
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, 'rb') as f:
+                    self.entries = pickle.load(f)
+                print(f"文件清单加载成功，包含 {len(self.entries)} 个文件")
+        except Exception as e:
+            print(f"加载文件清单失败: {e}")
+            self.entries = {}
+
+    def save(self):
+        """保存清单（先写临时文件再替换，避免写入一半的文件被加载）"""
+        try:
+            with self._lock:
+                entries = dict(self.entries)
+            temp_path = f"{self.manifest_path}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.manifest_path)
+        except Exception as e:
+            print(f"保存文件清单失败: {e}")
+
+    def fingerprint(self, path: str, size: int = None, mtime_ns: int = None,
+                    content_hash: str = None) -> FileFingerprint:
+        """生成文件指纹，未提供的 stat 信息会重新读取"""
+        if size is None or mtime_ns is None:
+            stat = os.stat(path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        if content_hash is None and self.use_content_hash:
+            content_hash = compute_file_hash(path)
+        return FileFingerprint(size, mtime_ns, content_hash)
+
+    def record(self, path: str, size: int = None, mtime_ns: int = None, content_hash: str = None):
+        """记录（或更新）文件指纹"""
+        try:
+            fingerprint = self.fingerprint(path, size, mtime_ns, content_hash)
+        except OSError as e:
+            print(f"读取文件信息失败 {path}: {e}")
+            return
+        with self._lock:
+            self.entries[path] = fingerprint
+
+    def remove(self, path: str):
+        with self._lock:
+            self.entries.pop(path, None)
+
+    def rename(self, old_path: str, new_path: str, size: int = None, mtime_ns: int = None):
+        with self._lock:
+            fingerprint = self.entries.pop(old_path, None)
+            if fingerprint is None:
+                return
+            if size is not None and mtime_ns is not None:
+                fingerprint = FileFingerprint(size, mtime_ns, fingerprint.content_hash)
+            self.entries[new_path] = fingerprint
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def paths_under(self, folder_path: str) -> List[str]:
+        """返回清单中位于指定文件夹下的所有路径"""
+        prefix = folder_prefix(folder_path)
+        with self._lock:
+            return [path for path in self.entries if path.startswith(prefix)]
+
+    def sizes_under(self, folder_path: str) -> set:
+        """返回清单中位于指定文件夹下的文件大小集合，用于在扫描过程中识别可能的重命名"""
+        prefix = folder_prefix(folder_path)
+        with self._lock:
+            return {fingerprint.size for path, fingerprint in self.entries.items() if path.startswith(prefix)}
+
+    def match_renames(self, missing_paths: List[str], new_paths: List[str],
+                      scanned: Dict[str, Tuple[int, int]]) -> List[Tuple[str, str]]:
+        """在消失的文件和新增文件之间匹配重命名，返回 (旧路径, 新路径) 列表"""
+        if not missing_paths or not new_paths:
+            return []
+        with self._lock:
+            missing = {path: self.entries[path] for path in missing_paths if path in self.entries}
+        return self._match_renames(missing, new_paths, scanned)
+
+    def _match_renames(self, missing: Dict[str, FileFingerprint], new_paths: Iterable[str],
+                       scanned: Dict[str, Tuple[int, int]]) -> List[Tuple[str, str]]:
+        """在消失的文件和新增文件之间匹配重命名，只对大小相同的候选文件计算哈希"""
+        by_size: Dict[int, List[str]] = {}
+        for path, fingerprint in missing.items():
+            by_size.setdefault(fingerprint.size, []).append(path)
+
+        renamed = []
+        for new_path in new_paths:
+            size, mtime_ns = scanned[new_path]
+            candidates = by_size.get(size)
+            if not candidates:
+                continue
+
+            new_hash = None
+            for old_path in candidates:
+                old = missing[old_path]
+                if old.content_hash is not None:
+                    if new_hash is None:
+                        try:
+                            new_hash = compute_file_hash(new_path)
+                        except OSError:
+                            break
+                    matched = new_hash == old.content_hash
+                else:
+                    # 未记录内容哈希时，移动/重命名会保留修改时间
+                    matched = old.mtime_ns == mtime_ns
+
+                if matched:
+                    renamed.append((old_path, new_path))
+                    candidates.remove(old_path)
+                    break
+
+        return renamed
@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+from typing import Iterator, List, NamedTuple, Tuple
+
+import config
+from services.file_manifest import folder_prefix
+
+# 支持的图片格式（app.py 的接口和文件夹监听共用这一份）
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp')
+
+# 常见图片格式的文件头
+_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',
+    b'\xff\xd8\xff',
+    b'GIF87a',
+    b'GIF89a',
+    b'BM',
+    b'II*\x00',
+    b'MM\x00*',
+)
+
+# 队列结束/停止标记
+_DONE = object()
+_STOP = object()
+
+
+class ScannedFile(NamedTuple):
+    """扫描到的图片文件及其 stat 信息"""
+    path: str
+    size: int
+    mtime_ns: int
+
+
+def has_image_magic(path: str) -> bool:
+    """根据文件头判断是否为支持的图片格式"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+    except OSError:
+        return False
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    return any(head.startswith(signature) for signature in _SIGNATURES)
+
+
+class FolderScanner:
+    """
+    基于 os.scandir 的并行目录扫描器
+    多个线程同时遍历不同的子目录，直接使用 DirEntry 的 stat 结果，按扩展名（可选再按文件头）过滤；
+    scan() 是生成器，扫描过程中逐个产出文件，调用方可以边扫描边处理，
+    estimated_total() 根据已扫描目录的平均文件数估算总数
+    """
+
+    def __init__(self, workers: int = None, extensions: Tuple[str, ...] = IMAGE_EXTENSIONS,
+                 check_magic: bool = None, queue_size: int = 256):
+        self.workers = max(1, workers or config.SCAN_WORKERS)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.check_magic = config.SCAN_CHECK_MAGIC if check_magic is None else check_magic
+        self.queue_size = queue_size
+        self.dirs_total = 0
+        self.dirs_done = 0
+        self.files_found = 0
+        self.errors = 0
+        self.failed_paths: List[str] = []  # 无法读取的目录和文件
+        self._lock = threading.Lock()
+
+    def estimated_total(self) -> int:
+        """估算的文件总数：已找到的文件数 + 尚未扫描的目录数 × 已扫描目录的平均文件数"""
+        with self._lock:
+            if self.dirs_done == 0:
+                return self.files_found
+            remaining_dirs = self.dirs_total - self.dirs_done
+            return self.files_found + int(remaining_dirs * self.files_found / self.dirs_done)
+
+    def was_listed(self, path: str) -> bool:
+        """
+        path 是否在本次扫描实际读取到的范围内
+        位于无法读取的目录下（或本身 stat 失败）的文件没有出现在扫描结果中，不代表已被删除
+        """
+        with self._lock:
+            failed = list(self.failed_paths)
+        return not any(path == failed_path or path.startswith(folder_prefix(failed_path))
+                       for failed_path in failed)
+
+    def _scan_dir(self, directory: str, raise_errors: bool = False) -> Tuple[List[ScannedFile], List[str]]:
+        """扫描单个目录，返回 (图片文件, 子目录)"""
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                            stat = entry.stat()
+                            if self.check_magic and not has_image_magic(entry.path):
+                                continue
+                            files.append(ScannedFile(entry.path, stat.st_size, stat.st_mtime_ns))
+                    except OSError as e:
+                        print(f"读取文件信息失败 {entry.path}: {e}")
+                        with self._lock:
+                            self.errors += 1
+                            self.failed_paths.append(entry.path)
+        except OSError as e:
+            if raise_errors:
+                raise
+            print(f"扫描目录失败 {directory}: {e}")
+            with self._lock:
+                self.errors += 1
+                self.failed_paths.append(directory)
+
+        with self._lock:
+            self.dirs_total += len(subdirs)
+            self.dirs_done += 1
+            self.files_found += len(files)
+        return files, subdirs
+
+    def scan(self, root: str) -> Iterator[ScannedFile]:
+        """
+        递归扫描 root 下的所有图片文件
+        根目录本身无法访问时直接抛出异常（例如 PermissionError），子目录的错误记录在 errors / failed_paths 中
+        """
+        self.dirs_total, self.dirs_done, self.files_found, self.errors = 1, 0, 0, 0
+        self.failed_paths = []
+        root_files, root_dirs = self._scan_dir(root, raise_errors=True)
+        yield from root_files
+        if not root_dirs:
+            return
+
+        dir_queue = queue.Queue()
+        results = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        state = {"pending": len(root_dirs)}
+
+        def put_result(item) -> bool:
+            # 调用方提前停止迭代时不再阻塞在已满的结果队列上
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            while True:
+                directory = dir_queue.get()
+                if directory is _STOP:
+                    return
+                files, subdirs = ([], []) if stop.is_set() else self._scan_dir(directory)
+                with self._lock:
+                    state["pending"] += len(subdirs)
+                for subdir in subdirs:
+                    dir_queue.put(subdir)
+                if files:
+                    put_result(files)
+                with self._lock:
+                    state["pending"] -= 1
+                    finished = state["pending"] == 0
+                if finished:
+                    for _ in range(self.workers):
+                        dir_queue.put(_STOP)
+                    put_result(_DONE)
+
+        threads = [
+            threading.Thread(target=worker, name=f"folder-scan-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for directory in root_dirs:
+            dir_queue.put(directory)
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                yield from item
+        finally:
+            stop.set()
+            for _ in range(self.workers):
+                dir_queue.put(_STOP)
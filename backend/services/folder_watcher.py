@@ -0,0 +1,429 @@
+import os
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import threading
+from typing import Any, Dict, List, Optional
+
+import config
+from services.folder_scanner import FolderScanner, IMAGE_EXTENSIONS
+
+# inotify 事件常量（见 inotify(7)）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+
+# 待处理变更的类型
+_UPSERT = "upsert"
+_DELETE = "delete"
+_DELETE_FOLDER = "delete_folder"
+
+
+class _Inotify:
+    """通过 ctypes 调用 libc 的 inotify 接口，不依赖第三方库（仅 Linux）"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._ctypes = ctypes
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = self._ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> List[tuple]:
+        """等待并读取事件，返回 (wd, mask, cookie, name) 列表"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_supported() -> bool:
+    """当前平台是否支持文件夹监听"""
+    return sys.platform.startswith('linux')
+
+
+class FolderWatcher:
+    """
+    已登记文件夹的实时监听
+    读取线程把 inotify 事件合并到待处理表（同一路径只保留最后一次变更），
+    处理线程在事件停止到达 WATCH_DEBOUNCE_SECONDS 秒后（最多等待 WATCH_MAX_DELAY_SECONDS 秒）
+    按小批次调用 add_images / remove_images，并按 WATCH_MAX_IMAGES_PER_SECOND 限速，
+    批量导入照片时不会占满CPU而拖慢搜索
+    """
+
+    def __init__(self, search_service, state_path: str = None):
+        self.search_service = search_service
+        self.state_path = state_path or config.WATCH_FOLDERS_PATH
+        self.folders: List[str] = []
+        self.stats = {"added": 0, "removed": 0, "rescans": 0, "lastFlush": None}
+
+        self._inotify: Optional[_Inotify] = None
+        self._wd_to_dir: Dict[int, str] = {}
+        self._dir_to_wd: Dict[str, int] = {}
+        self._pending: Dict[str, str] = {}
+        self._new_dirs: Dict[str, None] = {}  # 新建或移入、尚未扫描的目录（保持事件顺序）
+        self._rescan_needed = False
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._reader_thread = None
+        self._worker_thread = None
+
+    # ---- 登记与持久化 ----
+
+    def restore(self):
+        """服务启动时恢复之前登记的监听文件夹"""
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    folders = json.load(f)
+                for folder_path in folders:
+                    if os.path.isdir(folder_path):
+                        self.watch(folder_path)
+                    else:
+                        print(f"监听的文件夹已不存在，跳过: {folder_path}")
+        except Exception as e:
+            print(f"恢复文件夹监听失败: {e}")
+
+    def _save(self):
+        try:
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.folders, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            print(f"保存监听文件夹列表失败: {e}")
+
+    def watch(self, folder_path: str) -> int:
+        """开始监听文件夹（含所有子文件夹），返回添加的目录监听数量"""
+        if not watch_supported():
+            raise OSError(errno.ENOSYS, "当前平台不支持文件夹监听")
+        folder_path = os.path.abspath(folder_path)
+        with self._lock:
+            self._start()
+            if folder_path in self.folders:
+                return 0
+            count = self._add_tree(folder_path)
+            self.folders.append(folder_path)
+            self._save()
+        print(f"开始监听文件夹 {folder_path}，共 {count} 个目录")
+        return count
+
+    def unwatch(self, folder_path: str) -> bool:
+        folder_path = os.path.abspath(folder_path)
+        with self._lock:
+            if folder_path not in self.folders:
+                return False
+            self.folders.remove(folder_path)
+            # 仍被其他已登记文件夹包含的目录继续监听
+            for directory, wd in list(self._dir_to_wd.items()):
+                if self._is_under(directory, folder_path) and not self._owner(directory):
+                    self._inotify.rm_watch(wd)
+                    self._forget_dir(directory)
+            self._save()
+        print(f"停止监听文件夹 {folder_path}")
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "supported": watch_supported(),
+                "folders": list(self.folders),
+                "watchedDirectories": len(self._dir_to_wd),
+                "pending": len(self._pending),
+                "pendingDirectories": len(self._new_dirs),
+                **self.stats
+            }
+
+    @staticmethod
+    def _is_under(path: str, folder_path: str) -> bool:
+        return path == folder_path or path.startswith(folder_path.rstrip(os.sep) + os.sep)
+
+    def _owner(self, path: str) -> Optional[str]:
+        for folder_path in self.folders:
+            if self._is_under(path, folder_path):
+                return folder_path
+        return None
+
+    # ---- inotify 监听 ----
+
+    def _start(self):
+        if self._inotify is not None:
+            return
+        self._inotify = _Inotify()
+        self._reader_thread = threading.Thread(target=self._read_loop, name="folder-watch-reader", daemon=True)
+        self._worker_thread = threading.Thread(target=self._work_loop, name="folder-watch-worker", daemon=True)
+        self._reader_thread.start()
+        self._worker_thread.start()
+
+    def _add_tree(self, root: str) -> int:
+        """为 root 及其所有子目录添加监听；只在登记每个目录时持有锁，遍历目录树时不阻塞读取线程"""
+        count = 0
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            with self._lock:
+                if directory in self._dir_to_wd:
+                    continue
+                try:
+                    wd = self._inotify.add_watch(directory, _WATCH_MASK)
+                except OSError as e:
+                    if e.errno == errno.ENOSPC:
+                        print(f"inotify 监听数量已达上限（fs.inotify.max_user_watches），无法监听: {directory}")
+                    else:
+                        print(f"添加目录监听失败 {directory}: {e}")
+                    continue
+                self._wd_to_dir[wd] = directory
+                self._dir_to_wd[directory] = wd
+            count += 1
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                print(f"扫描目录失败 {directory}: {e}")
+        return count
+
+    def _forget_dir(self, directory: str):
+        wd = self._dir_to_wd.pop(directory, None)
+        if wd is not None:
+            self._wd_to_dir.pop(wd, None)
+
+    def _forget_tree(self, directory: str):
+        """
+        目录被删除或移走：移除它及所有子目录的监听
+        移走的目录的监听仍跟随原目录，不移除的话之后在原路径新建的同名目录不会被监听
+        """
+        for path, wd in list(self._dir_to_wd.items()):
+            if self._is_under(path, directory):
+                self._inotify.rm_watch(wd)
+                self._forget_dir(path)
+        for path in list(self._new_dirs):
+            if self._is_under(path, directory):
+                del self._new_dirs[path]
+
+    def _read_loop(self):
+        while True:
+            try:
+                events = self._inotify.read_events(timeout=1.0)
+            except Exception as e:
+                print(f"读取文件夹变更事件失败: {e}")
+                time.sleep(1.0)
+                continue
+            if events:
+                with self._lock:
+                    for event in events:
+                        self._handle_event(*event)
+                self._wakeup.set()
+
+    def _handle_event(self, wd: int, mask: int, cookie: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            # 事件队列溢出，丢失的变更只能通过重新扫描找回
+            print("文件夹变更事件过多导致队列溢出，将重新扫描所有监听的文件夹")
+            self._rescan_needed = True
+            self._touch()
+            return
+
+        directory = self._wd_to_dir.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            self._forget_dir(directory)
+            return
+        if mask & IN_MOVE_SELF and not name:
+            # 子目录的移动已在父目录的 IN_MOVED_FROM 中处理，这里只会是登记的文件夹本身被移走
+            self._forget_tree(directory)
+            if directory in self.folders:
+                print(f"监听的文件夹已被移走，停止监听: {directory}")
+                self.folders.remove(directory)
+                self._save()
+                self._pending[directory] = _DELETE_FOLDER
+                self._touch()
+            return
+        if mask & IN_DELETE_SELF and not name:
+            return
+
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # 新建或移入的目录交给处理线程添加监听并扫描，读取线程不能被大目录阻塞（否则事件队列会溢出）
+                self._new_dirs[path] = None
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._forget_tree(path)
+                self._pending[path] = _DELETE_FOLDER
+            self._touch()
+            return
+
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            return
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._pending[path] = _UPSERT
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self._pending[path] = _DELETE
+        else:
+            return
+        self._touch()
+
+    def _touch(self):
+        now = time.monotonic()
+        if self._first_event == 0.0:
+            self._first_event = now
+        self._last_event = now
+
+    # ---- 去抖与限速处理 ----
+
+    def _scan_new_dirs(self):
+        """
+        为新建或移入的目录（含子目录）添加监听，并把监听建立前已写入的图片加入待处理
+        在处理线程中不持有锁进行，扫描期间读取线程照常接收事件；
+        监听建立后收到的事件比扫描结果更新，同一路径已有待处理变更时以事件为准
+        """
+        with self._lock:
+            # 期间已停止监听的文件夹不再处理
+            new_dirs = [directory for directory in self._new_dirs if self._owner(directory)]
+            self._new_dirs.clear()
+        for directory in new_dirs:
+            self._add_tree(directory)
+            try:
+                found = [scanned_file.path for scanned_file in FolderScanner(workers=1).scan(directory)]
+            except OSError as e:
+                # 目录在处理前又被删除或移走
+                print(f"扫描新目录失败 {directory}: {e}")
+                continue
+            with self._lock:
+                for path in found:
+                    self._pending.setdefault(path, _UPSERT)
+                if found:
+                    self._touch()
+
+    def _work_loop(self):
+        while True:
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            try:
+                self._scan_new_dirs()
+                while self._ready():
+                    self._flush()
+            except Exception as e:
+                print(f"处理文件夹变更失败: {e}")
+
+    def _ready(self) -> bool:
+        with self._lock:
+            if not self._pending and not self._rescan_needed:
+                return False
+            now = time.monotonic()
+            quiet = now - self._last_event >= config.WATCH_DEBOUNCE_SECONDS
+            overdue = now - self._first_event >= config.WATCH_MAX_DELAY_SECONDS
+            # 还在去抖窗口内时由 _work_loop 稍后再检查
+            return quiet or overdue
+
+    def _flush(self):
+        with self._lock:
+            pending = self._pending
+            rescan = self._rescan_needed
+            folders = list(self.folders)
+            self._pending = {}
+            self._rescan_needed = False
+            self._first_event = 0.0
+
+        if rescan:
+            for folder_path in folders:
+                scanner = FolderScanner()
+                self.search_service.sync_folder(folder_path, scanner.scan(folder_path),
+                                                estimated_total=scanner.estimated_total,
+                                                was_listed=scanner.was_listed)
+            self.stats["rescans"] += 1
+
+        removed = 0
+        for path, action in pending.items():
+            if action == _DELETE_FOLDER:
+                removed += self.search_service.remove_folder(path)
+        deleted = [path for path, action in pending.items() if action == _DELETE]
+        if deleted:
+            removed += self.search_service.remove_images(deleted)
+
+        upserts = [path for path in self._changed_files(pending) if pending[path] == _UPSERT]
+        added = 0
+        batch_size = max(1, config.WATCH_BATCH_SIZE)
+        for start in range(0, len(upserts), batch_size):
+            batch_start = time.monotonic()
+            batch = upserts[start:start + batch_size]
+            added += self.search_service.add_images(batch, batch_size=batch_size, replace_existing=True)
+
+            # 限速：每批次至少占用 len(batch) / WATCH_MAX_IMAGES_PER_SECOND 秒
+            if config.WATCH_MAX_IMAGES_PER_SECOND > 0:
+                remaining = len(batch) / config.WATCH_MAX_IMAGES_PER_SECOND - (time.monotonic() - batch_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+        self.stats["added"] += added
+        self.stats["removed"] += removed
+        self.stats["lastFlush"] = time.time()
+        if added or removed or rescan:
+            print(f"文件夹监听: 新增/更新 {added} 张，删除 {removed} 张")
+            self.search_service.checkpoint()
+
+    def _changed_files(self, pending: Dict[str, str]) -> List[str]:
+        """过滤掉已不存在或与文件清单记录一致（内容未变化）的文件"""
+        manifest = self.search_service.file_manifest
+        changed = []
+        for path, action in pending.items():
+            if action != _UPSERT:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint = manifest.entries.get(path)
+            if (fingerprint is not None and path in self.search_service.path_to_id
+                    and fingerprint.size == stat.st_size and fingerprint.mtime_ns == stat.st_mtime_ns):
+                continue
+            changed.append(path)
+        return changed
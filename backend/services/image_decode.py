@@ -0,0 +1,288 @@
+import io
+import os
+import math
+import hashlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from PIL import Image, features
+
+import config
+
+# 缩略图输出格式：格式名 -> (PIL 格式名, MIME 类型, 编码参数)
+THUMBNAIL_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+}
+
+# 缩略图尺寸档位的名称
+THUMBNAIL_TIER_NAMES = {"tiny": 64, "small": 256, "medium": 512, "large": 1024}
+
+# reduce() 能正确缩小的模式；调色板、1 位、16 位整型等模式要先转换为 RGB 再缩小
+REDUCE_MODES = ('RGB', 'RGBA', 'L', 'LA', 'CMYK', 'YCbCr')
+
+
+def check_image_pixels(img: Image.Image, image_path: str = ""):
+    """解码前根据文件头中的尺寸检查像素数，防止极大尺寸的图片耗尽内存"""
+    pixels = img.width * img.height
+    if config.MAX_IMAGE_PIXELS and pixels > config.MAX_IMAGE_PIXELS:
+        raise Image.DecompressionBombError(
+            f"图片像素数 {pixels} 超过上限 {config.MAX_IMAGE_PIXELS}: {image_path}"
+        )
+
+
+def _covering_size(width: int, height: int, target: Tuple[int, int], cover: bool) -> Tuple[int, int]:
+    """
+    计算解码后需要保留的最小尺寸
+    cover=True 时短边不小于目标短边（CLIP 预处理先按短边缩放再中心裁剪），
+    否则按缩略图方式完整放进目标框即可
+    """
+    if cover:
+        scale = min(target) / min(width, height)
+    else:
+        scale = min(target[0] / width, target[1] / height)
+    scale = min(scale, 1.0)
+    return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+
+def prepare_reduced(img: Image.Image, target: Tuple[int, int], cover: bool = True,
+                    image_path: str = "", thumbnail_size: Tuple[int, int] = None) -> Image.Image:
+    """
+    以尽量小的分辨率解码已打开的图像，返回 RGB 图像（尺寸仍不小于目标尺寸）
+    JPEG 使用 draft() 让解码器直接按 1/2、1/4、1/8 缩小解码，其他格式解码后用 reduce() 整数倍缩小，
+    之后再交给 CLIP 预处理或缩略图做精确缩放；
+    同时提供 thumbnail_size 时解码尺寸也足够生成该尺寸的缩略图
+    """
+    check_image_pixels(img, image_path)
+    needed = _covering_size(img.width, img.height, target, cover)
+    if thumbnail_size:
+        thumb_needed = _covering_size(img.width, img.height, thumbnail_size, False)
+        needed = (max(needed[0], thumb_needed[0]), max(needed[1], thumb_needed[1]))
+
+    if config.DECODE_DRAFT and img.format == 'JPEG':
+        img.draft('RGB', needed)
+
+    if config.DECODE_DRAFT:
+        factor = min(img.width // needed[0], img.height // needed[1])
+        if factor >= 2:
+            img.load()
+            if img.mode not in REDUCE_MODES:
+                img = img.convert('RGB')
+            img = img.reduce(factor)
+
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def load_reduced(image_path: str, target: Tuple[int, int], cover: bool = True) -> Image.Image:
+    """打开图片并以尽量小的分辨率解码，见 prepare_reduced"""
+    with Image.open(image_path) as img:
+        reduced = prepare_reduced(img, target, cover, image_path)
+        reduced.load()
+        return reduced
+
+
+def encode_thumbnail(img: Image.Image, size: Tuple[int, int], fmt: str = "jpeg") -> bytes:
+    """把已解码的图像缩放为缩略图并按指定格式（jpeg / webp / avif）编码"""
+    pil_format, _, options = THUMBNAIL_FORMATS[fmt]
+    img = img.copy()
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    thumb_io = io.BytesIO()
+    img.save(thumb_io, format=pil_format, **options)
+    return thumb_io.getvalue()
+
+
+def format_supported(fmt: str) -> bool:
+    """当前 Pillow 是否能编码该缩略图格式（AVIF 需要 Pillow 11.3 以上或插件）"""
+    if fmt == "jpeg":
+        return True
+    if fmt not in THUMBNAIL_FORMATS:
+        return False
+    try:
+        return bool(features.check(fmt))
+    except ValueError:
+        return False
+
+
+def thumbnail_mimetype(fmt: str) -> str:
+    return THUMBNAIL_FORMATS[fmt][1]
+
+
+def choose_thumbnail_format(accepted_mimetypes: Iterable[str]) -> str:
+    """
+    按 config.THUMBNAIL_FORMATS 的优先顺序选择客户端明确接受（Accept 中列出）的格式，
+    都不满足时使用 JPEG
+    """
+    accepted = set(accepted_mimetypes)
+    for fmt in config.THUMBNAIL_FORMATS:
+        if fmt in THUMBNAIL_FORMATS and format_supported(fmt) and thumbnail_mimetype(fmt) in accepted:
+            return fmt
+    return "jpeg"
+
+
+def preferred_thumbnail_format() -> str:
+    """当前环境支持的首选缩略图格式（入库时预先生成缩略图使用）"""
+    return choose_thumbnail_format(thumbnail_mimetype(fmt) for fmt in THUMBNAIL_FORMATS)
+
+
+def thumbnail_tier(size) -> int:
+    """
+    把请求的尺寸（像素数或档位名称）对应到不小于它的最小档位，超过最大档位时使用最大档位；
+    同一档位的缩略图只生成和缓存一次。尺寸不是正整数或档位名称时抛出 ValueError
+    """
+    if isinstance(size, str) and size in THUMBNAIL_TIER_NAMES:
+        size = THUMBNAIL_TIER_NAMES[size]
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ValueError(f"无效的缩略图尺寸: {size}")
+    if size <= 0:
+        raise ValueError(f"无效的缩略图尺寸: {size}")
+    tiers = sorted(config.THUMBNAIL_TIERS)
+    for tier in tiers:
+        if tier >= size:
+            return tier
+    return tiers[-1]
+
+
+def json_ready(value: Any) -> Any:
+    """
+    把EXIF等元数据中的值转换为JSON原生类型：有理数转为浮点数、元组转为列表、
+    字节串按文本解码（无法解码的丢弃）、numpy 标量取其Python值
+    """
+    if value is None or isinstance(value, (bool, int, str)):
+        return value.rstrip("\x00").strip() if isinstance(value, str) else value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8").rstrip("\x00").strip()
+        except UnicodeDecodeError:
+            return None
+    if isinstance(value, dict):
+        return {str(key): json_ready(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_ready(item) for item in value]
+    if hasattr(value, "item"):
+        return json_ready(value.item())
+    try:
+        # IFDRational 等数值类型
+        return json_ready(float(value))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return str(value)
+
+
+def _gps_degrees(value, ref) -> Optional[float]:
+    """把EXIF中的 (度, 分, 秒) 转换为带符号的十进制度数"""
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    result = degrees + minutes / 60 + seconds / 3600
+    if isinstance(ref, bytes):
+        ref = ref.decode("ascii", "ignore")
+    if ref in ("S", "W"):
+        result = -result
+    return round(result, 7) if math.isfinite(result) else None
+
+
+def parse_gps(gps_info: Dict[int, Any]) -> Optional[Dict[str, float]]:
+    """解析EXIF的 GPSInfo（标签号 -> 值），返回 {"latitude", "longitude"[, "altitude"]}，缺少坐标时返回 None"""
+    if not isinstance(gps_info, dict):
+        return None
+    latitude = _gps_degrees(gps_info.get(2), gps_info.get(1))
+    longitude = _gps_degrees(gps_info.get(4), gps_info.get(3))
+    if latitude is None or longitude is None:
+        return None
+    gps = {"latitude": latitude, "longitude": longitude}
+    try:
+        altitude = float(gps_info[6])
+        if math.isfinite(altitude):
+            gps["altitude"] = -altitude if gps_info.get(5) in (1, b"\x01") else altitude
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        pass
+    return gps
+
+
+def image_metadata(img: Image.Image, size_bytes: int) -> Dict[str, Any]:
+    """
+    从已打开的图像读取尺寸、格式和EXIF信息（只解析文件头，不解码像素）
+    返回的值都是JSON原生类型，入库后直接序列化，搜索时不再逐项转换
+    """
+    metadata = {
+        "width": img.width,
+        "height": img.height,
+        "format": img.format,
+        "mode": img.mode,
+        "size_bytes": size_bytes
+    }
+    
+    # 提取EXIF数据（如果存在）
+    exif_data = img._getexif() if hasattr(img, "_getexif") else None
+    if exif_data:
+        # 简化的EXIF提取
+        from PIL.ExifTags import TAGS
+        for tag_id, value in exif_data.items():
+            tag = TAGS.get(tag_id, tag_id)
+            if tag == "DateTimeOriginal":
+                metadata["DateTimeOriginal"] = json_ready(value)
+            elif tag == "GPSInfo":
+                # 解析为十进制经纬度；location 为约 1 公里精度的坐标，用于按地点分组
+                gps = parse_gps(value)
+                if gps:
+                    metadata["gps"] = gps
+                    metadata["location"] = f"{gps['latitude']:.2f},{gps['longitude']:.2f}"
+    
+    return metadata
+
+
+class ImageSource:
+    """
+    一次读入内存的图片文件
+    入库时内容哈希、元数据、缩小解码后的模型输入和缩略图都从同一份字节数据得到，每个文件只读取一次
+    """
+
+    def __init__(self, image_path: str):
+        self.path = image_path
+        with open(image_path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.data = f.read()
+        self.size = self.stat.st_size
+        self._content_hash = None
+
+    @property
+    def content_hash(self) -> str:
+        """内容哈希，与 compute_file_hash 的结果相同"""
+        if self._content_hash is None:
+            self._content_hash = hashlib.blake2b(self.data, digest_size=16).hexdigest()
+        return self._content_hash
+
+    def open(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.data))
+
+    def metadata(self, img: Optional[Image.Image] = None) -> Dict[str, Any]:
+        """读取元数据；图像无法解析时返回只包含文件大小的基本信息"""
+        try:
+            if img is not None:
+                return image_metadata(img, self.size)
+            with self.open() as opened:
+                return image_metadata(opened, self.size)
+        except Exception as e:
+            print(f"Error extracting metadata for {self.path}: {e}")
+            return {"width": 0, "height": 0, "format": "", "mode": "", "size_bytes": self.size}
+
+
+def processor_input_size(processor, default: int = 224) -> Tuple[int, int]:
+    """CLIP 预处理缩放时使用的短边长度（取自处理器配置）"""
+    image_processor = getattr(processor, "image_processor", processor)
+    size = getattr(image_processor, "size", None)
+    if isinstance(size, dict):
+        edge = size.get("shortest_edge") or min(size.get("height", default), size.get("width", default))
+    elif isinstance(size, int):
+        edge = size
+    else:
+        edge = default
+    return edge, edge
@@ -1,31 +1,51 @@
 import os
 import sys
 from typing import List, Dict, Any, Tuple
-import torch
 import numpy as np
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-from sentence_transformers import SentenceTransformer
+from services.model_loader import get_shared_clip_model, get_text_encoder
 from models.image_processor import ImageProcessorInterface
+from services.image_decode import load_reduced, processor_input_size, image_metadata, encode_thumbnail
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+def extract_image_metadata(image_path: str) -> Dict[str, Any]:
+    """
+    提取图像元数据（如EXIF信息）
+    不依赖任何模型，批量入库时可以直接调用而无需构造 ImageFeatureExtractor
+    """
+    try:
+        with Image.open(image_path) as img:
+            return image_metadata(img, os.path.getsize(image_path))
+    except Exception as e:
+        print(f"Error extracting metadata for {image_path}: {e}")
+        # 返回基本文件信息
+        return {
+            "width": 0,
+            "height": 0,
+            "format": "",
+            "mode": "",
+            "size_bytes": os.path.getsize(image_path)
+        }
+
+
 class ImageFeatureExtractor(ImageProcessorInterface):
-    """图像特征提取器实现"""
+    """
+    图像特征提取器实现
+    模型实例与搜索服务共享（见 model_loader.get_shared_clip_model），构造时不会重复加载
+    """
     
     def __init__(self):
         # 加载CLIP模型用于图像特征提取
         # 这使用了OpenAI的CLIP模型，它可以将图像和文本映射到同一特征空间
-        self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        self.clip_model, self.clip_processor = get_shared_clip_model("openai/clip-vit-base-patch32")
         self.current_model = "openai/clip-vit-base-patch32"
-        
-        # 用于文本编码的模型
-        self.text_encoder = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # 将模型设置为评估模式
-        self.clip_model.eval()
+    
+    @property
+    def text_encoder(self):
+        """用于文本编码的模型，首次使用时才加载"""
+        return get_text_encoder()
     
     def extract_features(self, image_path: str) -> List[float]:
         """
@@ -33,8 +53,10 @@ class ImageFeatureExtractor(ImageProcessorInterface):
         使用CLIP模型提取图像的特征向量
         """
         try:
+            import torch
+            
             # 加载图像
-            image = Image.open(image_path).convert('RGB')
+            image = load_reduced(image_path, processor_input_size(self.clip_processor))
             
             # 预处理图像
             inputs = self.clip_processor(images=image, return_tensors="pt")
@@ -58,86 +80,38 @@ class ImageFeatureExtractor(ImageProcessorInterface):
         try:
             # 根据模型名称加载相应的模型
             if model_name == 'clip-vit-base-patch32':
-                self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-                self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+                self.clip_model, self.clip_processor = get_shared_clip_model("openai/clip-vit-base-patch32")
                 self.current_model = "openai/clip-vit-base-patch32"
             elif model_name == 'clip-vit-large-patch14':
-                self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-large-patch14")
-                self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
+                self.clip_model, self.clip_processor = get_shared_clip_model("openai/clip-vit-large-patch14")
                 self.current_model = "openai/clip-vit-large-patch14"
             elif model_name == 'chinese-clip-vit-base-patch16':
                 # Chinese CLIP 模型
-                self.clip_model = CLIPModel.from_pretrained("OFA-Sys/chinese-clip-vit-base-patch16")
-                self.clip_processor = CLIPProcessor.from_pretrained("OFA-Sys/chinese-clip-vit-base-patch16")
+                self.clip_model, self.clip_processor = get_shared_clip_model("OFA-Sys/chinese-clip-vit-base-patch16")
                 self.current_model = "OFA-Sys/chinese-clip-vit-base-patch16"
             elif model_name == 'multilingual-clip-vit-base-patch32':
                 # Multilingual CLIP 模型
-                self.clip_model = CLIPModel.from_pretrained("sentence-transformers/clip-ViT-B-32-multilingual-v1")
-                self.clip_processor = CLIPProcessor.from_pretrained("sentence-transformers/clip-ViT-B-32-multilingual-v1")
+                self.clip_model, self.clip_processor = get_shared_clip_model("sentence-transformers/clip-ViT-B-32-multilingual-v1")
                 self.current_model = "sentence-transformers/clip-ViT-B-32-multilingual-v1"
             else:
                 # 默认使用CLIP ViT-B/32
-                self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-                self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+                self.clip_model, self.clip_processor = get_shared_clip_model("openai/clip-vit-base-patch32")
                 self.current_model = "openai/clip-vit-base-patch32"
             
-            # 确保模型处于评估模式
-            self.clip_model.eval()
             print(f"图像处理器成功加载模型: {model_name}")
         except Exception as e:
             print(f"图像处理器设置模型失败: {e}")
     
-    def generate_thumbnail(self, image_path: str, size: Tuple[int, int] = (128, 128)) -> bytes:
-        """生成缩略图"""
+    def generate_thumbnail(self, image_path: str, size: Tuple[int, int] = (128, 128), fmt: str = "jpeg") -> bytes:
+        """生成缩略图，fmt 为输出格式（jpeg / webp / avif）"""
         try:
-            with Image.open(image_path) as img:
-                img = img.convert('RGB')  # 确保是RGB模式
-                img.thumbnail(size, Image.Resampling.LANCZOS)
-                
-                # 保存到字节流
-                import io
-                thumb_io = io.BytesIO()
-                img.save(thumb_io, format='JPEG', quality=85)
-                thumb_io.seek(0)
-                
-                return thumb_io.getvalue()
+            # 按缩略图尺寸缩小解码，再精确缩放并编码
+            img = load_reduced(image_path, size, cover=False)
+            return encode_thumbnail(img, size, fmt)
         except Exception as e:
             print(f"Error generating thumbnail for {image_path}: {e}")
             raise e
     
     def extract_metadata(self, image_path: str) -> Dict[str, Any]:
         """提取图像元数据（如EXIF信息）"""
-        try:
-            with Image.open(image_path) as img:
-                metadata = {
-                    "width": img.width,
-                    "height": img.height,
-                    "format": img.format,
-                    "mode": img.mode,
-                    "size_bytes": os.path.getsize(image_path)
-                }
-                
-                # 提取EXIF数据（如果存在）
-                exif_data = img._getexif()
-                if exif_data:
-                    # 简化的EXIF提取
-                    from PIL.ExifTags import TAGS
-                    for tag_id, value in exif_data.items():
-                        tag = TAGS.get(tag_id, tag_id)
-                        if tag == "DateTimeOriginal":
-                            metadata["DateTimeOriginal"] = value
-                        elif tag == "GPSInfo":
-                            # GPS信息处理（简化）
-                            metadata["GPSInfo"] = str(value)
-                
-                return metadata
-        except Exception as e:
-            print(f"Error extracting metadata for {image_path}: {e}")
-            # 返回基本文件信息
-            return {
-                "width": 0,
-                "height": 0,
-                "format": "",
-                "mode": "",
-                "size_bytes": os.path.getsize(image_path)
-            }
\ No newline at end of file
+        return extract_image_metadata(image_path)
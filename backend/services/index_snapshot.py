@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# 快照目录中的清单文件，记录各个文件的大小和校验和；指向当前快照的指针文件
+SNAPSHOT_MANIFEST = "MANIFEST.json"
+CURRENT_FILE = "CURRENT"
+_SNAPSHOT_PREFIX = "snapshot-"
+
+
+def _checksum_bytes(data) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _checksum_file(path: str, chunk_size: int = 1 << 20) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _fsync_dir(path: str):
+    """同步目录项，保证重命名在断电后也能保留（Windows 不支持，忽略）"""
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class IndexSnapshotStore:
+    """
+    版本化的索引快照
+    每次保存写入一个新的 snapshot-<版本号> 目录：先写到临时目录并逐个 fsync，
+    再整体重命名，最后原子地更新 CURRENT 指针。清单中记录每个文件的大小和校验和，
+    加载时校验不通过的快照会被跳过，退回到上一个完整的快照
+    """
+
+    def __init__(self, snapshot_dir: str = "index_snapshots", keep: int = 2):
+        self.snapshot_dir = snapshot_dir
+        self.keep = max(1, keep)
+
+    def _versions(self) -> List[int]:
+        """返回已完成的快照版本号（从新到旧）"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        versions = []
+        for name in os.listdir(self.snapshot_dir):
+            if name.startswith(_SNAPSHOT_PREFIX):
+                try:
+                    versions.append(int(name[len(_SNAPSHOT_PREFIX):]))
+                except ValueError:
+                    continue
+        return sorted(versions, reverse=True)
+
+    def _path_for(self, version: int) -> str:
+        return os.path.join(self.snapshot_dir, f"{_SNAPSHOT_PREFIX}{version:08d}")
+
+    def write(self, files: Dict[str, Any], info: Dict[str, Any]) -> str:
+        """
+        写入新快照并切换为当前快照
+        files 为 文件名 -> 内容（bytes 或支持缓冲区协议的对象），info 为写入清单的附加信息
+        返回新快照目录的路径
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        versions = self._versions()
+        version = versions[0] + 1 if versions else 1
+
+        temp_path = os.path.join(self.snapshot_dir, f".{_SNAPSHOT_PREFIX}{version:08d}.tmp")
+        if os.path.exists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(temp_path)
+
+        entries = {}
+        for name, data in files.items():
+            view = memoryview(data).cast('B')
+            with open(os.path.join(temp_path, name), 'wb') as f:
+                f.write(view)
+                f.flush()
+                os.fsync(f.fileno())
+            entries[name] = {"size": view.nbytes, "blake2b": _checksum_bytes(view)}
+
+        manifest = dict(info)
+        manifest.update({"version": version, "createdAt": time.time(), "files": entries})
+        with open(os.path.join(temp_path, SNAPSHOT_MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        final_path = self._path_for(version)
+        os.replace(temp_path, final_path)
+
+        current_temp = os.path.join(self.snapshot_dir, f"{CURRENT_FILE}.tmp")
+        with open(current_temp, 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(final_path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_temp, os.path.join(self.snapshot_dir, CURRENT_FILE))
+        _fsync_dir(self.snapshot_dir)
+
+        self._prune(version)
+        return final_path
+
+    def _prune(self, current_version: int):
+        """只保留最近的 keep 个快照；正被内存映射占用而无法删除的旧快照留到下次再清理"""
+        for version in self._versions()[self.keep:]:
+            if version == current_version:
+                continue
+            try:
+                shutil.rmtree(self._path_for(version))
+            except OSError as e:
+                print(f"清理旧索引快照失败 {self._path_for(version)}: {e}")
+
+    def verify(self, snapshot_path: str, checksums: bool = True) -> Optional[Dict[str, Any]]:
+        """校验快照完整性，通过时返回清单内容，否则返回 None"""
+        try:
+            with open(os.path.join(snapshot_path, SNAPSHOT_MANIFEST), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            for name, entry in manifest["files"].items():
+                path = os.path.join(snapshot_path, name)
+                if os.path.getsize(path) != entry["size"]:
+                    print(f"索引快照文件大小不一致: {path}")
+                    return None
+                if checksums and _checksum_file(path) != entry["blake2b"]:
+                    print(f"索引快照文件校验失败: {path}")
+                    return None
+            return manifest
+        except Exception as e:
+            print(f"读取索引快照失败 {snapshot_path}: {e}")
+            return None
+
+    def latest(self, checksums: bool = True) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        返回最新的完整快照 (目录路径, 清单)
+        优先使用 CURRENT 指向的快照，校验失败时依次尝试更旧的快照
+        """
+        candidates = []
+        try:
+            with open(os.path.join(self.snapshot_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+                candidates.append(os.path.join(self.snapshot_dir, f.read().strip()))
+        except OSError:
+            pass
+        for version in self._versions():
+            path = self._path_for(version)
+            if path not in candidates:
+                candidates.append(path)
+
+        for path in candidates:
+            manifest = self.verify(path, checksums)
+            if manifest is not None:
+                return path, manifest
+            print(f"跳过不完整的索引快照: {path}")
+        return None
@@ -0,0 +1,253 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+# 队列结束标记
+_SENTINEL = object()
+
+
+class StageStats:
+    """流水线单个阶段的计时统计"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, seconds: float):
+        """记录一次处理的条目数和耗时"""
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy_seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            avg_ms = self.busy_seconds / self.items * 1000 if self.items else 0.0
+            return {
+                "workers": self.workers,
+                "items": self.items,
+                "batches": self.batches,
+                "busySeconds": round(self.busy_seconds, 3),
+                "avgMsPerItem": round(avg_ms, 2)
+            }
+
+
+class IngestPipeline:
+    """
+    分阶段的图像入库流水线
+    解码/预处理（多线程）-> 批量推理 -> 写入，各阶段之间通过有界队列衔接，
+    模型推理时解码线程可以继续读取后续图片，队列写满时上游自动阻塞
+
+    preprocess_fn(path) -> (pixel_values, metadata, cached_features)
+                                                      在解码线程中执行，cached_features 不为 None 时跳过推理
+    infer_fn(pixel_values_batch) -> features          在推理线程中执行，输入为 (N, C, H, W)
+    write_fn(paths, features, metadatas, failed)      在唯一的写入线程中执行
+    """
+
+    def __init__(self,
+                 preprocess_fn: Callable[[str], Tuple[Optional[np.ndarray], Optional[Dict[str, Any]], Optional[np.ndarray]]],
+                 infer_fn: Callable[[np.ndarray], np.ndarray],
+                 write_fn: Callable[[List[str], np.ndarray, List[Optional[Dict[str, Any]]], List[str]], None],
+                 batch_size: int = None,
+                 decode_workers: int = None,
+                 decode_queue_size: int = None,
+                 inference_workers: int = None,
+                 write_queue_size: int = None,
+                 batch_timeout: float = None,
+                 progress_callback: Optional[Callable[[int, Optional[int], Dict[str, Any]], None]] = None):
+        self.preprocess_fn = preprocess_fn
+        self.infer_fn = infer_fn
+        self.write_fn = write_fn
+        self.batch_size = max(1, batch_size or config.ENCODE_BATCH_SIZE)
+        self.decode_workers = max(1, decode_workers or config.INGEST_DECODE_WORKERS)
+        self.decode_queue_size = max(1, decode_queue_size or config.INGEST_DECODE_QUEUE_SIZE)
+        self.inference_workers = max(1, inference_workers or config.INGEST_INFERENCE_WORKERS)
+        self.write_queue_size = max(1, write_queue_size or config.INGEST_WRITE_QUEUE_SIZE)
+        self.batch_timeout = batch_timeout if batch_timeout is not None else config.INGEST_BATCH_TIMEOUT
+        self.progress_callback = progress_callback
+
+        # 写入阶段只有一个线程，保证索引和元数据按批次串行更新
+        self.stats = {
+            "decode": StageStats(self.decode_workers),
+            "inference": StageStats(self.inference_workers),
+            "write": StageStats(1)
+        }
+        self.submitted = 0
+        self.cache_hits = 0  # 可能有多个推理线程同时累加，读写都持有 _cache_hits_lock
+        self._cache_hits_lock = threading.Lock()
+        self.processed = 0
+        self.added = 0
+        self.total = None
+        self._start_time = None
+
+        self._path_queue = queue.Queue(maxsize=self.decode_queue_size)
+        self._decoded_queue = queue.Queue(maxsize=self.decode_queue_size)
+        self._write_queue = queue.Queue(maxsize=self.write_queue_size)
+
+    def stage_stats(self) -> Dict[str, Any]:
+        """返回各阶段的计时统计和队列积压情况，用于写入 processing_status"""
+        elapsed = time.time() - self._start_time if self._start_time else 0.0
+        result = {name: stats.to_dict() for name, stats in self.stats.items()}
+        result["queueDepths"] = {
+            "paths": self._path_queue.qsize(),
+            "decoded": self._decoded_queue.qsize(),
+            "write": self._write_queue.qsize()
+        }
+        with self._cache_hits_lock:
+            result["cacheHits"] = self.cache_hits
+        result["elapsedSeconds"] = round(elapsed, 3)
+        return result
+
+    def run(self, image_paths: Iterable[str], total: Optional[int] = None) -> int:
+        """
+        运行流水线直到所有图片处理完成
+        image_paths 可以是列表或生成器；total 未知时进度中的总数按已提交数量计算
+        返回成功写入的图片数量
+        """
+        self._start_time = time.time()
+        if total is None and hasattr(image_paths, '__len__'):
+            total = len(image_paths)
+        self.total = total
+
+        decode_threads = [
+            threading.Thread(target=self._decode_worker, name=f"ingest-decode-{i}", daemon=True)
+            for i in range(self.decode_workers)
+        ]
+        inference_threads = [
+            threading.Thread(target=self._inference_worker, name=f"ingest-infer-{i}", daemon=True)
+            for i in range(self.inference_workers)
+        ]
+        writer_thread = threading.Thread(target=self._write_worker, name="ingest-write", daemon=True)
+
+        for thread in decode_threads + inference_threads + [writer_thread]:
+            thread.start()
+
+        try:
+            # 在调用线程中投递路径，队列满时阻塞，形成反压
+            for image_path in image_paths:
+                self._path_queue.put(image_path)
+                self.submitted += 1
+        finally:
+            # 逐级关闭各阶段
+            for _ in decode_threads:
+                self._path_queue.put(_SENTINEL)
+            for thread in decode_threads:
+                thread.join()
+
+            for _ in inference_threads:
+                self._decoded_queue.put(_SENTINEL)
+            for thread in inference_threads:
+                thread.join()
+
+            self._write_queue.put(_SENTINEL)
+            writer_thread.join()
+
+        return self.added
+
+    def _decode_worker(self):
+        """解码/预处理阶段：读取图片、转换为模型输入并提取元数据"""
+        while True:
+            image_path = self._path_queue.get()
+            if image_path is _SENTINEL:
+                break
+
+            start = time.perf_counter()
+            try:
+                pixel_values, metadata, cached_features = self.preprocess_fn(image_path)
+                item = (image_path, pixel_values, metadata, cached_features)
+            except Exception as e:
+                print(f"图像预处理失败 {image_path}: {e}")
+                item = (image_path, None, None, None)
+            self.stats["decode"].record(1, time.perf_counter() - start)
+
+            self._decoded_queue.put(item)
+
+    def _inference_worker(self):
+        """推理阶段：凑满一个批次（或等待超时）后执行一次前向推理"""
+        finished = False
+        while not finished:
+            item = self._decoded_queue.get()
+            if item is _SENTINEL:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.batch_timeout
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._decoded_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _SENTINEL:
+                    finished = True
+                    break
+                batch.append(item)
+
+            self._infer_batch(batch)
+
+    def _infer_batch(self, batch: List[Tuple[str, Optional[np.ndarray], Optional[Dict[str, Any]], Optional[np.ndarray]]]):
+        # 命中缓存的条目已有向量，只对其余条目做推理
+        ready = [entry for entry in batch if entry[1] is not None or entry[3] is not None]
+        failed = [entry[0] for entry in batch if entry[1] is None and entry[3] is None]
+        to_infer = [entry for entry in ready if entry[3] is None]
+        with self._cache_hits_lock:
+            self.cache_hits += len(ready) - len(to_infer)
+
+        inferred = {}
+        if to_infer:
+            start = time.perf_counter()
+            try:
+                features = self.infer_fn(np.stack([entry[1] for entry in to_infer]))
+                inferred = {entry[0]: features[i] for i, entry in enumerate(to_infer)}
+            except Exception as e:
+                print(f"批量图像编码失败: {e}")
+                failed.extend(entry[0] for entry in to_infer)
+                ready = [entry for entry in ready if entry[3] is not None]
+            self.stats["inference"].record(len(to_infer), time.perf_counter() - start)
+
+        paths = [entry[0] for entry in ready]
+        metadatas = [entry[2] for entry in ready]
+        features = None
+        if ready:
+            features = np.vstack([
+                entry[3] if entry[3] is not None else inferred[entry[0]] for entry in ready
+            ]).astype('float32')
+
+        self._write_queue.put((paths, features, metadatas, failed))
+
+    def _write_worker(self):
+        """写入阶段：把向量和元数据提交到索引"""
+        while True:
+            item = self._write_queue.get()
+            if item is _SENTINEL:
+                break
+
+            paths, features, metadatas, failed = item
+            start = time.perf_counter()
+            try:
+                if paths:
+                    self.write_fn(paths, features, metadatas, failed)
+                    self.added += len(paths)
+                elif failed:
+                    self.write_fn([], None, [], failed)
+            except Exception as e:
+                print(f"写入索引失败: {e}")
+            self.stats["write"].record(len(paths), time.perf_counter() - start)
+
+            self.processed += len(paths) + len(failed)
+            if self.progress_callback:
+                total = self.total if self.total is not None else self.submitted
+                try:
+                    self.progress_callback(self.processed, total, self.stage_stats())
+                except Exception as e:
+                    print(f"更新处理进度失败: {e}")
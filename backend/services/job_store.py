@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, List
+
+
+class JobStore:
+    """
+    持久化的索引任务记录
+    每个任务保存启动参数和最近一次检查点时的进度（游标），
+    服务重启后仍处于 running 状态的任务即为被中断的任务，可以按原参数恢复
+    """
+
+    def __init__(self, jobs_path: str = "index_jobs.json"):
+        self.jobs_path = jobs_path
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.jobs_path):
+                with open(self.jobs_path, 'r', encoding='utf-8') as f:
+                    self.jobs = json.load(f)
+        except Exception as e:
+            print(f"加载任务记录失败: {e}")
+            self.jobs = {}
+
+    def _save(self):
+        """先写临时文件再替换，进程中断时不会留下写了一半的文件"""
+        temp_path = f"{self.jobs_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.jobs, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.jobs_path)
+
+    def start(self, task_id: str, params: Dict[str, Any]):
+        """登记任务开始；恢复已有任务时保留之前的进度并累加恢复次数"""
+        with self._lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                job = {"params": params, "processed": 0, "total": 0, "resumeCount": 0, "createdAt": time.time()}
+            else:
+                job["resumeCount"] = job.get("resumeCount", 0) + 1
+            job["status"] = "running"
+            job["updatedAt"] = time.time()
+            self.jobs[task_id] = job
+            self._save_quietly()
+
+    def update(self, task_id: str, **cursor):
+        """记录检查点时的任务进度"""
+        with self._lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return
+            job.update(cursor)
+            job["updatedAt"] = time.time()
+            self._save_quietly()
+
+    def finish(self, task_id: str, status: str = "completed"):
+        """任务结束（完成或失败）后不再恢复，只保留最近的记录"""
+        with self._lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return
+            job["status"] = status
+            job["updatedAt"] = time.time()
+            self._prune()
+            self._save_quietly()
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """返回被中断的任务列表，每项包含 taskId 和启动参数"""
+        with self._lock:
+            return [
+                {"taskId": task_id, **job}
+                for task_id, job in self.jobs.items() if job.get("status") == "running"
+            ]
+
+    def _prune(self, keep: int = 50):
+        finished = sorted(
+            (job.get("updatedAt", 0), task_id)
+            for task_id, job in self.jobs.items() if job.get("status") != "running"
+        )
+        for _, task_id in finished[:-keep]:
+            del self.jobs[task_id]
+
+    def _save_quietly(self):
+        try:
+            self._save()
+        except Exception as e:
+            print(f"保存任务记录失败: {e}")
@@ -0,0 +1,160 @@
+import threading
+from datetime import datetime, time as dt_time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+# 常见的格式别名，统一为 Pillow 的格式名称
+_FORMAT_ALIASES = {"JPG": "JPEG", "TIF": "TIFF"}
+
+
+def _parse_date(value: Any, end_of_day: bool = False) -> float:
+    """把 YYYY-MM-DD 或 ISO 8601 时间（或时间戳）转换为时间戳；只有日期的结束时间包含当天"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"无效的日期: {value}")
+    if end_of_day and len(text) <= 10:
+        parsed = datetime.combine(parsed.date(), dt_time.max)
+    return parsed.timestamp()
+
+
+def _string_list(value: Any, key: str) -> List[str]:
+    """把字符串或字符串列表统一为列表，其他类型（数字、对象、含非字符串元素的列表）视为无效参数"""
+    values = [value] if isinstance(value, str) else value
+    if not isinstance(values, (list, tuple)) or not all(isinstance(item, str) for item in values):
+        raise ValueError(f"{key} 必须是字符串或字符串列表")
+    return list(values)
+
+
+def parse_filters(raw: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    校验并规范化搜索过滤条件，没有任何条件时返回 None
+    支持的条件: folder（文件夹或文件夹列表，含子文件夹）、dateFrom / dateTo（拍摄时间，含边界）、
+    formats（格式列表，如 ["jpeg", "png"]）、minWidth / minHeight（最小分辨率）
+    """
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("filters 必须是对象")
+
+    filters: Dict[str, Any] = {}
+    folders = raw.get("folder") or raw.get("folders")
+    if folders:
+        filters["folders"] = _string_list(folders, "folder")
+    if raw.get("dateFrom") not in (None, ""):
+        filters["date_from"] = _parse_date(raw["dateFrom"])
+    if raw.get("dateTo") not in (None, ""):
+        filters["date_to"] = _parse_date(raw["dateTo"], end_of_day=True)
+    formats = raw.get("formats") or raw.get("format")
+    if formats:
+        formats = _string_list(formats, "formats")
+        filters["formats"] = {_FORMAT_ALIASES.get(fmt.upper(), fmt.upper()) for fmt in formats}
+    for key, name in (("minWidth", "min_width"), ("minHeight", "min_height")):
+        if raw.get(key) not in (None, ""):
+            try:
+                filters[name] = int(raw[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} 必须是整数")
+    return filters or None
+
+
+class MetadataColumns:
+    """
+    按向量ID存放的列式元数据（拍摄时间、格式、宽、高），用于在向量搜索前快速算出满足过滤条件的ID位图
+    数组下标即向量ID，1M 张图像约占 20MB；数据来自元数据库中单独成列的字段，由调用方在写入/删除时同步
+    """
+
+    def __init__(self):
+        self.live = np.zeros(0, dtype=bool)
+        self.date_taken = np.zeros(0, dtype='float64')
+        self.format = np.zeros(0, dtype='int16')
+        self.width = np.zeros(0, dtype='int32')
+        self.height = np.zeros(0, dtype='int32')
+        self._format_codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_capacity(self, size: int):
+        """按需扩容（容量翻倍），调用方持有锁"""
+        capacity = len(self.live)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name, fill in (("live", False), ("date_taken", np.nan), ("format", -1), ("width", 0), ("height", 0)):
+            column = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _format_code(self, fmt: Optional[str]) -> int:
+        if not fmt:
+            return -1
+        fmt = fmt.upper()
+        if fmt not in self._format_codes:
+            self._format_codes[fmt] = len(self._format_codes)
+        return self._format_codes[fmt]
+
+    def update(self, rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[int], Optional[int]]]):
+        """写入 (向量ID, 拍摄时间ISO字符串, 格式, 宽, 高)"""
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock:
+            self._ensure_capacity(max(row[0] for row in rows) + 1)
+            for image_id, date_taken, fmt, width, height in rows:
+                try:
+                    timestamp = datetime.fromisoformat(date_taken).timestamp() if date_taken else np.nan
+                except ValueError:
+                    timestamp = np.nan
+                self.live[image_id] = True
+                self.date_taken[image_id] = timestamp
+                self.format[image_id] = self._format_code(fmt)
+                self.width[image_id] = width or 0
+                self.height[image_id] = height or 0
+
+    def remove(self, image_ids: Iterable[int]):
+        with self._lock:
+            ids = np.fromiter((image_id for image_id in image_ids if image_id < len(self.live)), dtype='int64')
+            self.live[ids] = False
+
+    def match(self, filters: Dict[str, Any], folder_ids: Optional[List[int]] = None) -> np.ndarray:
+        """
+        按过滤条件计算布尔位图（下标为向量ID）
+        folder_ids 为文件夹条件下的候选ID（由路径前缀索引得到），None 表示不限文件夹
+        """
+        with self._lock:
+            mask = self.live.copy()
+            if folder_ids is not None:
+                in_folder = np.zeros(len(mask), dtype=bool)
+                ids = np.fromiter((image_id for image_id in folder_ids if image_id < len(mask)), dtype='int64')
+                in_folder[ids] = True
+                mask &= in_folder
+            # 比较时 NaN（没有拍摄时间）总是不满足条件
+            if "date_from" in filters:
+                mask &= self.date_taken >= filters["date_from"]
+            if "date_to" in filters:
+                mask &= self.date_taken <= filters["date_to"]
+            if "formats" in filters:
+                codes = [self._format_codes[fmt] for fmt in filters["formats"] if fmt in self._format_codes]
+                mask &= np.isin(self.format, codes)
+            if "min_width" in filters:
+                mask &= self.width >= filters["min_width"]
+            if "min_height" in filters:
+                mask &= self.height >= filters["min_height"]
+            return mask
+
+
+class BitmapSelector:
+    """
+    把ID位图包装为 FAISS 的 IDSelectorBitmap，搜索时索引只考虑位图中的向量
+    FAISS 只保存指向位图的指针，本对象需要在搜索期间保持存活；
+    IDSelectorBitmap 的长度是打包后的字节数，超出位图范围的ID（例如列式元数据扩容前新增的向量）一律不匹配
+    """
+
+    def __init__(self, mask: np.ndarray):
+        self.bits = np.packbits(mask, bitorder='little')
+        self.selector = faiss.IDSelectorBitmap(len(self.bits), faiss.swig_ptr(self.bits))
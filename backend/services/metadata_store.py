@@ -0,0 +1,224 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# SQLite 单条语句的参数数量有上限，批量查询/删除时按此大小分块
+_CHUNK_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    folder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    date_taken TEXT,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    size_bytes INTEGER,
+    location TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_folder ON images(folder);
+CREATE INDEX IF NOT EXISTS idx_images_date_taken ON images(date_taken);
+CREATE INDEX IF NOT EXISTS idx_images_format ON images(format);
+CREATE INDEX IF NOT EXISTS idx_images_dimensions ON images(width, height);
+CREATE INDEX IF NOT EXISTS idx_images_size_bytes ON images(size_bytes);
+CREATE INDEX IF NOT EXISTS idx_images_location ON images(location);
+"""
+
+_COLUMNS = "id, path, folder, filename, date_taken, format, width, height, size_bytes, location, metadata"
+
+
+def _date_taken(image_path: str, metadata: Dict[str, Any]) -> Optional[str]:
+    """拍摄时间：优先使用EXIF中的拍摄时间，否则使用文件修改时间（ISO 8601）"""
+    value = metadata.get("DateTimeOriginal") or metadata.get("DateTime")
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value.strip(), "%Y:%m:%d %H:%M:%S").isoformat()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(image_path)).isoformat()
+    except OSError:
+        return None
+
+
+def _json_default(value: Any) -> Any:
+    """numpy 标量等转换为对应的Python类型，其余无法序列化的值保存为字符串"""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _to_row(image_id: int, image_path: str, metadata: Optional[Dict[str, Any]]) -> Tuple:
+    metadata = metadata or {}
+    return (
+        int(image_id),
+        image_path,
+        os.path.dirname(image_path),
+        os.path.basename(image_path),
+        _date_taken(image_path, metadata),
+        metadata.get("format") or None,
+        metadata.get("width"),
+        metadata.get("height"),
+        metadata.get("size_bytes"),
+        metadata.get("location"),
+        json.dumps(metadata, ensure_ascii=False, default=_json_default)
+    )
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "path": row["path"],
+        "date_taken": row["date_taken"],
+        "location": row["location"],
+        "metadata": json.loads(row["metadata"])
+    }
+
+
+class MetadataStore:
+    """
+    基于SQLite的图像元数据存储
+    主键与FAISS向量ID相同；文件夹、拍摄时间、格式、尺寸、文件大小等常用字段单独成列并建立索引，
+    完整元数据以JSON保存。使用WAL模式，入库时按批次写入
+    """
+
+    def __init__(self, db_path: str = "image_metadata.db"):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def upsert_many(self, rows: Iterable[Tuple[int, str, Optional[Dict[str, Any]]]]):
+        """批量写入 (向量ID, 路径, 元数据)；同一路径已有记录时整行替换"""
+        records = [_to_row(image_id, path, metadata) for image_id, path, metadata in rows]
+        if not records:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO images ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                records
+            )
+
+    def delete_ids(self, image_ids: Iterable[int]):
+        ids = [int(image_id) for image_id in image_ids]
+        with self._lock, self._conn:
+            for start in range(0, len(ids), _CHUNK_SIZE):
+                chunk = ids[start:start + _CHUNK_SIZE]
+                self._conn.execute(
+                    f"DELETE FROM images WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM images")
+
+    def rename_many(self, renames: Iterable[Tuple[int, str]]):
+        """批量更新 (向量ID, 新路径)"""
+        records = [
+            (path, os.path.dirname(path), os.path.basename(path), int(image_id))
+            for image_id, path in renames
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE images SET path = ?, folder = ?, filename = ? WHERE id = ?", records
+            )
+
+    def merge_metadata_many(self, updates: Dict[int, Dict[str, Any]]):
+        """把字段合并进已有记录的JSON元数据"""
+        if not updates:
+            return
+        with self._lock, self._conn:
+            current = self._fetch_many(list(updates.keys()))
+            records = []
+            for image_id, fields in updates.items():
+                row = current.get(image_id)
+                if row is None:
+                    continue
+                metadata = json.loads(row["metadata"])
+                metadata.update(fields)
+                records.append((json.dumps(metadata, ensure_ascii=False, default=_json_default), image_id))
+            self._conn.executemany("UPDATE images SET metadata = ? WHERE id = ?", records)
+
+    def _fetch_many(self, image_ids: List[int]) -> Dict[int, sqlite3.Row]:
+        rows = {}
+        for start in range(0, len(image_ids), _CHUNK_SIZE):
+            chunk = image_ids[start:start + _CHUNK_SIZE]
+            cursor = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM images WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for row in cursor:
+                rows[row["id"]] = row
+        return rows
+
+    def get_many(self, image_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """按向量ID批量读取元数据，返回 {id: metadata}"""
+        ids = [int(image_id) for image_id in image_ids]
+        with self._lock:
+            rows = self._fetch_many(ids)
+        return {image_id: json.loads(row["metadata"]) for image_id, row in rows.items()}
+
+    def get(self, image_id: int) -> Optional[Dict[str, Any]]:
+        return self.get_many([image_id]).get(int(image_id))
+
+    def id_path_pairs(self) -> List[Tuple[int, str]]:
+        """返回全部 (向量ID, 路径)，用于启动时重建内存中的ID映射"""
+        with self._lock:
+            return [(row[0], row[1]) for row in self._conn.execute("SELECT id, path FROM images")]
+
+    def filter_rows(self, image_ids: Iterable[int] = None) -> List[Tuple[int, Optional[str], Optional[str], Optional[int], Optional[int]]]:
+        """返回 (向量ID, 拍摄时间, 格式, 宽, 高)，用于构建搜索过滤使用的列式元数据；image_ids 为 None 时返回全部"""
+        sql = "SELECT id, date_taken, format, width, height FROM images"
+        with self._lock:
+            if image_ids is None:
+                return [tuple(row) for row in self._conn.execute(sql)]
+            ids = [int(image_id) for image_id in image_ids]
+            rows = []
+            for start in range(0, len(ids), _CHUNK_SIZE):
+                chunk = ids[start:start + _CHUNK_SIZE]
+                cursor = self._conn.execute(f"{sql} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                rows.extend(tuple(row) for row in cursor)
+            return rows
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def timeline(self, limit: int = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """按拍摄时间倒序返回图像"""
+        sql = f"SELECT {_COLUMNS} FROM images ORDER BY date_taken DESC"
+        params: List[Any] = []
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = [limit, offset]
+        with self._lock:
+            return [_row_to_dict(row) for row in self._conn.execute(sql, params)]
+
+    def by_location(self) -> List[Dict[str, Any]]:
+        """按地理位置排序返回图像，没有位置信息的排在最后"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM images ORDER BY location IS NULL, location, date_taken DESC"
+            )
+            return [_row_to_dict(row) for row in cursor]
+
+    def path_contains_any(self, keywords: List[str]) -> List[Dict[str, Any]]:
+        """返回路径中包含任一关键字（不区分大小写）的图像"""
+        if not keywords:
+            return []
+        conditions = " OR ".join("lower(path) LIKE ?" for _ in keywords)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM images WHERE {conditions}",
+                [f"%{keyword.lower()}%" for keyword in keywords]
+            )
+            return [_row_to_dict(row) for row in cursor]
@@ -0,0 +1,63 @@
+import threading
+from typing import Dict, Tuple
+import numpy as np
+
+# 进程内共享的模型实例：搜索服务和图像处理器使用同一份模型，不重复加载
+_shared_models: Dict[str, Tuple[object, object]] = {}
+_shared_text_encoder = None
+_shared_lock = threading.Lock()
+
+
+def load_clip_model(model_path: str) -> Tuple[object, object]:
+    """
+    按模型路径加载CLIP模型及其处理器，返回已切换到评估模式的 (model, processor)
+    主进程切换模型和多进程索引的工作进程共用这一加载逻辑；
+    torch / transformers 在这里才导入，不加载模型时（例如使用替身模型的测试）不需要安装
+    """
+    from transformers import CLIPProcessor, CLIPModel, ChineseCLIPProcessor, ChineseCLIPModel
+
+    if 'chinese-clip' in model_path:
+        # 使用Chinese CLIP专用的类和处理器
+        model = ChineseCLIPModel.from_pretrained(model_path)
+        processor = ChineseCLIPProcessor.from_pretrained(model_path)
+    else:
+        # 使用标准CLIP模型
+        model = CLIPModel.from_pretrained(model_path)
+        processor = CLIPProcessor.from_pretrained(model_path)
+    
+    # 确保模型处于评估模式
+    model.eval()
+    return model, processor
+
+
+def get_shared_clip_model(model_path: str) -> Tuple[object, object]:
+    """返回进程内共享的 (model, processor)，同一模型只在首次使用时加载"""
+    with _shared_lock:
+        shared = _shared_models.get(model_path)
+        if shared is None:
+            shared = load_clip_model(model_path)
+            _shared_models[model_path] = shared
+        return shared
+
+
+def get_text_encoder():
+    """返回共享的 SentenceTransformer 文本编码模型，首次使用时才加载"""
+    global _shared_text_encoder
+    with _shared_lock:
+        if _shared_text_encoder is None:
+            from sentence_transformers import SentenceTransformer
+            _shared_text_encoder = SentenceTransformer('all-MiniLM-L6-v2')
+        return _shared_text_encoder
+
+
+def encode_pixel_values(model, pixel_values: np.ndarray) -> np.ndarray:
+    """对已预处理的 (N, C, H, W) 输入做一次前向推理，返回逐行归一化的 float32 特征矩阵"""
+    import torch
+
+    with torch.no_grad():
+        image_features = model.get_image_features(pixel_values=torch.from_numpy(pixel_values))
+    
+    features = image_features.cpu().numpy().astype('float32')
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return features / norms
@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import types
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+# 工作进程内的模型实例，由进程初始化函数加载一次，之后处理的所有分片共用
+_worker_model = None
+_worker_processor = None
+_worker_model_path = None
+_worker_cache = None
+
+_main_module_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _without_main_module():
+    """
+    启动工作进程期间把 __main__ 换成空模块
+    spawn / forkserver 启动的子进程会重新执行父进程的 __main__（服务进程中是 app.py，会导入 Flask 和整个服务），
+    换掉之后子进程只导入反序列化任务时用到的 services.parallel_indexer
+    """
+    with _main_module_lock:
+        main_module = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main_module
+
+
+class _SpawnWorkerProcess(multiprocessing.context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        with _without_main_module():
+            return multiprocessing.context.SpawnProcess._Popen(process_obj)
+
+
+class _SpawnWorkerContext(multiprocessing.context.SpawnContext):
+    Process = _SpawnWorkerProcess
+
+
+# 进程对象会被序列化传给子进程，这些类需要定义在模块顶层
+_WORKER_CONTEXTS = {'spawn': _SpawnWorkerContext}
+
+if sys.platform != 'win32':
+    class _ForkServerWorkerProcess(multiprocessing.context.ForkServerProcess):
+        @staticmethod
+        def _Popen(process_obj):
+            with _without_main_module():
+                return multiprocessing.context.ForkServerProcess._Popen(process_obj)
+
+    class _ForkServerWorkerContext(multiprocessing.context.ForkServerContext):
+        Process = _ForkServerWorkerProcess
+
+    _WORKER_CONTEXTS['forkserver'] = _ForkServerWorkerContext
+
+
+def _process_context(start_method: str):
+    """按启动方式返回进程池使用的 multiprocessing 上下文，spawn / forkserver 的工作进程不重新执行 __main__"""
+    context_class = _WORKER_CONTEXTS.get(start_method)
+    if context_class is None:
+        return multiprocessing.get_context(start_method)
+    return context_class()
+
+
+def _init_worker(model_path: str, torch_threads: int, cache_dir: Optional[str]):
+    """工作进程初始化：限制torch线程数，避免多个进程互相抢占CPU，并加载模型和只读的向量缓存"""
+    global _worker_model, _worker_processor, _worker_model_path, _worker_cache
+    import torch
+    from services.model_loader import load_clip_model
+    from services.embedding_cache import EmbeddingCache
+
+    torch.set_num_threads(torch_threads)
+    _worker_model, _worker_processor = load_clip_model(model_path)
+    _worker_model_path = model_path
+    _worker_cache = EmbeddingCache(cache_dir, enabled=cache_dir is not None)
+
+
+def _encode_shard(image_paths: List[str], batch_size: int) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]], List[str], float]:
+    """
+    在工作进程中编码一个分片
+    返回 (encoded_paths, features, metadatas, failed_paths, seconds)
+    """
+    from services.model_loader import encode_pixel_values
+    from services.image_decode import ImageSource, prepare_reduced, processor_input_size
+
+    start = time.perf_counter()
+    encoded_paths = []
+    feature_blocks = []
+    metadatas = []
+    failed = []
+
+    for offset in range(0, len(image_paths), batch_size):
+        images = []
+        batch_paths = []
+        for image_path in image_paths[offset:offset + batch_size]:
+            try:
+                # 每个文件只读取一次，哈希、元数据和解码都使用内存中的数据
+                source = ImageSource(image_path)
+                content_hash = source.content_hash if _worker_cache.enabled else None
+                with source.open() as img:
+                    metadata = source.metadata(img)
+                    if content_hash:
+                        metadata["content_hash"] = content_hash
+
+                    # 命中向量缓存的图片不需要解码和推理
+                    cached = _worker_cache.get(_worker_model_path, content_hash)
+                    if cached is not None:
+                        feature_blocks.append(cached.reshape(1, -1))
+                        encoded_paths.append(image_path)
+                        metadatas.append(metadata)
+                        continue
+
+                    image = prepare_reduced(img, processor_input_size(_worker_processor), image_path=image_path)
+                    image.load()
+                images.append(image)
+                batch_paths.append((image_path, metadata))
+            except Exception as e:
+                print(f"图像读取失败 {image_path}: {e}")
+                failed.append(image_path)
+
+        if not images:
+            continue
+
+        try:
+            inputs = _worker_processor(images=images, return_tensors="np")
+            features = encode_pixel_values(_worker_model, inputs["pixel_values"])
+        except Exception as e:
+            print(f"批量图像编码失败: {e}")
+            failed.extend(image_path for image_path, _ in batch_paths)
+            continue
+
+        feature_blocks.append(features)
+        encoded_paths.extend(image_path for image_path, _ in batch_paths)
+        metadatas.extend(metadata for _, metadata in batch_paths)
+
+    if feature_blocks:
+        all_features = np.vstack(feature_blocks)
+    else:
+        all_features = np.zeros((0, 512), dtype='float32')
+    return encoded_paths, all_features, metadatas, failed, time.perf_counter() - start
+
+
+def _shards(image_paths: Iterable[str], shard_size: int) -> Iterable[List[str]]:
+    """按顺序把路径切分为分片，image_paths 是生成器时边读取边切分"""
+    shard = []
+    for image_path in image_paths:
+        shard.append(image_path)
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def index_with_processes(image_paths: Iterable[str],
+                         model_path: str,
+                         write_fn: Callable[[List[str], np.ndarray, List[Dict[str, Any]], List[str]], None],
+                         workers: int = None,
+                         shard_size: int = None,
+                         batch_size: int = None,
+                         progress_callback: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+                         cache_dir: Optional[str] = None,
+                         total: Optional[int] = None) -> int:
+    """
+    多进程索引模式
+    把文件切分成分片交给进程池，每个工作进程只加载一次模型，
+    编码结果（向量块和元数据）返回主进程后由 write_fn 合并进索引；
+    image_paths 可以是生成器：同时在处理的分片不超过工作进程数的两倍，路径按需读取，不需要先收集完整列表；
+    total 未知时进度中的总数按已提交数量计算；
+    提供 cache_dir 时工作进程会先查询已落盘的向量缓存
+    返回成功写入的图片数量
+    """
+    workers = max(1, workers or config.INDEX_WORKERS)
+    shard_size = max(1, shard_size or config.INDEX_SHARD_SIZE)
+    batch_size = max(1, batch_size or config.ENCODE_BATCH_SIZE)
+
+    if total is None and hasattr(image_paths, '__len__'):
+        total = len(image_paths)
+    shards = _shards(image_paths, shard_size)
+    max_in_flight = workers * 2
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    mp_context = _process_context(config.INDEX_PROCESS_START_METHOD)
+
+    stats = {
+        "mode": "process",
+        "workers": workers,
+        "shardsTotal": 0,
+        "shardsDone": 0,
+        "workerSeconds": 0.0,
+        "writeSeconds": 0.0
+    }
+    submitted = 0
+    processed = 0
+    added = 0
+
+    print(f"多进程索引: {total if total is not None else '未知数量的'} 张图片，"
+          f"每个分片 {shard_size} 张，{workers} 个工作进程")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=_init_worker, initargs=(model_path, torch_threads, cache_dir)) as executor:
+        futures = {}
+        exhausted = False
+
+        while futures or not exhausted:
+            # 补充分片直到达到同时处理的上限
+            while not exhausted and len(futures) < max_in_flight:
+                shard = next(shards, None)
+                if shard is None:
+                    exhausted = True
+                    break
+                futures[executor.submit(_encode_shard, shard, batch_size)] = shard
+                submitted += len(shard)
+                stats["shardsTotal"] += 1
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = futures.pop(future)
+                try:
+                    encoded_paths, features, metadatas, failed, seconds = future.result()
+                except Exception as e:
+                    print(f"分片编码失败（{len(shard)} 张图片）: {e}")
+                    encoded_paths, features, metadatas, failed, seconds = [], None, [], list(shard), 0.0
+
+                write_start = time.perf_counter()
+                try:
+                    write_fn(encoded_paths, features, metadatas, failed)
+                    added += len(encoded_paths)
+                except Exception as e:
+                    print(f"写入索引失败: {e}")
+
+                processed += len(shard)
+                stats["shardsDone"] += 1
+                stats["workerSeconds"] = round(stats["workerSeconds"] + seconds, 3)
+                stats["writeSeconds"] = round(stats["writeSeconds"] + time.perf_counter() - write_start, 3)
+
+                if progress_callback:
+                    try:
+                        progress_callback(processed, total if total is not None else submitted, dict(stats))
+                    except Exception as e:
+                        print(f"更新处理进度失败: {e}")
+
+    return added
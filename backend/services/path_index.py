@@ -0,0 +1,91 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Set
+
+
+def _normalize_dir(path: str) -> str:
+    """目录路径去掉末尾的分隔符（根目录保持不变）"""
+    stripped = path.rstrip(os.sep)
+    return stripped if stripped else os.sep
+
+
+class PathPrefixIndex:
+    """
+    按目录组织的路径前缀索引
+    每个目录记录其下的文件和直接子目录，查询某个文件夹下的所有文件时
+    只遍历该文件夹的子树，开销与结果数量成正比，而不是与索引总量成正比
+    """
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._files: Dict[str, Set[str]] = {}
+        self._children: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        for path in paths:
+            self.add(path)
+
+    def add(self, path: str):
+        """登记一个文件路径，同时补全其所有上级目录的子目录关系"""
+        directory = _normalize_dir(os.path.dirname(path))
+        with self._lock:
+            files = self._files.get(directory)
+            if files is None:
+                self._files[directory] = files = set()
+                self._link_parents(directory)
+            files.add(path)
+
+    def _link_parents(self, directory: str):
+        while True:
+            parent = _normalize_dir(os.path.dirname(directory))
+            if parent == directory:
+                return
+            children = self._children.setdefault(parent, set())
+            if directory in children:
+                return
+            children.add(directory)
+            directory = parent
+
+    def remove(self, path: str):
+        """移除一个文件路径，目录变空后一并清理"""
+        directory = _normalize_dir(os.path.dirname(path))
+        with self._lock:
+            files = self._files.get(directory)
+            if not files:
+                return
+            files.discard(path)
+            if not files:
+                del self._files[directory]
+                self._prune(directory)
+
+    def _prune(self, directory: str):
+        """自下而上删除既没有文件也没有子目录的目录节点"""
+        while directory not in self._files and not self._children.get(directory):
+            self._children.pop(directory, None)
+            parent = _normalize_dir(os.path.dirname(directory))
+            if parent == directory:
+                return
+            children = self._children.get(parent)
+            if children is None:
+                return
+            children.discard(directory)
+            directory = parent
+
+    def rename(self, old_path: str, new_path: str):
+        with self._lock:
+            self.remove(old_path)
+            self.add(new_path)
+
+    def clear(self):
+        with self._lock:
+            self._files = {}
+            self._children = {}
+
+    def paths_under(self, folder_path: str) -> List[str]:
+        """返回位于指定文件夹（含所有子文件夹）下的全部文件路径"""
+        result = []
+        with self._lock:
+            stack = [_normalize_dir(folder_path)]
+            while stack:
+                directory = stack.pop()
+                result.extend(self._files.get(directory, ()))
+                stack.extend(self._children.get(directory, ()))
+        return result
@@ -0,0 +1,91 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class SearchResultCache:
+    """
+    搜索结果集的服务端缓存，用于分页
+    每个结果集保存排好序的向量ID和相似度（以及查询向量，需要更深的结果时不必重新编码），
+    以随机令牌为键；超过 ttl 秒未访问的结果集失效，总大小超过 max_bytes 时按最近最少使用的顺序淘汰。
+    索引内容变化后调用 clear()，旧令牌随之失效
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # 令牌 -> (结果集, 最后访问时间)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(result_set: Dict[str, Any]) -> int:
+        return sum(value.nbytes for value in result_set.values() if isinstance(value, np.ndarray))
+
+    def _expire(self, now: float):
+        """删除过期和超出大小上限的结果集（调用方持有锁）"""
+        while self._entries:
+            token, (result_set, accessed) = next(iter(self._entries.items()))
+            if now - accessed <= self.ttl and self._total_bytes <= self.max_bytes:
+                break
+            del self._entries[token]
+            self._total_bytes -= self._size(result_set)
+
+    def put(self, result_set: Dict[str, Any]) -> str:
+        """保存结果集，返回令牌"""
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._entries[token] = (result_set, now)
+            self._total_bytes += self._size(result_set)
+            self._expire(now)
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """读取结果集并刷新访问时间，不存在或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[token] = (entry[0], now)
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def replace(self, token: str, result_set: Dict[str, Any]) -> bool:
+        """用加深后的结果集替换原有结果集（令牌已失效时返回 False）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return False
+            self._total_bytes += self._size(result_set) - self._size(entry[0])
+            self._entries[token] = (result_set, now)
+            self._entries.move_to_end(token)
+            self._expire(now)
+            return token in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.time())
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -1,19 +1,50 @@
 import os
+import io
 import sys
+import hashlib
 import pickle
 import faiss
 import numpy as np
 import time
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
-from transformers import CLIPProcessor, CLIPModel, ChineseCLIPProcessor, ChineseCLIPModel
-import torch
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Callable, Optional, Union
 from PIL import Image
 from models.search_service import SearchServiceInterface
+from services.ingest_pipeline import IngestPipeline
+from services.model_loader import get_shared_clip_model, get_text_encoder, encode_pixel_values
+from services import parallel_indexer, ann_index
+from services.file_manifest import FileManifest, compute_file_hash
+from services.embedding_cache import EmbeddingCache
+from services.path_index import PathPrefixIndex
+from services.index_snapshot import IndexSnapshotStore
+from services.metadata_store import MetadataStore
+from services.image_decode import (
+    ImageSource, prepare_reduced, encode_thumbnail, processor_input_size, preferred_thumbnail_format, thumbnail_tier
+)
+from services.thumbnail_cache import ThumbnailCache
+from services.text_embedding_cache import TextEmbeddingCache, normalize_query
+from services.metadata_filter import MetadataColumns, BitmapSelector
+from services.result_cache import SearchResultCache
+import config
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# 搜索结果中可以选择返回的字段；"metadata.<键>" 表示只返回元数据中的这些键
+RESULT_FIELDS = ("id", "path", "similarity", "metadata")
+
+
+def parse_fields(raw) -> Optional[Tuple[str, ...]]:
+    """校验搜索结果的字段投影（列表或逗号分隔的字符串），未指定时返回 None（全部字段）"""
+    if not raw:
+        return None
+    fields = raw.split(",") if isinstance(raw, str) else raw
+    fields = tuple(field.strip() for field in fields if field and field.strip())
+    for field in fields:
+        if field not in RESULT_FIELDS and not (field.startswith("metadata.") and len(field) > len("metadata.")):
+            raise ValueError(f"未知的结果字段: {field}")
+    return fields or None
+
 class SemanticSearchService(SearchServiceInterface):
     """语义搜索服务实现"""
     
@@ -21,22 +52,53 @@ class SemanticSearchService(SearchServiceInterface):
         self.index_path = index_path
         self.metadata_path = metadata_path
         self.model_info_path = "model_info.pkl"  # 新增：存储模型信息
+        self.manifest_path = "file_manifest.pkl"  # 已索引文件的指纹清单
+        
+        # 索引、元数据和模型信息作为一个版本化快照整体保存（旧版本的三个文件只在迁移时读取）
+        self.snapshot_store = IndexSnapshotStore(config.INDEX_SNAPSHOT_DIR, keep=config.INDEX_SNAPSHOT_KEEP)
         
         # 当前使用的模型名称
         self.current_model_name = "openai/clip-vit-base-patch32"
         
-        # 加载文本编码模型
-        self.text_encoder = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # 加载CLIP模型用于图像特征提取
-        self.clip_model = CLIPModel.from_pretrained(self.current_model_name)
-        self.clip_processor = CLIPProcessor.from_pretrained(self.current_model_name)
-        self.clip_model.eval()
+        # 加载CLIP模型用于图像特征提取（与图像处理器共享同一实例）
+        self.clip_model, self.clip_processor = get_shared_clip_model(self.current_model_name)
         
         # 初始化FAISS索引
+        # 向量以稳定的64位ID写入索引，删除时只记录墓碑，由后台压缩统一清理
         self.index = None
-        self.image_metadata = {}  # 存储图像元数据
-        self.image_paths = []  # 存储图像路径列表，用于索引映射
+        self._mmap_index = None  # 以内存映射方式打开的只读索引，首次修改前复制到内存
+        # 当前索引的类型（FAISS factory 字符串）；向量数量达到阈值后在后台迁移为 config.INDEX_FACTORY
+        self.index_factory = "Flat"
+        self._index_generation = 0  # 索引被整体替换（清空、重建）时递增，后台迁移据此放弃过期的结果
+        self._migration_thread = None
+        self.metadata_store = MetadataStore(config.METADATA_DB_PATH)  # 图像元数据，主键即向量ID
+        self.path_to_id: Dict[str, int] = {}  # 图像路径 -> 向量ID
+        self.id_to_path: Dict[int, str] = {}  # 向量ID -> 图像路径
+        self.next_id = 0
+        self.tombstones = set()  # 已删除但仍留在索引中的向量ID
+        self.path_index = PathPrefixIndex()  # 按文件夹查找已索引图像
+        self._metadata_columns: Optional[MetadataColumns] = None  # 搜索过滤用的列式元数据，首次过滤搜索时构建
+        self._tombstone_selector = None  # (墓碑集合, 墓碑数量, 排除墓碑的选择器)，墓碑变化后重新构建
+        self._compaction_thread = None
+        self.file_manifest = FileManifest(self.manifest_path, use_content_hash=config.MANIFEST_CONTENT_HASH)
+        
+        # 以 (文件内容哈希, 模型名称) 为键的向量缓存
+        self.embedding_cache = EmbeddingCache(config.EMBEDDING_CACHE_DIR, enabled=config.EMBEDDING_CACHE_ENABLED)
+        
+        # 文本查询向量的LRU缓存，切换模型时清空
+        self.text_embedding_cache = TextEmbeddingCache(config.TEXT_EMBEDDING_CACHE_SIZE)
+        
+        # 分页搜索的结果集缓存，索引内容变化时清空
+        self.result_cache = SearchResultCache(config.RESULT_CACHE_MAX_MB * 1024 * 1024, config.RESULT_CACHE_TTL)
+        
+        # 缩略图缓存，INGEST_THUMBNAILS 开启时入库阶段顺便生成
+        self.thumbnail_cache = ThumbnailCache(config.THUMBNAIL_CACHE_DIR,
+                                              max_bytes=config.THUMBNAIL_CACHE_MAX_MB * 1024 * 1024)
+        
+        # 入库流水线写入索引与搜索线程之间的互斥锁
+        self.index_lock = threading.RLock()
+        # 保证同一时间只有一次保存（手动保存或检查点）在写文件
+        self._save_lock = threading.Lock()
         
         # 尝试加载现有的索引
         self.load_index()
@@ -44,10 +106,21 @@ class SemanticSearchService(SearchServiceInterface):
     def load_index(self):
         """加载已保存的索引"""
         try:
-            if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-                # 检查模型信息
+            snapshot = self.snapshot_store.latest(checksums=config.SNAPSHOT_VERIFY_CHECKSUMS)
+            if snapshot is not None:
+                snapshot_path, snapshot_manifest = snapshot
+                index_file = os.path.join(snapshot_path, "index.faiss")
+                metadata_file = os.path.join(snapshot_path, "metadata.pkl")
+                index_model_name = snapshot_manifest.get("model_name", "")
+            elif os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
+                # 旧版本直接保存在工作目录中的索引文件，下次保存时写成快照
+                index_file = self.index_path
+                metadata_file = self.metadata_path
                 index_model_name = self._get_index_model_name()
-                
+            else:
+                index_file = None
+            
+            if index_file is not None:
                 if index_model_name and index_model_name != self.current_model_name:
                     print(f"⚠️  检测到模型不匹配:")
                     print(f"   索引模型: {index_model_name}")
@@ -55,111 +128,480 @@ class SemanticSearchService(SearchServiceInterface):
                     print("   需要重新构建索引以确保搜索准确性")
                     
                     # 创建新的空索引
-                    dimension = 512
-                    self.index = faiss.IndexFlatIP(dimension)
-                    self.image_metadata = {}
-                    self.image_paths = []
+                    self._reset_index()
                     return
                 
                 # 加载索引
-                self.index = faiss.read_index(self.index_path)
+                self.index = self._read_index_file(index_file)
                 
-                with open(self.metadata_path, 'rb') as f:
-                    self.image_metadata = pickle.load(f)
+                with open(metadata_file, 'rb') as f:
+                    data = pickle.load(f)
                 
-                # 重建图像路径列表
-                self.image_paths = list(self.image_metadata.keys())
+                if isinstance(data, dict) and data.get("version") == 3:
+                    self.next_id = data["next_id"]
+                    self.index_factory = data.get("index_factory", "Flat")
+                else:
+                    # 旧版本把元数据整体保存在pickle中，导入SQLite
+                    if isinstance(data, dict) and data.get("version") == 2:
+                        images, ids = data["images"], data["ids"]
+                        self.next_id = data["next_id"]
+                    else:
+                        # 更早的版本只保存元数据字典，其顺序即索引行顺序，迁移为按ID寻址的索引
+                        images = data
+                        ids = self._migrate_positional_index(list(data.keys()))
+                    self.metadata_store.clear()
+                    self.metadata_store.upsert_many((image_id, path, images.get(path)) for path, image_id in ids.items())
+                    print(f"已将 {len(ids)} 条图像元数据导入 {config.METADATA_DB_PATH}")
                 
-                print(f"索引加载成功，包含 {self.index.ntotal} 张图像，使用模型: {self.current_model_name}")
+                self.id_to_path = dict(self.metadata_store.id_path_pairs())
+                self.path_to_id = {path: image_id for image_id, path in self.id_to_path.items()}
+                self._reconcile_ids()
+                self.path_index = PathPrefixIndex(self.path_to_id)
+                
+                # 加载文件指纹清单，丢弃不在索引中的记录（例如上次保存前中断）
+                self.file_manifest.load()
+                self.file_manifest.entries = {
+                    path: fingerprint for path, fingerprint in self.file_manifest.entries.items()
+                    if path in self.path_to_id
+                }
+                
+                print(f"索引加载成功，包含 {self.image_count()} 张图像，使用模型: {self.current_model_name}")
+                
+                # 配置的索引类型有变化时在后台迁移
+                self._schedule_index_migration()
             else:
                 print("未找到现有索引，将创建新的索引")
-                # 创建新的FAISS索引（CLIP模型的特征维度是512）
-                dimension = 512
-                self.index = faiss.IndexFlatIP(dimension)
+                self._reset_index()
         except Exception as e:
             print(f"加载索引失败: {e}")
             # 创建新的索引
-            dimension = 512
-            self.index = faiss.IndexFlatIP(dimension)
+            self._reset_index()
+    
+    def _read_index_file(self, index_file: str):
+        """读取FAISS索引；启用 INDEX_MMAP 时以内存映射方式打开，启动时不把整个索引读入内存"""
+        if not config.INDEX_MMAP:
+            return faiss.read_index(index_file)
+        
+        # IO_FLAG_MMAP_IFC 对扁平索引的向量数据做零拷贝映射，旧版本faiss只有 IO_FLAG_MMAP
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            index = faiss.read_index(index_file, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"索引无法以内存映射方式打开，改为读入内存: {e}")
+            return faiss.read_index(index_file)
+        self._mmap_index = index
+        print(f"索引以内存映射方式打开: {index_file}")
+        return index
+    
+    def _ensure_writable_index(self):
+        """内存映射的索引是只读的，写入或删除向量前先复制一份到内存中（调用方需持有 index_lock）"""
+        if self._mmap_index is not None and self.index is self._mmap_index:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            print("内存映射的索引已复制到内存，开始接受写入")
+        self._mmap_index = None
+    
+    def _new_index(self, dimension: int = 512):
+        """
+        创建按向量ID寻址的空索引（CLIP模型的特征维度是512）
+        新索引总是精确搜索的 Flat 索引，向量数量达到 INDEX_TRAIN_THRESHOLD 后再迁移为配置的索引类型
+        """
+        return ann_index.create_index(dimension, "Flat")
+    
+    def _reset_index(self):
+        """清空索引及所有ID映射"""
+        with self.index_lock:
+            self.index = self._new_index()
+            self.index_factory = "Flat"
+            self._index_generation += 1
+            self.metadata_store.clear()
+            self.path_to_id = {}
+            self.id_to_path = {}
+            self.next_id = 0
+            self.tombstones = set()
+            self.path_index.clear()
+            self._metadata_columns = None
+            self.result_cache.clear()
+    
+    def _migrate_positional_index(self, paths: List[str]) -> Dict[str, int]:
+        """
+        把旧版本按行号寻址的索引转换为 IndexIDMap2，行号直接作为向量ID
+        返回 路径 -> 向量ID；没有对应向量的路径无法被搜索到，直接丢弃
+        """
+        count = min(len(paths), self.index.ntotal)
+        new_index = self._new_index(self.index.d)
+        if count > 0:
+            new_index.add_with_ids(self.index.reconstruct_n(0, count), np.arange(count, dtype='int64'))
+        
+        self.index = new_index
+        self.next_id = count
+        print(f"已将旧版本索引迁移为ID映射索引，共 {count} 张图像")
+        return {path: i for i, path in enumerate(paths[:count])}
+    
+    def _index_ids(self) -> np.ndarray:
+        """返回索引中实际存在的全部向量ID"""
+        return ann_index.index_ids(self.index)
+    
+    def _reconcile_ids(self):
+        """
+        核对元数据库与索引快照中的向量ID（元数据库可能比快照更新）：
+        缺少向量的图像（快照之后才写入）移除，没有图像对应的向量（快照之后被删除）记为墓碑
+        """
+        index_ids = set(self._index_ids().tolist())
+        orphaned = [image_id for image_id in self.id_to_path if image_id not in index_ids]
+        for image_id in orphaned:
+            del self.path_to_id[self.id_to_path.pop(image_id)]
+        if orphaned:
+            self.metadata_store.delete_ids(orphaned)
+            print(f"移除 {len(orphaned)} 条没有对应向量的元数据")
+        self.tombstones = index_ids - set(self.id_to_path)
+        if index_ids:
+            self.next_id = max(self.next_id, max(index_ids) + 1)
+    
+    @property
+    def image_paths(self) -> List[str]:
+        """当前索引中的所有图像路径（与索引行顺序无关）"""
+        return list(self.path_to_id.keys())
+    
+    def image_count(self) -> int:
+        """索引中可被搜索到的图像数量（不含墓碑）"""
+        return len(self.path_to_id)
     
     def save_index(self):
-        """保存索引到文件"""
+        """保存索引到文件，保存前先清理墓碑"""
+        with self._save_lock:
+            self._write_snapshot(compact=True)
+    
+    def checkpoint(self) -> bool:
+        """
+        在后台线程保存检查点（索引、元数据、文件清单和向量缓存），不清理墓碑以缩短持锁时间
+        上一次保存尚未完成时直接跳过，返回是否启动了新的检查点
+        """
+        if not self._save_lock.acquire(blocking=False):
+            return False
+        
+        def run():
+            try:
+                self._write_snapshot(compact=False)
+            finally:
+                self._save_lock.release()
+        
+        threading.Thread(target=run, name="index-checkpoint", daemon=True).start()
+        return True
+    
+    def _write_snapshot(self, compact: bool):
         try:
-            faiss.write_index(self.index, self.index_path)
+            with self.index_lock:
+                if compact:
+                    self.compact_index()
+                index_bytes = faiss.serialize_index(self.index)
+                # 元数据和ID映射已实时写入SQLite，快照中只需记录下一个可用的向量ID
+                data = {
+                    "version": 3,
+                    "next_id": self.next_id,
+                    "index_factory": self.index_factory
+                }
+                image_count = self.image_count()
             
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.image_metadata, f)
+            # 序列化在锁内完成，写文件时不阻塞搜索和入库；
+            # 索引、元数据和模型信息写入同一个快照目录，整体切换，中途中断不会留下不匹配的文件
+            snapshot_path = self.snapshot_store.write({
+                "index.faiss": index_bytes,
+                "metadata.pkl": pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),
+                "model_info.pkl": pickle.dumps(self._model_info())
+            }, {"model_name": self.current_model_name, "image_count": image_count})
             
-            # 保存模型信息
-            self._save_model_info()
+            # 保存文件指纹清单和向量缓存
+            self.file_manifest.save()
+            self.embedding_cache.flush()
             
-            print(f"索引已保存，包含 {self.index.ntotal} 张图像，使用模型: {self.current_model_name}")
+            print(f"索引已保存到 {snapshot_path}，包含 {image_count} 张图像，使用模型: {self.current_model_name}")
         except Exception as e:
             print(f"保存索引失败: {e}")
     
     def encode_text(self, text: str) -> np.ndarray:
-        """将文本编码为向量"""
+        """将文本编码为向量；同一模型下相同的查询直接从缓存返回，不做模型推理"""
+        return self.encode_texts([text])[0]
+    
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        批量编码文本，返回形状为 (N, dimension) 的矩阵
+        缓存中没有的文本在一次前向推理中一起编码；编码失败时对应的行为零向量
+        """
+        texts = [normalize_query(text) for text in texts]
+        features = [self.text_embedding_cache.get(self.current_model_name, text) for text in texts]
+        # 同一批次中重复的文本只编码一次
+        pending = list(dict.fromkeys(text for text, cached in zip(texts, features) if cached is None))
+        if pending:
+            try:
+                print(f"编码文本: {pending}")
+                
+                # 最简化处理：直接使用原始查询文本，不进行任何翻译或转换
+                # 这样可以避免所有潜在的问题
+                import torch
+                inputs = self.clip_processor(text=pending, return_tensors="pt", padding=True)
+                
+                with torch.no_grad():
+                    text_features = self.clip_model.get_text_features(**inputs)
+                
+                # 将特征转换为numpy数组并按行归一化
+                encoded = text_features.cpu().numpy().reshape(len(pending), -1)
+                encoded = (encoded / np.linalg.norm(encoded, axis=1, keepdims=True)).astype('float32')
+                
+                print(f"文本编码完成，特征维度: {encoded.shape}")
+                for text, vector in zip(pending, encoded):
+                    self.text_embedding_cache.put(self.current_model_name, text, vector)
+                encoded_by_text = dict(zip(pending, encoded))
+                features = [encoded_by_text[text] if cached is None else cached
+                            for text, cached in zip(texts, features)]
+            except Exception as e:
+                print(f"文本编码失败: {e}")
+                import traceback
+                traceback.print_exc()
+        
+        # 编码失败的文本返回零向量
+        dimension = next((len(vector) for vector in features if vector is not None), 512)
+        return np.stack([vector if vector is not None else np.zeros(dimension, dtype='float32')
+                         for vector in features])
+    
+    def encode_image(self, image_path: str) -> np.ndarray:
+        """将图像编码为向量"""
         try:
-            print(f"编码文本: '{text}'")
+            source, content_hash, cached = self._source_with_cache(image_path)
+            if cached is not None:
+                return cached
             
-            # 最简化处理：直接使用原始查询文本，不进行任何翻译或转换
-            # 这样可以避免所有潜在的问题
-            inputs = self.clip_processor(text=[text], return_tensors="pt", padding=True)
+            with source.open() as img:
+                image = self._decode_for_model(img, image_path)
+            features = self._encode_pil_images([image])[0]
+            self.embedding_cache.put(self.current_model_name, content_hash, features)
+            return features
+        except Exception as e:
+            print(f"图像编码失败 {image_path}: {e}")
+            return np.zeros(512, dtype='float32')  # 返回零向量
+    
+    def encode_image_bytes(self, data: bytes) -> np.ndarray:
+        """
+        将内存中的图片数据（如上传的文件）编码为向量，不写临时文件
+        内容哈希与入库时的文件哈希相同，上传已入库的图片时直接使用向量缓存（查询图片不写入缓存）
+        """
+        try:
+            content_hash = hashlib.blake2b(data, digest_size=16).hexdigest() if self.embedding_cache.enabled else None
+            cached = self.embedding_cache.get(self.current_model_name, content_hash)
+            if cached is not None:
+                return cached
             
-            with torch.no_grad():
-                text_features = self.clip_model.get_text_features(**inputs)
+            with Image.open(io.BytesIO(data)) as img:
+                return self.encode_pil_image(img)
+        except Exception as e:
+            print(f"上传图像编码失败 ({len(data)} 字节): {e}")
+            return np.zeros(512, dtype='float32')
+    
+    def encode_pil_image(self, img: Image.Image) -> np.ndarray:
+        """将已打开的 PIL 图像按模型输入尺寸缩小解码后编码为向量"""
+        image = self._decode_for_model(img, getattr(img, "filename", "") or "<memory>")
+        return self._encode_pil_images([image])[0]
+    
+    def _encode_query_image(self, query_image: Union[str, bytes, Image.Image]) -> np.ndarray:
+        """查询图像可以是文件路径、图片数据或已打开的 PIL 图像"""
+        if isinstance(query_image, (bytes, bytearray, memoryview)):
+            return self.encode_image_bytes(bytes(query_image))
+        if isinstance(query_image, Image.Image):
+            try:
+                return self.encode_pil_image(query_image)
+            except Exception as e:
+                print(f"图像编码失败: {e}")
+                return np.zeros(512, dtype='float32')
+        return self.encode_image(query_image)
+    
+    @property
+    def text_encoder(self):
+        """文本编码模型（SentenceTransformer），首次使用时才加载"""
+        return get_text_encoder()
+    
+    def _decode_for_model(self, img: Image.Image, image_path: str,
+                          thumbnail_size: Tuple[int, int] = None) -> Image.Image:
+        """把已打开的图像按模型输入尺寸（以及可选的缩略图尺寸）缩小解码"""
+        reduced = prepare_reduced(img, processor_input_size(self.clip_processor),
+                                  image_path=image_path, thumbnail_size=thumbnail_size)
+        reduced.load()
+        return reduced
+    
+    def _encode_pil_images(self, images: List[Image.Image]) -> np.ndarray:
+        """对一批已解码的图像做一次前向推理，返回归一化后的 (N, dimension) 特征矩阵"""
+        inputs = self.clip_processor(images=images, return_tensors="np")
+        return self._encode_pixel_values(inputs["pixel_values"])
+    
+    def _preprocess_image(self, image: Image.Image) -> np.ndarray:
+        """将单张图像预处理为模型输入 (C, H, W)"""
+        inputs = self.clip_processor(images=image, return_tensors="np")
+        return inputs["pixel_values"][0]
+    
+    def _encode_pixel_values(self, pixel_values: np.ndarray) -> np.ndarray:
+        """对已预处理的 (N, C, H, W) 输入做一次前向推理并逐行归一化"""
+        return encode_pixel_values(self.clip_model, pixel_values)
+    
+    def _content_hash(self, image_path: str, source: ImageSource = None) -> Optional[str]:
+        """
+        获取文件内容哈希，用作向量缓存的键
+        文件大小和修改时间与清单记录一致时直接复用清单中的哈希；
+        已读入内存的文件（source）直接对内存中的数据计算，不再读取文件
+        """
+        if not self.embedding_cache.enabled:
+            return None
+        stat = source.stat if source is not None else os.stat(image_path)
+        fingerprint = self.file_manifest.entries.get(image_path)
+        if (fingerprint is not None and fingerprint.content_hash
+                and fingerprint.size == stat.st_size and fingerprint.mtime_ns == stat.st_mtime_ns):
+            return fingerprint.content_hash
+        return source.content_hash if source is not None else compute_file_hash(image_path)
+    
+    def _source_with_cache(self, image_path: str) -> Tuple[Optional[ImageSource], Optional[str], Optional[np.ndarray]]:
+        """
+        查询向量缓存，只在未命中时才读取文件
+        文件大小和修改时间与清单记录一致时先用清单中的哈希查询，命中时不读取文件（返回的 source 为 None）；
+        否则读入文件，用内容哈希再查一次。返回 (source, 内容哈希, 缓存的向量)
+        """
+        content_hash = None
+        fingerprint = self.file_manifest.entries.get(image_path)
+        if self.embedding_cache.enabled and fingerprint is not None and fingerprint.content_hash:
+            stat = os.stat(image_path)
+            if fingerprint.size == stat.st_size and fingerprint.mtime_ns == stat.st_mtime_ns:
+                content_hash = fingerprint.content_hash
+                cached = self.embedding_cache.get(self.current_model_name, content_hash)
+                if cached is not None:
+                    return None, content_hash, cached
+        
+        source = ImageSource(image_path)
+        if content_hash is not None:
+            return source, content_hash, None
+        content_hash = self._content_hash(image_path, source)
+        return source, content_hash, self.embedding_cache.get(self.current_model_name, content_hash)
+    
+    def _preprocess_for_ingest(self, image_path: str) -> Tuple[Optional[np.ndarray], Dict[str, Any], Optional[np.ndarray]]:
+        """
+        入库流水线的解码阶段：每个文件只读取一次
+        内容哈希、元数据（只解析文件头）、模型输入和可选的缩略图都来自同一份内存数据和同一次解码；
+        命中向量缓存且不需要生成缩略图时不解码像素
+        """
+        source = ImageSource(image_path)
+        content_hash = self._content_hash(image_path, source)
+        
+        with source.open() as img:
+            metadata = source.metadata(img)
+            if content_hash:
+                metadata["content_hash"] = content_hash
             
-            # 将特征转换为numpy数组并归一化
-            features = text_features.squeeze().cpu().numpy()
-            features = features / np.linalg.norm(features)
+            # 入库时生成默认档位、首选格式的缩略图，其他档位和格式之后可以从它缩放得到
+            thumbnail_size = None
+            if config.INGEST_THUMBNAILS:
+                thumbnail_format = preferred_thumbnail_format()
+                tier = thumbnail_tier(config.THUMBNAIL_SIZE)
+                thumbnail_size = (tier, tier)
+                if self.thumbnail_cache.contains(image_path, thumbnail_size, thumbnail_format, stat=source.stat):
+                    thumbnail_size = None
             
-            print(f"文本编码完成，特征维度: {features.shape}, 范数: {np.linalg.norm(features):.4f}")
-            return features.astype('float32')
+            cached = self.embedding_cache.get(self.current_model_name, content_hash)
+            if cached is not None and thumbnail_size is None:
+                return None, metadata, cached
             
-        except Exception as e:
-            print(f"文本编码失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return np.zeros(512, dtype='float32')  # 返回零向量
+            image = self._decode_for_model(img, image_path, thumbnail_size)
+        
+        if thumbnail_size is not None:
+            self.thumbnail_cache.put(image_path, thumbnail_size, encode_thumbnail(image, thumbnail_size, thumbnail_format),
+                                     thumbnail_format, stat=source.stat)
+        if cached is not None:
+            return None, metadata, cached
+        return self._preprocess_image(image), metadata, None
     
-    def encode_image(self, image_path: str) -> np.ndarray:
-        """将图像编码为向量"""
-        try:
-            image = Image.open(image_path).convert('RGB')
-            inputs = self.clip_processor(images=image, return_tensors="pt")
+    def _create_pipeline(self, preprocess_fn, write_fn, batch_size: int = None,
+                         progress_callback: Optional[Callable] = None) -> IngestPipeline:
+        """创建入库流水线，各阶段的并发度和队列深度取自 config"""
+        return IngestPipeline(
+            preprocess_fn=preprocess_fn,
+            infer_fn=self._encode_pixel_values,
+            write_fn=write_fn,
+            batch_size=batch_size,
+            progress_callback=progress_callback
+        )
+    
+    def iter_encoded_batches(self, image_paths: List[str], batch_size: int = None) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+        """
+        按批次编码图像
+        每个批次产出 (batch_paths, encoded_paths, features)，
+        features 的行与 encoded_paths 一一对应，无法读取的图像不会出现在 encoded_paths 中
+        """
+        batch_size = batch_size or config.ENCODE_BATCH_SIZE
+        
+        for start in range(0, len(image_paths), batch_size):
+            batch_paths = image_paths[start:start + batch_size]
+            images = []
+            image_hashes = []
+            decoded_paths = []
+            cached = {}
+            for image_path in batch_paths:
+                try:
+                    source, content_hash, vector = self._source_with_cache(image_path)
+                    if vector is not None:
+                        cached[image_path] = vector
+                        continue
+                    with source.open() as img:
+                        images.append(self._decode_for_model(img, image_path))
+                    image_hashes.append(content_hash)
+                    decoded_paths.append(image_path)
+                except Exception as e:
+                    print(f"图像读取失败 {image_path}: {e}")
             
-            with torch.no_grad():
-                image_features = self.clip_model.get_image_features(**inputs)
+            encoded = dict(cached)
+            if images:
+                try:
+                    features = self._encode_pil_images(images)
+                    for i, image_path in enumerate(decoded_paths):
+                        encoded[image_path] = features[i]
+                        self.embedding_cache.put(self.current_model_name, image_hashes[i], features[i])
+                except Exception as e:
+                    print(f"批量图像编码失败: {e}")
             
-            # 将特征转换为numpy数组并归一化
-            features = image_features.squeeze().cpu().numpy()
-            features = features / np.linalg.norm(features)
-            return features.astype('float32')
-        except Exception as e:
-            print(f"图像编码失败 {image_path}: {e}")
-            return np.zeros(512, dtype='float32')  # 返回零向量
+            # 按原始顺序输出
+            encoded_paths = [image_path for image_path in batch_paths if image_path in encoded]
+            if not encoded_paths:
+                yield batch_paths, [], np.zeros((0, 512), dtype='float32')
+                continue
+            
+            yield batch_paths, encoded_paths, np.vstack([encoded[image_path] for image_path in encoded_paths])
+    
+    def encode_images(self, image_paths: List[str], batch_size: int = None) -> Tuple[np.ndarray, List[str]]:
+        """
+        批量将图像编码为向量
+        返回 (features, encoded_paths)，无法读取的图像会被跳过
+        """
+        all_features = []
+        all_paths = []
+        for _, encoded_paths, features in self.iter_encoded_batches(image_paths, batch_size):
+            if encoded_paths:
+                all_features.append(features)
+                all_paths.extend(encoded_paths)
+        
+        if not all_features:
+            return np.zeros((0, 512), dtype='float32'), []
+        return np.vstack(all_features), all_paths
     
     def add_image(self, image_path: str) -> bool:
         """添加图像到索引"""
         try:
             # 检查图像是否已存在于索引中
-            if image_path in self.image_metadata:
+            if image_path in self.path_to_id:
                 print(f"图像已存在于索引中: {image_path}")
                 return True
             
-            # 编码图像
-            features = self.encode_image(image_path)
-            features = features.reshape(1, -1)  # 调整形状为 (1, dimension)
-            
-            # 添加到FAISS索引
-            self.index.add(features)
+            # 读取一次文件，同时得到模型输入和元数据，再编码图像
+            pixel_values, metadata, cached = self._preprocess_for_ingest(image_path)
+            if cached is not None:
+                features = cached.reshape(1, -1)
+            else:
+                features = self._encode_pixel_values(pixel_values[np.newaxis])  # 形状为 (1, dimension)
             
-            # 保存元数据
-            from services.image_processor_service import ImageFeatureExtractor
-            processor = ImageFeatureExtractor()
-            metadata = processor.extract_metadata(image_path)
-            self.image_metadata[image_path] = metadata
-            self.image_paths.append(image_path)
+            # 添加到FAISS索引并保存元数据
+            self.add_embeddings([image_path], features, [metadata])
             
             print(f"图像已添加到索引: {image_path}")
             return True
@@ -167,63 +609,499 @@ class SemanticSearchService(SearchServiceInterface):
             print(f"添加图像失败 {image_path}: {e}")
             return False
     
+    def add_embeddings(self, image_paths: List[str], features: np.ndarray, metadatas: List[Dict[str, Any]]):
+        """将一批已编码的向量及其元数据一次性写入索引"""
+        with self.index_lock:
+            # 已在索引中的路径（例如文件修改后重新编码）先把旧向量记为墓碑
+            replaced_ids = []
+            for image_path in image_paths:
+                old_id = self.path_to_id.get(image_path)
+                if old_id is not None:
+                    self.tombstones.add(old_id)
+                    del self.id_to_path[old_id]
+                    replaced_ids.append(old_id)
+            
+            ids = np.arange(self.next_id, self.next_id + len(image_paths), dtype='int64')
+            self.next_id += len(image_paths)
+            self._ensure_writable_index()
+            self.index.add_with_ids(features, ids)
+            for image_path, image_id in zip(image_paths, ids.tolist()):
+                self.path_to_id[image_path] = image_id
+                self.id_to_path[image_id] = image_path
+                self.path_index.add(image_path)
+            
+            # 整个批次一次写入元数据库，同一路径的旧记录被替换
+            self.metadata_store.upsert_many(zip(ids.tolist(), image_paths, metadatas))
+            if self._metadata_columns is not None:
+                self._metadata_columns.remove(replaced_ids)
+                self._metadata_columns.update(self.metadata_store.filter_rows(ids.tolist()))
+            self.result_cache.clear()
+        
+        # 记录文件指纹供增量重新索引使用，并把新向量写入缓存
+        for i, (image_path, metadata) in enumerate(zip(image_paths, metadatas)):
+            content_hash = metadata.get("content_hash") if metadata else None
+            self.file_manifest.record(image_path, content_hash=content_hash)
+            self.embedding_cache.put(self.current_model_name, content_hash, features[i])
+        
+        self._schedule_index_migration()
+    
+    def add_images(self, image_paths: Iterable[str], batch_size: int = None,
+                   progress_callback: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+                   workers: int = None, replace_existing: bool = False) -> int:
+        """
+        批量添加图像到索引
+        默认通过入库流水线并行解码，每个批次只做一次模型前向推理，并一次性写入FAISS；
+        image_paths 可以是生成器（例如目录扫描器），流水线边接收路径边编码；
+        workers > 1 时改用多进程模式，按分片交给进程池编码后再合并到索引
+        replace_existing 为 True 时已在索引中的图像也会重新编码并替换旧向量（用于文件被修改的情况）
+        progress_callback(processed, total, stage_stats) 在每个批次写入后调用
+        返回成功添加的图像数量
+        """
+        workers = workers or config.INDEX_WORKERS
+        submitted = [0]
+        
+        def pending_paths():
+            # 默认跳过已存在于索引中的图像，同时去除重复路径
+            seen = set()
+            for image_path in image_paths:
+                if image_path in seen or (not replace_existing and image_path in self.path_to_id):
+                    continue
+                seen.add(image_path)
+                submitted[0] += 1
+                yield image_path
+        
+        def write_batch(paths, features, metadatas, failed):
+            if paths:
+                self.add_embeddings(paths, features, metadatas)
+        
+        if workers > 1:
+            # 多进程模式边读取路径边切分分片；工作进程直接读取已落盘的向量缓存
+            self.embedding_cache.flush()
+            added = parallel_indexer.index_with_processes(
+                pending_paths(), self.current_model_name, write_batch,
+                workers=workers, batch_size=batch_size, progress_callback=progress_callback,
+                cache_dir=self.embedding_cache.cache_dir if self.embedding_cache.enabled else None
+            )
+        else:
+            pipeline = self._create_pipeline(self._preprocess_for_ingest, write_batch, batch_size, progress_callback)
+            added = pipeline.run(pending_paths())
+        
+        print(f"批量添加完成: {added}/{submitted[0]} 张图像已添加到索引")
+        return added
+    
     def remove_image(self, image_path: str) -> bool:
         """从索引中移除图像"""
         try:
-            if image_path not in self.image_metadata:
+            if image_path not in self.path_to_id:
                 print(f"图像不在索引中: {image_path}")
                 return False
             
-            # 获取图像在索引中的位置
-            idx = self.image_paths.index(image_path)
-            
-            # 从元数据和路径列表中移除
-            del self.image_metadata[image_path]
-            del self.image_paths[idx]
-            
-            # 注意：FAISS不直接支持删除向量，这里简化处理
-            # 在实际应用中，可能需要重建索引或使用其他策略
-            print(f"图像已从索引中移除: {image_path} (索引重建)")
-            
-            # 重建索引
-            self.rebuild_index()
-            
+            self.remove_images([image_path])
+            print(f"图像已从索引中移除: {image_path}")
             return True
         except Exception as e:
             print(f"移除图像失败 {image_path}: {e}")
             return False
     
+    def remove_images(self, image_paths: List[str]) -> int:
+        """
+        批量从索引中移除图像
+        只删除ID映射并把向量ID记为墓碑，搜索时过滤；墓碑累积到阈值后在后台压缩索引
+        返回实际移除的图像数量
+        """
+        removed = []
+        removed_ids = []
+        with self.index_lock:
+            for path in image_paths:
+                image_id = self.path_to_id.pop(path, None)
+                if image_id is None:
+                    continue
+                self.id_to_path.pop(image_id, None)
+                self.path_index.remove(path)
+                self.tombstones.add(image_id)
+                removed.append(path)
+                removed_ids.append(image_id)
+        
+        if not removed:
+            return 0
+        
+        self.metadata_store.delete_ids(removed_ids)
+        if self._metadata_columns is not None:
+            self._metadata_columns.remove(removed_ids)
+        self.result_cache.clear()
+        for path in removed:
+            self.file_manifest.remove(path)
+        self._schedule_compaction()
+        
+        print(f"已从索引中移除 {len(removed)} 张图像")
+        return len(removed)
+    
+    def remove_folder(self, folder_path: str) -> int:
+        """
+        移除指定文件夹（含子文件夹）下的所有图像
+        通过路径前缀索引直接找到该文件夹下的图像，不需要遍历全部元数据
+        返回实际移除的图像数量
+        """
+        return self.remove_images(self.path_index.paths_under(folder_path))
+    
+    def compact_index(self) -> int:
+        """从FAISS索引中真正删除墓碑对应的向量，返回删除的向量数量"""
+        if self.tombstones and not ann_index.supports_remove(self.index):
+            # HNSW 不支持删除，用存活的向量重建同类型的索引
+            removed = len(self.tombstones)
+            if not self._migrate_index(self.index_factory):
+                return 0
+            print(f"索引压缩完成，清理 {removed} 个已删除的向量")
+            return removed
+        
+        with self.index_lock:
+            if not self.tombstones:
+                return 0
+            ids = np.fromiter(self.tombstones, dtype='int64', count=len(self.tombstones))
+            self._ensure_writable_index()
+            removed = self.index.remove_ids(ids)
+            self.tombstones = set()
+        print(f"索引压缩完成，清理 {removed} 个已删除的向量")
+        return removed
+    
+    def _schedule_compaction(self):
+        """墓碑数量超过阈值时启动后台线程压缩索引"""
+        threshold = max(config.COMPACT_MIN_TOMBSTONES, int(self.index.ntotal * config.COMPACT_TOMBSTONE_RATIO))
+        if len(self.tombstones) < threshold:
+            return
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        
+        def run():
+            try:
+                self.compact_index()
+            except Exception as e:
+                print(f"索引压缩失败: {e}")
+        
+        self._compaction_thread = threading.Thread(target=run, name="index-compaction", daemon=True)
+        self._compaction_thread.start()
+    
+    def _target_index_factory(self) -> str:
+        """当前向量数量下应使用的索引类型：未达到训练阈值时保持 Flat"""
+        if ann_index.is_flat(config.INDEX_FACTORY):
+            return "Flat"
+        if self.image_count() < config.INDEX_TRAIN_THRESHOLD:
+            return self.index_factory
+        return config.INDEX_FACTORY
+    
+    def _schedule_index_migration(self):
+        """索引类型与配置不一致（例如向量数量刚超过训练阈值）时启动后台线程训练新索引并迁移"""
+        factory = self._target_index_factory()
+        if factory == self.index_factory:
+            return
+        if self._migration_thread is not None and self._migration_thread.is_alive():
+            return
+        
+        def run():
+            try:
+                self._migrate_index(factory)
+            except Exception as e:
+                print(f"索引迁移失败: {e}")
+        
+        self._migration_thread = threading.Thread(target=run, name="index-migration", daemon=True)
+        self._migration_thread.start()
+    
+    def _migrate_index(self, factory: str) -> bool:
+        """
+        用当前存活的向量构建 factory 类型的新索引（需要训练的先抽样训练）并替换现有索引
+        只在复制向量和替换时持有锁，训练和写入新索引期间搜索、入库照常进行；
+        期间新写入的向量在替换前补进新索引，被删除的向量记为墓碑。返回是否完成替换
+        """
+        with self.index_lock:
+            generation = self._index_generation
+            ids = np.fromiter(self.id_to_path, dtype='int64', count=len(self.id_to_path))
+            vectors = ann_index.reconstruct(self.index, ids)
+            dimension = self.index.d
+        
+        print(f"开始迁移索引: {self.index_factory} -> {factory}，共 {len(ids)} 个向量")
+        start_time = time.time()
+        new_index = ann_index.create_index(dimension, factory, len(ids))
+        if not new_index.is_trained:
+            sample_size = min(len(ids), config.INDEX_TRAIN_SAMPLE_SIZE)
+            sample = vectors[np.random.default_rng().choice(len(ids), sample_size, replace=False)]
+            new_index.train(sample)
+        for start in range(0, len(ids), 65536):
+            new_index.add_with_ids(vectors[start:start + 65536], ids[start:start + 65536])
+        del vectors
+        
+        with self.index_lock:
+            if self._index_generation != generation:
+                print("索引在迁移期间被清空或重建，放弃本次迁移")
+                return False
+            copied = set(ids.tolist())
+            added = np.array([image_id for image_id in self.id_to_path if image_id not in copied], dtype='int64')
+            if len(added):
+                new_index.add_with_ids(ann_index.reconstruct(self.index, added), added)
+            self.index = new_index
+            self._mmap_index = None
+            self.index_factory = factory
+            self._index_generation += 1
+            self.tombstones = {image_id for image_id in copied if image_id not in self.id_to_path}
+        
+        print(f"索引迁移完成: {ann_index.describe(new_index)}，耗时 {time.time() - start_time:.1f}s")
+        return True
+    
+    def index_info(self) -> Dict[str, Any]:
+        """当前索引类型、配置的目标类型和迁移状态"""
+        with self.index_lock:
+            return {
+                "type": ann_index.describe(self.index),
+                "factory": self.index_factory,
+                "target_factory": config.INDEX_FACTORY,
+                "vectors": self.index.ntotal,
+                "migrating": self._migration_thread is not None and self._migration_thread.is_alive()
+            }
+    
+    def rename_images(self, renames: List[Tuple[str, str]],
+                      stats: Optional[Dict[str, Tuple[int, int]]] = None) -> int:
+        """
+        批量更新被移动/重命名的图像路径，向量和向量ID保持不变，无需重新编码
+        renames 为 (旧路径, 新路径) 列表，stats 为扫描得到的新路径 (size, mtime_ns)，
+        文件清单沿用原有的内容哈希，只更新 stat 信息；返回实际更新的数量
+        """
+        renamed = []
+        with self.index_lock:
+            for old, new in renames:
+                if old not in self.path_to_id or new in self.path_to_id:
+                    continue
+                image_id = self.path_to_id.pop(old)
+                self.path_to_id[new] = image_id
+                self.id_to_path[image_id] = new
+                self.path_index.rename(old, new)
+                renamed.append((old, new))
+        
+        self.metadata_store.rename_many((self.path_to_id[new], new) for _, new in renamed)
+        for old, new in renamed:
+            stat = (stats or {}).get(new)
+            if stat is None:
+                try:
+                    file_stat = os.stat(new)
+                    stat = (file_stat.st_size, file_stat.st_mtime_ns)
+                except OSError:
+                    stat = (None, None)
+            self.file_manifest.rename(old, new, *stat)
+        
+        print(f"已更新 {len(renamed)} 张重命名图像的路径")
+        return len(renamed)
+    
+    def sync_folder(self, folder_path: str, scanned: Iterable[Tuple[str, int, int]], batch_size: int = None,
+                    progress_callback: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+                    workers: int = None, estimated_total: Optional[Callable[[], int]] = None,
+                    was_listed: Optional[Callable[[str], bool]] = None) -> Dict[str, int]:
+        """
+        按文件指纹增量同步文件夹
+        scanned 为扫描得到的 (path, size, mtime_ns)，可以是扫描器的生成器：扫描的同时，
+        新增和修改过的文件就进入入库流水线；与清单中某个文件大小相同的新文件可能是被移动/重命名的文件，
+        暂缓到扫描结束后再与消失的文件匹配，匹配上的直接更新路径，其余照常编码。
+        扫描结束后不再出现的文件从索引中删除；was_listed(path) 为 False 的文件（所在目录扫描失败）
+        无法判断是否还存在，保留在索引中，数量记为 skipped
+        progress_callback(processed, total, stage_stats) 中的数量按整个文件夹计算（含未变化的文件），
+        total 在扫描过程中取 estimated_total() 的估算值
+        返回各类变更的数量
+        """
+        seen: Dict[str, Tuple[int, int]] = {}
+        summary = {"new": 0, "changed": 0, "deleted": 0, "renamed": 0, "unchanged": 0, "skipped": 0}
+        known_sizes = self.file_manifest.sizes_under(folder_path)
+        deferred = []
+        
+        def changed_paths():
+            for path, size, mtime_ns in scanned:
+                seen[path] = (size, mtime_ns)
+                fingerprint = self.file_manifest.entries.get(path)
+                if fingerprint is None:
+                    if path in self.path_to_id:
+                        # 旧版本索引中没有指纹记录的文件，直接补录指纹
+                        self.file_manifest.record(path, size, mtime_ns)
+                        summary["unchanged"] += 1
+                    elif size in known_sizes:
+                        deferred.append(path)
+                    else:
+                        summary["new"] += 1
+                        yield path
+                elif fingerprint.size != size or fingerprint.mtime_ns != mtime_ns:
+                    # 已修改的文件重新编码，写入时替换旧向量
+                    summary["changed"] += 1
+                    yield path
+                else:
+                    summary["unchanged"] += 1
+            
+            # 扫描结束：先匹配重命名，再删除已不存在的文件（只限扫描时实际读取到的目录）
+            def gone(path: str) -> bool:
+                return path not in seen and (was_listed is None or was_listed(path))
+            
+            missing = [path for path in self.file_manifest.paths_under(folder_path) if gone(path)]
+            renamed = self.file_manifest.match_renames(missing, deferred, seen)
+            if renamed:
+                summary["renamed"] = self.rename_images(renamed, seen)
+            unseen = [path for path in self.path_index.paths_under(folder_path) if path not in seen]
+            removed = [path for path in unseen if gone(path)]
+            summary["skipped"] = len(unseen) - len(removed)
+            if summary["skipped"]:
+                print(f"⚠️ {summary['skipped']} 张图像所在的目录扫描失败，保留在索引中")
+            summary["deleted"] = self.remove_images(removed)
+            print(f"文件夹扫描完成，共 {len(seen)} 个图片文件")
+            
+            renamed_new = {new for _, new in renamed}
+            for path in deferred:
+                if path not in renamed_new:
+                    summary["new"] += 1
+                    yield path
+        
+        def report_progress(processed: int, total: int, stage_stats: Dict[str, Any] = None):
+            if progress_callback:
+                done = summary["unchanged"] + processed
+                overall = max(estimated_total() if estimated_total else 0, len(seen), done)
+                progress_callback(done, overall, stage_stats)
+        
+        summary["added"] = self.add_images(changed_paths(), batch_size=batch_size, progress_callback=report_progress,
+                                           workers=workers, replace_existing=True)
+        summary["scanned"] = len(seen)
+        print(f"文件夹变更: {summary}")
+        return summary
+    
     def rebuild_index(self):
-        """重建索引（在删除图像后）"""
+        """重建索引（在删除图像后）：向量已保存在索引中，只需清理墓碑，无需重新编码"""
         try:
-            # 保存当前索引中的所有向量
-            all_features = []
-            for path in self.image_paths:
-                features = self.encode_image(path)
-                all_features.append(features)
-            
-            if all_features:
-                # 堆叠所有特征向量
-                all_features = np.stack(all_features)
-                
-                # 创建新索引
-                dimension = all_features.shape[1]
-                new_index = faiss.IndexFlatIP(dimension)
-                new_index.add(all_features)
-                
-                # 替换当前索引
-                self.index = new_index
-            else:
-                # 如果没有图像，创建空索引
-                dimension = 512
-                self.index = faiss.IndexFlatIP(dimension)
-                
-            print(f"索引重建完成，包含 {self.index.ntotal} 张图像")
+            self.compact_index()
+            print(f"索引重建完成，包含 {self.image_count()} 张图像")
         except Exception as e:
             print(f"重建索引失败: {e}")
     
-    def search_by_text(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
-        """根据文本搜索图像"""
+    def _search_ids(self, query_vector: np.ndarray, top_k: int, nprobe: int = None, ef_search: int = None,
+                    filters: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        """
+        在索引中搜索，返回 (向量ID, 相似度) 列表
+        已删除的向量（墓碑）由选择器在索引内部排除，不必多取候选；
+        nprobe / ef_search 覆盖 IVF / HNSW 索引的默认搜索参数，越大召回率越高、越慢；
+        filters 为 parse_filters 得到的过滤条件，满足条件的ID位图交给索引在搜索时筛选（预过滤）
+        """
+        return self._search_ids_batch(query_vector, top_k, nprobe, ef_search, filters)[0]
+    
+    def _search_ids_batch(self, query_vectors: np.ndarray, top_k: int, nprobe: int = None, ef_search: int = None,
+                          filters: Dict[str, Any] = None) -> List[List[Tuple[int, float]]]:
+        """一次搜索 (N, dimension) 的查询矩阵，返回每个查询的 (向量ID, 相似度) 列表，见 _search_ids"""
+        with self.index_lock:
+            if top_k <= 0 or self.image_count() == 0:
+                return [[] for _ in range(len(query_vectors))]
+            
+            selector = None
+            if filters:
+                mask = self._filter_mask(filters)
+                candidates = int(mask.sum())
+                if candidates == 0:
+                    return [[] for _ in range(len(query_vectors))]
+                if not ann_index.is_exact(self.index) and candidates <= config.FILTER_EXACT_SEARCH_MAX:
+                    # 候选很少时近似索引可能凑不满 top_k（IVF 探测的聚类、HNSW 的图中都难以遇到），直接精确计算
+                    return self._exact_search(query_vectors, np.flatnonzero(mask), top_k)
+                # 位图只包含未删除的图像，同时排除了墓碑
+                selector = BitmapSelector(mask)
+                k = min(top_k, candidates)
+            else:
+                selector = self._exclude_tombstones()
+                k = min(top_k, self.index.ntotal)
+            params = ann_index.search_parameters(self.index, top_k, nprobe or config.SEARCH_NPROBE,
+                                                 ef_search or config.SEARCH_EF_SEARCH,
+                                                 selector.selector if selector else None)
+            scores, ids = self.index.search(query_vectors, k, params=params)
+            
+            all_hits = []
+            for row_ids, row_scores in zip(ids.tolist(), scores.tolist()):
+                hits = []
+                for image_id, score in zip(row_ids, row_scores):
+                    if image_id < 0 or image_id in self.tombstones or image_id not in self.id_to_path:
+                        continue
+                    hits.append((image_id, score))
+                    if len(hits) >= top_k:
+                        break
+                all_hits.append(hits)
+            return all_hits
+    
+    def _exclude_tombstones(self) -> Optional[ann_index.ExcludeSelector]:
+        """
+        排除墓碑的选择器，没有墓碑时返回 None（调用方持有 index_lock）
+        同一个墓碑集合只会增加元素（清理时整体替换为新集合），集合和数量都不变时复用上次构建的选择器
+        """
+        if not self.tombstones:
+            return None
+        cached = self._tombstone_selector
+        if cached is None or cached[0] is not self.tombstones or cached[1] != len(self.tombstones):
+            cached = (self.tombstones, len(self.tombstones), ann_index.ExcludeSelector(self.tombstones))
+            self._tombstone_selector = cached
+        return cached[2]
+    
+    def _filter_columns(self) -> MetadataColumns:
+        """搜索过滤用的列式元数据，第一次使用时从元数据库读取（调用方持有 index_lock）"""
+        if self._metadata_columns is None:
+            start_time = time.time()
+            columns = MetadataColumns()
+            columns.update(row for row in self.metadata_store.filter_rows() if row[0] in self.id_to_path)
+            self._metadata_columns = columns
+            print(f"过滤用元数据已加载，共 {len(self.id_to_path)} 张图像，耗时 {time.time() - start_time:.2f}s")
+        return self._metadata_columns
+    
+    def _filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """满足过滤条件的向量ID位图（调用方持有 index_lock）"""
+        folder_ids = None
+        if "folders" in filters:
+            folder_ids = [self.path_to_id[path] for folder in filters["folders"]
+                          for path in self.path_index.paths_under(folder) if path in self.path_to_id]
+        return self._filter_columns().match(filters, folder_ids)
+    
+    def _exact_search(self, query_vectors: np.ndarray, candidate_ids: np.ndarray,
+                      top_k: int) -> List[List[Tuple[int, float]]]:
+        """在少量候选向量中精确计算内积并取前 top_k 个"""
+        scores = query_vectors @ ann_index.reconstruct(self.index, candidate_ids).T
+        all_hits = []
+        for row in scores:
+            top = np.argpartition(-row, top_k - 1)[:top_k] if len(row) > top_k else np.arange(len(row))
+            top = top[np.argsort(-row[top])]
+            all_hits.append([(int(candidate_ids[j]), float(row[j])) for j in top])
+        return all_hits
+    
+    def _build_results(self, hits: List[Tuple[int, float]], metadatas: Dict[int, Dict[str, Any]] = None,
+                       fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
+        """
+        根据向量ID构建搜索结果（id 为稳定的向量ID），元数据一次批量从元数据库读取；
+        metadatas 为已读取好的元数据（批量查询时所有查询共用一次读取）；
+        fields 为 parse_fields 得到的字段投影，不需要元数据时不读取元数据库
+        """
+        fields = fields or RESULT_FIELDS
+        metadata_keys = [field[len("metadata."):] for field in fields if field.startswith("metadata.")]
+        if metadatas is None and ("metadata" in fields or metadata_keys):
+            metadatas = self.metadata_store.get_many(image_id for image_id, _ in hits)
+        
+        results = []
+        for image_id, similarity in hits:
+            result = {}
+            if "id" in fields:
+                result["id"] = image_id
+            if "path" in fields:
+                result["path"] = self.id_to_path.get(image_id)
+            if "similarity" in fields:
+                result["similarity"] = similarity
+            if "metadata" in fields:
+                result["metadata"] = metadatas.get(image_id, {})
+            elif metadata_keys:
+                metadata = metadatas.get(image_id, {})
+                result["metadata"] = {key: metadata[key] for key in metadata_keys if key in metadata}
+            results.append(result)
+        return results
+    
+    def get_metadata(self, image_path: str) -> Dict[str, Any]:
+        """读取已索引图像的元数据，不在索引中时返回空字典"""
+        image_id = self.path_to_id.get(image_path)
+        if image_id is None:
+            return {}
+        return self.metadata_store.get(image_id) or {}
+    
+    def search_by_text(self, query: str, top_k: int = 10, nprobe: int = None, ef_search: int = None,
+                       filters: Dict[str, Any] = None, fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
+        """根据文本搜索图像（nprobe / ef_search / filters 见 _search_ids，fields 见 _build_results）"""
         try:
             print(f"搜索查询: '{query}'")
             
@@ -237,35 +1115,13 @@ class SemanticSearchService(SearchServiceInterface):
             print(f"查询向量维度: {query_vector.shape}, 范数: {np.linalg.norm(query_vector):.4f}")
             
             # 在索引中搜索
-            scores, indices = self.index.search(query_vector, min(top_k, self.index.ntotal))
-            print(f"搜索完成，找到 {len(indices[0])} 个结果")
+            hits = self._search_ids(query_vector, top_k, nprobe, ef_search, filters)
+            print(f"搜索完成，找到 {len(hits)} 个结果")
             
-            # 构建结果
-            results = []
-            for i in range(len(indices[0])):
-                idx = int(indices[0][i])  # 确保转换为Python int
-                if idx < len(self.image_paths):
-                    path = self.image_paths[idx]
-                    similarity_score = float(scores[0][i])
-                    print(f"结果 {i+1}: 相似度={similarity_score:.4f}, 路径={path}")
-                    
-                    metadata = self.image_metadata.get(path, {})
-                    # 确保metadata中的所有数值都是JSON可序列化的
-                    serializable_metadata = {}
-                    for key, value in metadata.items():
-                        if isinstance(value, (np.integer, np.int64)):
-                            serializable_metadata[key] = int(value)
-                        elif isinstance(value, (np.floating, np.float64)):
-                            serializable_metadata[key] = float(value)
-                        else:
-                            serializable_metadata[key] = value
-                    
-                    results.append({
-                        "id": idx,
-                        "path": path,
-                        "similarity": similarity_score,
-                        "metadata": serializable_metadata
-                    })
+            # 构建结果（只打印前几个，top_k 很大时逐条打印的开销不可忽略）
+            results = self._build_results(hits, fields=fields)
+            for i, (image_id, similarity) in enumerate(hits[:5]):
+                print(f"结果 {i+1}: 相似度={similarity:.4f}, 路径={self.id_to_path.get(image_id)}")
             
             return results
         except Exception as e:
@@ -274,16 +1130,21 @@ class SemanticSearchService(SearchServiceInterface):
             traceback.print_exc()
             return []
     
-    def search_by_image(self, query_image_path: str, top_k: int = 10) -> List[Dict[str, Any]]:
-        """以图搜图"""
+    def search_by_image(self, query_image: Union[str, bytes, Image.Image], top_k: int = 10, nprobe: int = None,
+                        ef_search: int = None, filters: Dict[str, Any] = None,
+                        fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
+        """
+        以图搜图；query_image 为文件路径、图片数据（上传的文件）或 PIL 图像
+        （nprobe / ef_search / filters 见 _search_ids，fields 见 _build_results）
+        """
         try:
-            print(f"🔍 开始以图搜图: {query_image_path}")
-            print(f"📊 当前索引包含 {self.index.ntotal} 张图像")
-            print(f"📋 图像路径列表长度: {len(self.image_paths)}")
+            print(f"🔍 开始以图搜图: {query_image if isinstance(query_image, str) else type(query_image).__name__}")
+            print(f"📊 当前索引包含 {self.image_count()} 张图像")
+            print(f"📋 待清理的已删除向量: {len(self.tombstones)}")
             
             # 编码查询图像
-            query_vector = self.encode_image(query_image_path)
-            if query_vector is None:
+            query_vector = self._encode_query_image(query_image)
+            if query_vector is None or np.allclose(query_vector, 0):
                 print("❌ 查询图像编码失败")
                 return []
                 
@@ -291,41 +1152,16 @@ class SemanticSearchService(SearchServiceInterface):
             print(f"🎯 查询向量维度: {query_vector.shape}, 范数: {np.linalg.norm(query_vector):.4f}")
             
             # 在索引中搜索
-            scores, indices = self.index.search(query_vector, min(top_k, self.index.ntotal))
-            print(f"🔎 搜索完成，找到 {len(indices[0])} 个结果")
+            hits = self._search_ids(query_vector, top_k, nprobe, ef_search, filters)
+            print(f"🔎 搜索完成，找到 {len(hits)} 个结果")
+            
+            # 构建结果
+            results = self._build_results(hits, fields=fields)
             
             # 打印前几个结果的详细信息
             print("📈 搜索结果详情:")
-            for i in range(min(5, len(indices[0]))):
-                idx = int(indices[0][i])
-                score = float(scores[0][i])
-                if idx < len(self.image_paths):
-                    path = self.image_paths[idx]
-                    print(f"  {i+1}. 索引:{idx}, 相似度:{score:.4f}, 路径:{path}")
-            
-            # 构建结果
-            results = []
-            for i in range(len(indices[0])):
-                idx = int(indices[0][i])  # 确保转换为Python int
-                if idx < len(self.image_paths):
-                    path = self.image_paths[idx]
-                    metadata = self.image_metadata.get(path, {})
-                    # 确保metadata中的所有数值都是JSON可序列化的
-                    serializable_metadata = {}
-                    for key, value in metadata.items():
-                        if isinstance(value, (np.integer, np.int64)):
-                            serializable_metadata[key] = int(value)
-                        elif isinstance(value, (np.floating, np.float64)):
-                            serializable_metadata[key] = float(value)
-                        else:
-                            serializable_metadata[key] = value
-                    
-                    results.append({
-                        "id": idx,
-                        "path": path,
-                        "similarity": float(scores[0][i]),
-                        "metadata": serializable_metadata
-                    })
+            for i, (image_id, similarity) in enumerate(hits[:5]):
+                print(f"  {i+1}. ID:{image_id}, 相似度:{similarity:.4f}, 路径:{self.id_to_path.get(image_id)}")
             
             print(f"✅ 返回 {len(results)} 个搜索结果")
             return results
@@ -335,6 +1171,126 @@ class SemanticSearchService(SearchServiceInterface):
             traceback.print_exc()
             return []
 
+    def search_by_text_page(self, query: str, page_size: int = 20, nprobe: int = None, ef_search: int = None,
+                            filters: Dict[str, Any] = None, fields: Tuple[str, ...] = None) -> Dict[str, Any]:
+        """根据文本分页搜索，返回第一页和游标（见 _start_result_set）"""
+        query_vector = self.encode_text(query)
+        return self._start_result_set(query_vector, page_size, nprobe, ef_search, filters, fields)
+    
+    def search_by_image_page(self, query_image: Union[str, bytes, Image.Image], page_size: int = 20,
+                             nprobe: int = None, ef_search: int = None, filters: Dict[str, Any] = None,
+                             fields: Tuple[str, ...] = None) -> Dict[str, Any]:
+        """以图搜图分页搜索（query_image 同 search_by_image），返回第一页和游标（见 _start_result_set）"""
+        query_vector = self._encode_query_image(query_image)
+        return self._start_result_set(query_vector, page_size, nprobe, ef_search, filters, fields)
+    
+    def result_page(self, cursor: str, offset: int, page_size: int = 20,
+                    fields: Tuple[str, ...] = None) -> Optional[Dict[str, Any]]:
+        """
+        从缓存的结果集中取出一页，不再编码查询和搜索索引；
+        请求超出已缓存的深度时用缓存的查询向量加深一次。游标过期或索引已变化时返回 None，调用方需重新搜索
+        """
+        result_set = self.result_cache.get(cursor)
+        if result_set is None:
+            return None
+        if offset + page_size > len(result_set["ids"]) and not result_set["complete"]:
+            depth = max(offset + page_size, result_set["depth"] * 2)
+            result_set = self._rank_result_set(result_set["query"], depth, result_set["nprobe"],
+                                               result_set["ef_search"], result_set["filters"])
+            self.result_cache.replace(cursor, result_set)
+        return self._result_page(cursor, result_set, offset, page_size, fields)
+    
+    def _start_result_set(self, query_vector: np.ndarray, page_size: int, nprobe: int = None,
+                          ef_search: int = None, filters: Dict[str, Any] = None,
+                          fields: Tuple[str, ...] = None) -> Dict[str, Any]:
+        """
+        一次取出 RESULT_CACHE_DEPTH 条排好序的结果缓存在服务端，返回第一页和用于翻页的游标
+        返回 {"results", "cursor", "offset", "nextOffset", "total"}；没有更多结果时 nextOffset 为 None，
+        total 在结果集已取完时为结果总数，否则为 None
+        """
+        if query_vector is None or np.allclose(query_vector, 0):
+            print("警告: 查询向量为空或全零")
+            return {"results": [], "cursor": None, "offset": 0, "nextOffset": None, "total": 0}
+        result_set = self._rank_result_set(query_vector, max(page_size, config.RESULT_CACHE_DEPTH),
+                                           nprobe, ef_search, filters)
+        cursor = self.result_cache.put(result_set)
+        return self._result_page(cursor, result_set, 0, page_size, fields)
+    
+    def _rank_result_set(self, query_vector: np.ndarray, depth: int, nprobe: int = None, ef_search: int = None,
+                         filters: Dict[str, Any] = None) -> Dict[str, Any]:
+        query_vector = np.asarray(query_vector, dtype='float32').reshape(1, -1)
+        hits = self._search_ids(query_vector, depth, nprobe, ef_search, filters)
+        return {
+            "query": query_vector,
+            "ids": np.array([image_id for image_id, _ in hits], dtype='int64'),
+            "scores": np.array([score for _, score in hits], dtype='float32'),
+            "depth": depth,
+            "complete": len(hits) < depth,  # 结果不足 depth 条说明已经取完
+            "nprobe": nprobe,
+            "ef_search": ef_search,
+            "filters": filters
+        }
+    
+    def _result_page(self, cursor: str, result_set: Dict[str, Any], offset: int, page_size: int,
+                     fields: Tuple[str, ...] = None) -> Dict[str, Any]:
+        end = offset + page_size
+        hits = [(image_id, score) for image_id, score in
+                zip(result_set["ids"][offset:end].tolist(), result_set["scores"][offset:end].tolist())
+                if image_id in self.id_to_path]
+        total = len(result_set["ids"]) if result_set["complete"] else None
+        return {
+            "results": self._build_results(hits, fields=fields),
+            "cursor": cursor,
+            "offset": offset,
+            "nextOffset": end if total is None or end < total else None,
+            "total": total
+        }
+    
+    def search_batch(self, queries: List[Tuple[str, str]], top_k: int = 10, nprobe: int = None,
+                     ef_search: int = None, filters: Dict[str, Any] = None,
+                     fields: Tuple[str, ...] = None) -> List[List[Dict[str, Any]]]:
+        """
+        批量搜索，queries 为 ("text", 查询文本) 或 ("image", 图片路径) 列表，按顺序返回每个查询的结果
+        所有文本、所有图片分别在一次前向推理中编码，所有查询向量组成一个矩阵只搜索一次索引，元数据也只读取一次；
+        filters 对所有查询生效；编码失败的查询返回空结果
+        """
+        if not queries:
+            return []
+        print(f"批量搜索: {len(queries)} 个查询")
+        
+        for kind, _ in queries:
+            if kind not in ("text", "image"):
+                raise ValueError(f"未知的查询类型: {kind}")
+        
+        vectors: List[Optional[np.ndarray]] = [None] * len(queries)
+        text_rows = [i for i, (kind, _) in enumerate(queries) if kind == "text"]
+        if text_rows:
+            for i, vector in zip(text_rows, self.encode_texts([queries[i][1] for i in text_rows])):
+                vectors[i] = vector
+        image_rows = [i for i, (kind, _) in enumerate(queries) if kind == "image"]
+        if image_rows:
+            # 所有查询图片作为一个批次编码，无法读取的图片没有向量
+            image_paths = list(dict.fromkeys(queries[i][1] for i in image_rows))
+            features, encoded_paths = self.encode_images(image_paths, batch_size=len(image_paths))
+            encoded = dict(zip(encoded_paths, features))
+            for i in image_rows:
+                vectors[i] = encoded.get(queries[i][1])
+        
+        valid = [i for i, vector in enumerate(vectors) if vector is not None and not np.allclose(vector, 0)]
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        if not valid:
+            return results
+        
+        query_matrix = np.ascontiguousarray(np.stack([vectors[i] for i in valid]), dtype='float32')
+        all_hits = self._search_ids_batch(query_matrix, top_k, nprobe, ef_search, filters)
+        metadatas = None
+        if any(field == "metadata" or field.startswith("metadata.") for field in fields or RESULT_FIELDS):
+            metadatas = self.metadata_store.get_many({image_id for hits in all_hits for image_id, _ in hits})
+        for i, hits in zip(valid, all_hits):
+            results[i] = self._build_results(hits, metadatas, fields)
+        print(f"批量搜索完成，共 {sum(len(hits) for hits in all_hits)} 个结果")
+        return results
+    
     def _get_model_path(self, model_name: str) -> str:
         """获取模型的实际路径"""
         model_mapping = {
@@ -344,22 +1300,20 @@ class SemanticSearchService(SearchServiceInterface):
             'multilingual-clip-vit-base-patch32': "sentence-transformers/clip-ViT-B-32-multilingual-v1",
             'blip-base': "Salesforce/blip-image-captioning-base"
         }
+        # 已经是完整的模型路径（规范名称）时直接返回
+        if model_name in model_mapping.values():
+            return model_name
         return model_mapping.get(model_name, "openai/clip-vit-base-patch32")
     
-    def _save_model_info(self):
-        """保存当前使用的模型信息"""
-        try:
-            model_info = {
-                'model_name': self.current_model_name,
-                'timestamp': time.time()
-            }
-            with open(self.model_info_path, 'wb') as f:
-                pickle.dump(model_info, f)
-        except Exception as e:
-            print(f"保存模型信息失败: {e}")
+    def _model_info(self) -> Dict[str, Any]:
+        """当前使用的模型信息，随索引快照一起保存"""
+        return {
+            'model_name': self.current_model_name,
+            'timestamp': time.time()
+        }
     
     def _get_index_model_name(self) -> str:
-        """获取索引使用的模型名称"""
+        """获取旧版本索引使用的模型名称"""
         try:
             if os.path.exists(self.model_info_path):
                 with open(self.model_info_path, 'rb') as f:
@@ -373,40 +1327,32 @@ class SemanticSearchService(SearchServiceInterface):
     def set_model(self, model_name: str):
         """设置使用的模型"""
         try:
+            # 获取模型路径（规范名称），短名称和完整路径都指向同一个模型
+            model_path = self._get_model_path(model_name)
+            
             # 检查是否需要切换模型
-            if model_name == self.current_model_name:
+            if model_path == self.current_model_name:
                 print(f"模型已经是 {model_name}，无需切换")
                 return
             
-            # 获取模型路径
-            model_path = self._get_model_path(model_name)
-            
             print(f"正在切换模型: {self.current_model_name} -> {model_name}")
             
             # 加载新模型
             if model_name == 'blip-base':
                 print("BLIP模型支持将在后续版本中添加")
                 return
-            elif model_name == 'chinese-clip-vit-base-patch16':
-                # 使用Chinese CLIP专用的类和处理器
-                self.clip_model = ChineseCLIPModel.from_pretrained(model_path)
-                self.clip_processor = ChineseCLIPProcessor.from_pretrained(model_path)
-            else:
-                # 使用标准CLIP模型
-                self.clip_model = CLIPModel.from_pretrained(model_path)
-                self.clip_processor = CLIPProcessor.from_pretrained(model_path)
             
-            # 确保模型处于评估模式
-            self.clip_model.eval()
+            self.clip_model, self.clip_processor = get_shared_clip_model(model_path)
             
-            # 更新当前模型名称
+            # 更新当前模型名称，旧模型的查询向量不再使用
             old_model = self.current_model_name
             self.current_model_name = model_path
+            self.text_embedding_cache.clear()
             
             print(f"✅ 成功切换模型: {model_name}")
             
             # 检查是否需要重建索引
-            if self.index.ntotal > 0:
+            if self.image_count() > 0:
                 print("⚠️  检测到现有索引，建议重新索引图片以确保搜索准确性")
                 print("   可以调用 rebuild_index_with_new_model() 方法重建索引")
             
@@ -417,104 +1363,107 @@ class SemanticSearchService(SearchServiceInterface):
     
     def rebuild_index_with_new_model(self):
         """使用新模型重建整个索引"""
-        try:
-            if not self.image_paths:
-                print("没有图片需要重建索引")
-                return
-            
-            print(f"开始使用模型 {self.current_model_name} 重建索引...")
-            
-            # 保存图片路径列表
-            paths_to_rebuild = self.image_paths.copy()
-            
-            # 清空当前索引
-            dimension = 512
-            self.index = faiss.IndexFlatIP(dimension)
-            self.image_paths = []
-            
-            # 重新编码所有图片
-            success_count = 0
-            for i, image_path in enumerate(paths_to_rebuild):
-                try:
-                    if os.path.exists(image_path):
-                        # 重新编码并添加到索引
-                        features = self.encode_image(image_path)
-                        features = features.reshape(1, -1)
-                        self.index.add(features)
-                        self.image_paths.append(image_path)
-                        success_count += 1
-                        
-                        if (i + 1) % 10 == 0:
-                            print(f"已重建 {i + 1}/{len(paths_to_rebuild)} 张图片")
-                    else:
-                        print(f"图片不存在，跳过: {image_path}")
-                        # 从元数据中移除
-                        if image_path in self.image_metadata:
-                            del self.image_metadata[image_path]
-                            
-                except Exception as e:
-                    print(f"重建图片索引失败 {image_path}: {e}")
-            
-            print(f"✅ 索引重建完成！成功重建 {success_count} 张图片")
-            
-            # 保存新索引
-            self.save_index()
-            
-        except Exception as e:
-            print(f"重建索引失败: {e}")
+        def log_progress(processed: int, total: int, stage_stats: Dict[str, Any] = None):
+            print(f"已重建 {processed}/{total} 张图片")
+        
+        self._rebuild_with_current_model(log_progress)
     
     def rebuild_index_with_new_model_progress(self, task_id: str, processing_status: dict):
         """使用新模型重建整个索引（带进度更新）"""
+        start_time = time.time()
+        
+        def update_progress(processed: int, total: int, stage_stats: Dict[str, Any] = None):
+            elapsed = time.time() - start_time
+            processing_status[task_id]["total"] = total
+            processing_status[task_id]["processed"] = processed
+            processing_status[task_id]["progress"] = int(processed / total * 100) if total else 100
+            processing_status[task_id]["imagesPerSecond"] = round(processed / elapsed, 2) if elapsed > 0 else 0.0
+            if stage_stats:
+                processing_status[task_id]["stages"] = stage_stats
+            print(f"已重建 {processed}/{total} 张图片")
+        
+        self._rebuild_with_current_model(update_progress)
+    
+    def _forget_images(self, image_paths: List[str]):
+        """移除不在索引中的图像的ID映射、元数据和文件指纹（不产生墓碑）"""
+        forgotten_ids = []
+        with self.index_lock:
+            for image_path in image_paths:
+                image_id = self.path_to_id.pop(image_path, None)
+                if image_id is not None:
+                    self.id_to_path.pop(image_id, None)
+                    forgotten_ids.append(image_id)
+                self.path_index.remove(image_path)
+        self.metadata_store.delete_ids(forgotten_ids)
+        if self._metadata_columns is not None:
+            self._metadata_columns.remove(forgotten_ids)
+        self.result_cache.clear()
+        for image_path in image_paths:
+            self.file_manifest.remove(image_path)
+    
+    def _rebuild_with_current_model(self, progress_callback: Optional[Callable[[int, int, Dict[str, Any]], None]] = None):
+        """使用当前模型按批次重新编码所有图片并重建索引"""
         try:
-            if not self.image_paths:
+            if not self.path_to_id:
                 print("没有图片需要重建索引")
                 return
             
             print(f"开始使用模型 {self.current_model_name} 重建索引...")
             
-            # 保存图片路径列表
-            paths_to_rebuild = self.image_paths.copy()
-            total_images = len(paths_to_rebuild)
+            # 保存图片路径列表，跳过已不存在的图片
+            paths_to_rebuild = []
+            missing = []
+            for image_path in self.image_paths:
+                if os.path.exists(image_path):
+                    paths_to_rebuild.append(image_path)
+                else:
+                    print(f"图片不存在，跳过: {image_path}")
+                    missing.append(image_path)
+            self._forget_images(missing)
             
-            # 更新任务状态
-            processing_status[task_id]["total"] = total_images
+            # 清空当前索引，图片沿用原有的向量ID
+            with self.index_lock:
+                self.index = self._new_index()
+                self.index_factory = "Flat"
+                self._index_generation += 1
+                self.tombstones = set()
+                self.result_cache.clear()
             
-            # 清空当前索引
-            dimension = 512
-            self.index = faiss.IndexFlatIP(dimension)
-            self.image_paths = []
+            def preprocess(image_path: str):
+                # 重建时沿用已有元数据，只需重新计算向量；之前用过当前模型的图片直接从缓存读取，不读取文件
+                source, content_hash, cached = self._source_with_cache(image_path)
+                if cached is not None:
+                    return None, {"content_hash": content_hash}, cached
+                with source.open() as img:
+                    image = self._decode_for_model(img, image_path)
+                return self._preprocess_image(image), {"content_hash": content_hash}, None
             
-            # 重新编码所有图片
-            success_count = 0
-            for i, image_path in enumerate(paths_to_rebuild):
-                try:
-                    if os.path.exists(image_path):
-                        # 重新编码并添加到索引
-                        features = self.encode_image(image_path)
-                        features = features.reshape(1, -1)
-                        self.index.add(features)
-                        self.image_paths.append(image_path)
-                        success_count += 1
-                        
-                        # 更新进度
-                        processing_status[task_id]["processed"] = i + 1
-                        processing_status[task_id]["progress"] = int((i + 1) / total_images * 100)
-                        
-                        if (i + 1) % 5 == 0:
-                            print(f"已重建 {i + 1}/{total_images} 张图片")
-                    else:
-                        print(f"图片不存在，跳过: {image_path}")
-                        # 从元数据中移除
-                        if image_path in self.image_metadata:
-                            del self.image_metadata[image_path]
-                            
-                except Exception as e:
-                    print(f"重建图片索引失败 {image_path}: {e}")
+            def write_batch(paths, features, metadatas, failed):
+                if paths:
+                    with self.index_lock:
+                        ids = np.array([self.path_to_id[image_path] for image_path in paths], dtype='int64')
+                        self.index.add_with_ids(features, ids)
+                    hash_updates = {}
+                    for i, (image_path, info) in enumerate(zip(paths, metadatas)):
+                        content_hash = info.get("content_hash")
+                        self.embedding_cache.put(self.current_model_name, content_hash, features[i])
+                        if content_hash:
+                            hash_updates[int(ids[i])] = {"content_hash": content_hash}
+                            self.file_manifest.record(image_path, content_hash=content_hash)
+                    self.metadata_store.merge_metadata_many(hash_updates)
+                # 编码失败的图片不在新索引中，直接移除其ID映射和元数据
+                for image_path in failed:
+                    print(f"重建图片索引失败 {image_path}")
+                self._forget_images(failed)
+            
+            pipeline = self._create_pipeline(preprocess, write_batch, progress_callback=progress_callback)
+            pipeline.run(paths_to_rebuild)
             
-            print(f"✅ 索引重建完成！成功重建 {success_count} 张图片")
+            print(f"✅ 索引重建完成！成功重建 {self.image_count()} 张图片")
+            self._schedule_index_migration()
             
             # 保存新索引
             self.save_index()
             
         except Exception as e:
-            print(f"重建索引失败: {e}")
\ No newline at end of file
+            print(f"重建索引失败: {e}")
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本：去掉首尾空白并合并连续空白（大小写是否敏感由各模型的分词器决定，这里不处理）"""
+    return " ".join(text.split())
+
+
+class TextEmbeddingCache:
+    """
+    文本查询向量的 LRU 缓存
+    以 (模型名称, 规范化后的查询文本) 为键，重复查询和边输入边搜索时直接返回缓存的向量而不做模型推理；
+    缓存的向量为只读数组，调用方不能原地修改
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        if self.max_entries <= 0:
+            return None
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        vector = np.array(vector, dtype='float32')
+        vector.setflags(write=False)
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0
+            }
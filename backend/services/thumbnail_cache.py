@@ -0,0 +1,193 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class ThumbnailCache:
+    """
+    磁盘上的缩略图缓存
+    以 (路径, 修改时间, 文件大小, 目标尺寸, 格式) 的哈希为键，文件被修改后旧缩略图自然失效，
+    该键同时用作 HTTP 响应的 ETag；按键的前两位分目录保存，写入时先写临时文件再替换，
+    并发读取不会读到写了一半的文件。缓存总大小超过 max_bytes 时按最近最少使用的顺序淘汰，
+    命中时更新文件修改时间，重启后仍能恢复使用顺序；
+    get_or_create 对同一个键只让一个请求生成缩略图，其余请求等待后直接读取结果
+    """
+
+    def __init__(self, cache_dir: str = "thumbnail_cache", enabled: bool = True, max_bytes: int = 0):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: Optional[OrderedDict] = None  # 缓存文件路径 -> 大小，按使用时间从旧到新
+        self._total_bytes = 0
+        self._in_flight: Dict[str, List] = {}  # 正在生成的键 -> [该键的锁, 等待的请求数]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image_path: str, mtime_ns: int, size: int, target: Tuple[int, int], fmt: str) -> str:
+        raw = f"{image_path}\0{mtime_ns}\0{size}\0{target[0]}x{target[1]}\0{fmt}"
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _path_for(self, key: str, fmt: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+
+    def _stat_key(self, image_path: str, target: Tuple[int, int], fmt: str,
+                  stat: os.stat_result = None) -> Tuple[str, str]:
+        stat = stat or os.stat(image_path)
+        key = self.key(image_path, stat.st_mtime_ns, stat.st_size, target, fmt)
+        return key, self._path_for(key, fmt)
+
+    def etag(self, image_path: str, target: Tuple[int, int], fmt: str = "jpeg",
+             stat: os.stat_result = None) -> str:
+        return self._stat_key(image_path, target, fmt, stat)[0]
+
+    def _load_entries(self):
+        """首次使用时扫描缓存目录，按修改时间恢复使用顺序（调用方持有锁）"""
+        if self._entries is not None:
+            return
+        found = []
+        if os.path.isdir(self.cache_dir):
+            for shard in os.scandir(self.cache_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime_ns, entry.path, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self._total_bytes = sum(self._entries.values())
+
+    def _evict(self):
+        """淘汰最久未使用的缩略图，直到总大小不超过上限（调用方持有锁）"""
+        if not self.max_bytes:
+            return
+        while self._total_bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def contains(self, image_path: str, target: Tuple[int, int], fmt: str = "jpeg",
+                 stat: os.stat_result = None) -> bool:
+        if not self.enabled:
+            return False
+        _, path = self._stat_key(image_path, target, fmt, stat)
+        return os.path.exists(path)
+
+    def get(self, image_path: str, target: Tuple[int, int], fmt: str = "jpeg",
+            stat: os.stat_result = None) -> Optional[bytes]:
+        """读取缓存的缩略图，不存在（或原图已修改）时返回 None"""
+        if not self.enabled:
+            return None
+        _, path = self._stat_key(image_path, target, fmt, stat)
+        return self._read(path)
+
+    def _read(self, path: str, count: bool = True) -> Optional[bytes]:
+        """读取缓存文件并更新使用顺序；count 为 True 时计入命中/未命中次数"""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            if count:
+                with self._lock:
+                    self.misses += 1
+            return None
+
+        with self._lock:
+            if count:
+                self.hits += 1
+            self._load_entries()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, image_path: str, target: Tuple[int, int], data: bytes, fmt: str = "jpeg",
+            stat: os.stat_result = None):
+        if not self.enabled:
+            return
+        _, path = self._stat_key(image_path, target, fmt, stat)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"写入缩略图缓存失败 {image_path}: {e}")
+            return
+
+        with self._lock:
+            self._load_entries()
+            self._total_bytes += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._evict()
+
+    def find_larger(self, image_path: str, target: Tuple[int, int], tiers: Iterable[int],
+                    formats: Iterable[str], stat: os.stat_result = None) -> Optional[bytes]:
+        """
+        查找同一原图已缓存的、不小于目标尺寸的最小档位缩略图（任意格式），
+        用于直接缩放出较小的档位而不必重新解码原图
+        """
+        if not self.enabled:
+            return None
+        stat = stat or os.stat(image_path)
+        for tier in sorted(tier for tier in tiers if tier >= max(target)):
+            for fmt in formats:
+                _, path = self._stat_key(image_path, (tier, tier), fmt, stat)
+                if os.path.exists(path):
+                    return self.get(image_path, (tier, tier), fmt, stat)
+        return None
+
+    def get_or_create(self, image_path: str, target: Tuple[int, int], generate: Callable[[], bytes],
+                      fmt: str = "jpeg", stat: os.stat_result = None) -> bytes:
+        """
+        读取缓存的缩略图，未命中时调用 generate() 生成并写入缓存
+        同一缩略图的并发请求只有第一个调用 generate()，其余等待它写入缓存后读取
+        """
+        stat = stat or os.stat(image_path)
+        data = self.get(image_path, target, fmt, stat)
+        if data is not None or not self.enabled:
+            return data if data is not None else generate()
+
+        key, path = self._stat_key(image_path, target, fmt, stat)
+        with self._lock:
+            in_flight = self._in_flight.setdefault(key, [threading.Lock(), 0])
+            in_flight[1] += 1
+        try:
+            with in_flight[0]:
+                # 等待期间其他请求可能已经生成了同一缩略图（上面的 get 已计入未命中）
+                data = self._read(path, count=False)
+                if data is None:
+                    data = generate()
+                    self.put(image_path, target, data, fmt, stat)
+                return data
+        finally:
+            with self._lock:
+                in_flight[1] -= 1
+                if not in_flight[1]:
+                    del self._in_flight[key]
+
+    def stats(self):
+        with self._lock:
+            self._load_entries()
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+向量索引辅助函数的测试
+已删除的向量（墓碑）在索引内部排除，HNSW 的候选队列只按请求的结果数确定
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import faiss
+import numpy as np
+import pytest
+
+from services import ann_index
+
+
+def _vectors(count, dimension=32):
+    vectors = np.random.default_rng(0).random((count, dimension), dtype='float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("factory", ["Flat", "IVF16,Flat", "HNSW16"])
+def test_exclude_selector_skips_tombstones(factory):
+    """排除墓碑后仍返回完整的 top_k 个结果，且不含墓碑"""
+    vectors = _vectors(2000)
+    index = ann_index.create_index(vectors.shape[1], factory, len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+    tombstones = set(range(0, len(vectors), 2))
+
+    selector = ann_index.ExcludeSelector(tombstones)
+    params = ann_index.search_parameters(index, 20, nprobe=16, ef_search=64, selector=selector.selector)
+    _, ids = index.search(vectors[1:6], 20, params=params)
+
+    for row in ids.tolist():
+        assert len(row) == 20
+        assert all(image_id >= 0 and image_id not in tombstones for image_id in row)
+
+
+def test_hnsw_ef_search_follows_top_k():
+    index = ann_index.create_index(32, "HNSW16")
+    assert ann_index.search_parameters(index, 10, ef_search=64).efSearch == 64
+    assert ann_index.search_parameters(index, 200, ef_search=64).efSearch == 200
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+文件夹增量同步的回归测试（搜索服务使用 conftest.py 中的替身模型）
+按文件指纹区分新增、修改、删除和重命名的文件；
+子目录扫描失败时，其中已索引的图像不能被当作已删除的文件从索引中移除
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pytest
+
+from conftest import write_image
+from services import folder_scanner
+from services.folder_scanner import FolderScanner
+
+
+def _make_tree(root):
+    """root/a 下 3 张、root/b 和 root/b/c 下共 4 张、root/bb 下 1 张图片"""
+    paths = []
+    for folder, count in (("a", 3), ("b", 2), (os.path.join("b", "c"), 2), ("bb", 1)):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+        for i in range(count):
+            path = os.path.join(root, folder, f"{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(b"\xff\xd8\xff" + bytes([i]) * 16)
+            paths.append(path)
+    return paths
+
+
+def _fail_scandir(monkeypatch, failing_dir):
+    """让 failing_dir 的 os.scandir 抛出 EIO"""
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if os.fspath(path) == failing_dir:
+            raise OSError(5, "Input/output error", failing_dir)
+        return real_scandir(path)
+
+    monkeypatch.setattr(folder_scanner.os, "scandir", scandir)
+
+
+def test_scanner_records_failed_directories(tmp_path, monkeypatch):
+    """扫描失败的目录记录在 failed_paths 中，其下的文件不算作已读取"""
+    root = str(tmp_path)
+    _make_tree(root)
+    failing_dir = os.path.join(root, "b")
+    _fail_scandir(monkeypatch, failing_dir)
+
+    scanner = FolderScanner(workers=2, check_magic=False)
+    found = sorted(os.path.relpath(scanned.path, root) for scanned in scanner.scan(root))
+
+    assert found == [os.path.join("a", f"{i}.jpg") for i in range(3)] + [os.path.join("bb", "0.jpg")]
+    assert scanner.errors == 1
+    assert scanner.failed_paths == [failing_dir]
+    assert not scanner.was_listed(os.path.join(failing_dir, "0.jpg"))
+    assert not scanner.was_listed(os.path.join(failing_dir, "c", "0.jpg"))
+    assert scanner.was_listed(os.path.join(root, "a", "0.jpg"))
+    # 只按完整的目录名匹配，b 扫描失败不影响 bb
+    assert scanner.was_listed(os.path.join(root, "bb", "0.jpg"))
+
+
+def _index_tree(service, paths):
+    features = np.random.default_rng(0).random((len(paths), service.index.d), dtype='float32')
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    service.add_embeddings(paths, features, [{} for _ in paths])
+
+
+def test_sync_keeps_images_under_failed_directory(tmp_path, monkeypatch, search_service):
+    """重新同步时子目录扫描失败：不删除、不重命名其中的图像，并在结果中报告"""
+    root = str(tmp_path / "photos")
+    paths = _make_tree(root)
+    _index_tree(search_service, paths)
+    _fail_scandir(monkeypatch, os.path.join(root, "b"))
+
+    scanner = FolderScanner(workers=2, check_magic=False)
+    changes = search_service.sync_folder(root, scanner.scan(root), estimated_total=scanner.estimated_total,
+                                         was_listed=scanner.was_listed)
+
+    assert changes["deleted"] == 0
+    assert changes["renamed"] == 0
+    assert changes["skipped"] == 4
+    assert changes["unchanged"] == 4
+    assert all(path in search_service.path_to_id for path in paths)
+
+
+def test_sync_still_deletes_removed_files(tmp_path, search_service):
+    """扫描没有出错时，消失的文件照常从索引中删除"""
+    root = str(tmp_path / "photos")
+    paths = _make_tree(root)
+    _index_tree(search_service, paths)
+    removed = [path for path in paths if os.sep + "b" + os.sep in path]
+    for path in removed:
+        os.remove(path)
+
+    scanner = FolderScanner(workers=2, check_magic=False)
+    changes = search_service.sync_folder(root, scanner.scan(root), estimated_total=scanner.estimated_total,
+                                         was_listed=scanner.was_listed)
+
+    assert changes["deleted"] == len(removed) == 4
+    assert changes["skipped"] == 0
+    assert not any(path in search_service.path_to_id for path in removed)
+
+
+def _sync(service, root):
+    scanner = FolderScanner(workers=2, check_magic=False)
+    return service.sync_folder(root, scanner.scan(root), estimated_total=scanner.estimated_total,
+                               was_listed=scanner.was_listed)
+
+
+def test_sync_classifies_new_changed_deleted_and_unchanged(tmp_path, search_service):
+    """第二次同步只编码新增和修改过的文件，消失的文件从索引中删除"""
+    root = str(tmp_path / "photos")
+    paths = [write_image(os.path.join(root, f"{i}.png"), seed=i) for i in range(5)]
+    first = _sync(search_service, root)
+    assert (first["new"], first["added"]) == (5, 5)
+
+    write_image(paths[0], seed=100, size=(80, 60))
+    os.remove(paths[1])
+    added = write_image(os.path.join(root, "sub", "new.png"), seed=200)
+    changes = _sync(search_service, root)
+
+    assert changes["new"] == 1
+    assert changes["changed"] == 1
+    assert changes["deleted"] == 1
+    assert changes["unchanged"] == 3
+    assert changes["added"] == 2
+    assert set(search_service.path_to_id) == {paths[0], added} | set(paths[2:])
+
+
+def test_sync_renames_moved_files_without_reencoding(tmp_path, search_service, stub_model):
+    """被重命名或移动到子目录的文件只更新路径：向量ID不变，不重新编码，文件清单沿用原记录"""
+    root = str(tmp_path / "photos")
+    paths = [write_image(os.path.join(root, f"{i}.png"), seed=i, size=(64 + i, 48)) for i in range(4)]
+    _sync(search_service, root)
+    ids = {path: search_service.path_to_id[path] for path in paths}
+    forward_batches = list(stub_model.forward_batches)
+
+    renamed = os.path.join(root, "renamed.png")
+    moved = os.path.join(root, "sub", "moved.png")
+    os.rename(paths[0], renamed)
+    os.makedirs(os.path.dirname(moved))
+    os.rename(paths[1], moved)
+    changes = _sync(search_service, root)
+
+    assert changes["renamed"] == 2
+    assert changes["new"] == 0 and changes["deleted"] == 0 and changes["added"] == 0
+    assert stub_model.forward_batches == forward_batches
+    assert search_service.path_to_id[renamed] == ids[paths[0]]
+    assert search_service.path_to_id[moved] == ids[paths[1]]
+    assert paths[0] not in search_service.path_to_id and paths[0] not in search_service.file_manifest
+    stat = os.stat(moved)
+    fingerprint = search_service.file_manifest.entries[moved]
+    assert (fingerprint.size, fingerprint.mtime_ns) == (stat.st_size, stat.st_mtime_ns)
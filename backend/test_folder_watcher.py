@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+文件夹监听（FolderWatcher）的回归测试，使用真实的 inotify 事件（仅 Linux）
+搜索服务替换为只记录调用的对象
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import config
+from services.folder_watcher import FolderWatcher, watch_supported
+
+pytestmark = pytest.mark.skipif(not watch_supported(), reason="文件夹监听仅支持 Linux")
+
+
+class RecordingService:
+    """记录监听线程提交的新增与删除"""
+
+    def __init__(self):
+        self.file_manifest = type("Manifest", (), {"entries": {}})()
+        self.path_to_id = {}
+        self.added = []
+        self.removed_folders = []
+
+    def add_images(self, paths, batch_size=None, replace_existing=False):
+        self.added.extend(paths)
+        return len(paths)
+
+    def remove_images(self, paths):
+        return len(paths)
+
+    def remove_folder(self, folder_path):
+        self.removed_folders.append(folder_path)
+        return 0
+
+    def checkpoint(self):
+        pass
+
+
+def _write(path):
+    with open(path, "wb") as f:
+        f.write(b"\xff\xd8\xff" + b"\0" * 16)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "WATCH_DEBOUNCE_SECONDS", 0.1)
+    monkeypatch.setattr(config, "WATCH_MAX_IMAGES_PER_SECOND", 0)
+    watcher = FolderWatcher(RecordingService(), state_path=str(tmp_path / "watched.json"))
+    yield watcher
+    for folder_path in list(watcher.folders):
+        watcher.unwatch(folder_path)
+
+
+def test_new_directory_at_renamed_path_is_watched(tmp_path, watcher):
+    """root/A 改名为 root/B 后再新建 root/A，其中新写入的图片也会被索引"""
+    root = tmp_path / "photos"
+    (root / "A").mkdir(parents=True)
+    watcher.watch(str(root))
+
+    os.rename(root / "A", root / "B")
+    assert _wait_for(lambda: str(root / "A") in watcher.search_service.removed_folders)
+    (root / "A").mkdir()
+    # 新的 A 有自己的监听，而不是沿用已移到 B 的旧监听
+    watches = watcher._dir_to_wd
+    assert _wait_for(lambda: watches.get(str(root / "A")) not in (None, watches.get(str(root / "B"))))
+    time.sleep(0.2)
+    _write(root / "A" / "x.jpg")
+    _write(root / "B" / "y.jpg")
+
+    service = watcher.search_service
+    assert _wait_for(lambda: {str(root / "A" / "x.jpg"), str(root / "B" / "y.jpg")} <= set(service.added))
+    assert watcher._dir_to_wd.keys() == {str(root), str(root / "A"), str(root / "B")}
+
+
+def test_removed_subtree_is_no_longer_watched(tmp_path, watcher):
+    """删除或移出子目录树后，其中所有目录的监听都被移除"""
+    root = tmp_path / "photos"
+    (root / "A" / "nested").mkdir(parents=True)
+    (root / "C").mkdir()
+    outside = tmp_path / "outside"
+    watcher.watch(str(root))
+    assert len(watcher._dir_to_wd) == 4
+
+    os.rename(root / "A", outside)
+    (root / "C").rmdir()
+
+    assert _wait_for(lambda: list(watcher._dir_to_wd) == [str(root)])
+    _write(outside / "nested" / "z.jpg")
+    time.sleep(0.3)
+    assert not any(path.startswith(str(outside)) for path in watcher.search_service.added)
+
+
+def test_moved_watched_folder_is_unregistered(tmp_path, watcher):
+    """登记的文件夹本身被移走时停止监听，并删除其中已索引的图像"""
+    root = tmp_path / "photos"
+    (root / "A").mkdir(parents=True)
+    watcher.watch(str(root))
+
+    os.rename(root, tmp_path / "moved")
+
+    assert _wait_for(lambda: str(root) in watcher.search_service.removed_folders)
+    assert watcher.folders == []
+    assert watcher._dir_to_wd == {}
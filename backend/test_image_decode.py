@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+缩小解码（prepare_reduced）的回归测试
+调色板、1 位、16 位等 reduce() 不支持的模式也要能缩小解码为 RGB
+"""
+
+import io
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+
+from services.image_decode import prepare_reduced
+
+
+def _encode(img, fmt, **options):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **options)
+    buf.seek(0)
+    return Image.open(buf)
+
+
+def _palette_image():
+    img = Image.new('RGB', (960, 720), (200, 30, 40)).convert('P', palette=Image.Palette.ADAPTIVE)
+    assert img.mode == 'P'
+    return img
+
+
+@pytest.mark.parametrize("name, img, fmt, options", [
+    ("palette-gif", _palette_image(), "GIF", {}),
+    ("palette-png", _palette_image(), "PNG", {}),
+    ("palette-transparent-png", _palette_image(), "PNG", {"transparency": 0}),
+    ("1-bit", Image.new('1', (960, 720), 1), "PNG", {}),
+    ("16-bit", Image.new('I;16', (960, 720), 50000), "PNG", {}),
+    ("grayscale", Image.new('L', (960, 720), 128), "PNG", {}),
+    ("rgba", Image.new('RGBA', (960, 720), (10, 20, 30, 255)), "PNG", {}),
+])
+def test_prepare_reduced_handles_image_modes(name, img, fmt, options):
+    """各种模式都缩小到不小于目标尺寸的 RGB 图像，颜色不因缩小而错乱"""
+    source = _encode(img, fmt, **options)
+    expected = source.convert('RGB').getpixel((0, 0))
+
+    reduced = prepare_reduced(source, (224, 224))
+
+    assert reduced.mode == 'RGB'
+    assert min(reduced.size) >= 224
+    assert reduced.width < 960
+    assert reduced.getpixel((0, 0)) == pytest.approx(expected, abs=2)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+图片相关接口的测试：缩略图档位与 304 条件请求、批量缩略图（multipart）、原图 Range 请求
+app 在导入时创建服务实例，这里让模型加载返回 conftest.py 中的替身模型，状态文件写在临时目录中
+"""
+
+import io
+import os
+import sys
+import email
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+
+from conftest import StubClipModel, StubClipProcessor, write_image
+from services import model_loader
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    state_dir = tmp_path_factory.mktemp("app_state")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(state_dir)
+        patch.setattr(model_loader, "_shared_models", {})
+        patch.setattr(model_loader, "load_clip_model", lambda model_path: (StubClipModel(), StubClipProcessor()))
+        import app
+        yield app.app.test_client()
+
+
+@pytest.fixture
+def photo(tmp_path):
+    return write_image(tmp_path / "photo.jpg", seed=1, size=(1200, 900), fmt="JPEG")
+
+
+def _image_size(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+@pytest.mark.parametrize("size, longest", [("tiny", 64), ("small", 256), ("300", 512), ("medium", 512)])
+def test_thumbnail_tiers(client, photo, size, longest):
+    """size 取档位名称或像素数，向上取到最近的档位"""
+    response = client.get("/api/image-proxy", query_string={"path": photo, "size": size})
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert max(_image_size(response.data)) == longest
+
+
+@pytest.mark.parametrize("size", ["huge", "-1", "abc"])
+def test_invalid_thumbnail_size_is_rejected(client, photo, size):
+    response = client.get("/api/image-proxy", query_string={"path": photo, "size": size})
+    assert response.status_code == 400
+
+
+def test_thumbnail_conditional_requests(client, photo):
+    """带匹配的 If-None-Match 时返回 304；原图修改后 ETag 变化，重新返回缩略图"""
+    first = client.get("/api/image-proxy", query_string={"path": photo, "size": "small"})
+    etag = first.headers["ETag"]
+    assert "Accept" in first.headers["Vary"]
+
+    cached = client.get("/api/image-proxy", query_string={"path": photo, "size": "small"},
+                        headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    write_image(photo, seed=2, size=(1200, 900), fmt="JPEG")
+    stat = os.stat(photo)
+    os.utime(photo, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000_000))
+    changed = client.get("/api/image-proxy", query_string={"path": photo, "size": "small"},
+                         headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_batch_thumbnails_multipart(client, tmp_path):
+    """批量缩略图以 multipart/mixed 返回，每部分带序号，无法生成的图片返回 JSON 错误"""
+    paths = [write_image(tmp_path / f"{i}.png", seed=i, size=(600, 400)) for i in range(3)]
+    requested = [paths[0], str(tmp_path / "missing.png"), paths[2]]
+
+    response = client.post("/api/thumbnails/batch", json={"paths": requested, "size": "tiny"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "multipart/mixed"
+    raw = f"Content-Type: {response.headers['Content-Type']}\r\n\r\n".encode() + response.data
+    parts = {int(part["X-Index"]): part for part in email.message_from_bytes(raw).get_payload()}
+    assert sorted(parts) == [0, 1, 2]
+    assert parts[1].get_content_type() == "application/json"
+    for index in (0, 2):
+        body = parts[index].get_payload(decode=True)
+        assert parts[index].get_content_type() == "image/jpeg"
+        assert int(parts[index]["Content-Length"]) == len(body)
+        assert max(_image_size(body)) == 64
+
+
+def test_batch_thumbnails_validates_request(client, photo):
+    assert client.post("/api/thumbnails/batch", json={"paths": []}).status_code == 400
+    assert client.post("/api/thumbnails/batch", json={"paths": [photo], "size": "huge"}).status_code == 400
+
+
+def test_original_image_range_request(client, photo):
+    """原图接口支持 Range 分段请求"""
+    with open(photo, 'rb') as f:
+        content = f.read()
+
+    full = client.get("/api/image-original", query_string={"path": photo})
+    assert full.status_code == 200
+    assert full.headers["Accept-Ranges"] == "bytes"
+    assert full.data == content
+
+    partial = client.get("/api/image-original", query_string={"path": photo}, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(content)}"
+    assert partial.data == content[100:200]
+
+    cached = client.get("/api/image-original", query_string={"path": photo},
+                        headers={"If-None-Match": full.headers["ETag"]})
+    assert cached.status_code == 304
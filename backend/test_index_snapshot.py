@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+版本化索引快照的测试
+校验不通过的快照被跳过，加载时退回到上一个完整的快照
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from services.index_snapshot import CURRENT_FILE, IndexSnapshotStore
+
+
+def _corrupt(path):
+    """翻转文件中间的一个字节，文件大小不变"""
+    with open(path, 'r+b') as f:
+        f.seek(os.path.getsize(path) // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+def test_latest_falls_back_when_current_snapshot_is_corrupt(tmp_path):
+    store = IndexSnapshotStore(str(tmp_path / "snapshots"), keep=3)
+    first = store.write({"data.bin": b"a" * 1024}, {"label": "first"})
+    second = store.write({"data.bin": b"b" * 1024}, {"label": "second"})
+    with open(tmp_path / "snapshots" / CURRENT_FILE, encoding='utf-8') as f:
+        assert f.read() == os.path.basename(second)
+    assert store.latest()[0] == second
+
+    _corrupt(os.path.join(second, "data.bin"))
+
+    assert store.verify(second) is None
+    # 只比较大小时发现不了内容损坏
+    assert store.verify(second, checksums=False) is not None
+    path, manifest = store.latest()
+    assert path == first
+    assert manifest["label"] == "first"
+
+
+def test_truncated_snapshot_is_rejected(tmp_path):
+    store = IndexSnapshotStore(str(tmp_path / "snapshots"))
+    path = store.write({"data.bin": b"x" * 1024}, {})
+    with open(os.path.join(path, "data.bin"), 'r+b') as f:
+        f.truncate(100)
+
+    assert store.verify(path, checksums=False) is None
+    assert store.latest() is None
+
+
+def test_old_snapshots_are_pruned(tmp_path):
+    store = IndexSnapshotStore(str(tmp_path / "snapshots"), keep=2)
+    paths = [store.write({"data.bin": bytes([i]) * 16}, {}) for i in range(4)]
+
+    remaining = sorted(name for name in os.listdir(tmp_path / "snapshots") if name.startswith("snapshot-"))
+    assert remaining == [os.path.basename(path) for path in paths[2:]]
+
+
+def test_service_rolls_back_to_previous_snapshot(tmp_path, search_service):
+    """最新快照损坏时服务加载上一个快照，快照之后才写入元数据库的图像被移除"""
+    from services.search_service import SemanticSearchService
+
+    features = np.eye(512, dtype='float32')[:5]
+    paths = [str(tmp_path / f"{i}.jpg") for i in range(5)]
+    search_service.add_embeddings(paths[:3], features[:3], [{} for _ in range(3)])
+    search_service.save_index()
+    search_service.add_embeddings(paths[3:], features[3:], [{} for _ in range(2)])
+    search_service.save_index()
+
+    snapshot_path, _ = search_service.snapshot_store.latest()
+    _corrupt(os.path.join(snapshot_path, "index.faiss"))
+
+    reloaded = SemanticSearchService()
+    assert reloaded.index.ntotal == 3
+    assert sorted(reloaded.path_to_id) == sorted(paths[:3])
+    assert reloaded.metadata_store.get_many(set(range(5))).keys() == set(reloaded.id_to_path)
+    hits = reloaded._search_ids(features[1:2], top_k=1)
+    assert [reloaded.id_to_path[image_id] for image_id, _ in hits] == [paths[1]]
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+入库流水线（IngestPipeline）的测试，预处理、推理和写入都使用不依赖模型的函数
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from services.ingest_pipeline import IngestPipeline
+
+
+def test_cache_hits_counted_across_inference_workers():
+    """多个推理线程同时处理命中缓存的条目时，命中数不丢失"""
+    paths = [f"/photos/{i}.jpg" for i in range(2000)]
+    cached = np.ones(4, dtype='float32')
+    written = []
+
+    def preprocess(path):
+        # 偶数编号命中向量缓存，奇数编号需要推理
+        index = int(os.path.basename(path).split('.')[0])
+        if index % 2 == 0:
+            return None, {}, cached
+        return np.zeros((3, 2, 2), dtype='float32'), {}, None
+
+    def infer(pixel_values):
+        return np.zeros((len(pixel_values), 4), dtype='float32')
+
+    def write(batch_paths, features, metadatas, failed):
+        written.extend(batch_paths)
+
+    pipeline = IngestPipeline(preprocess, infer, write, batch_size=8, decode_workers=4,
+                              inference_workers=4, batch_timeout=0.01)
+    added = pipeline.run(paths)
+
+    assert added == len(paths)
+    assert sorted(written) == sorted(paths)
+    assert pipeline.stage_stats()["cacheHits"] == len(paths) // 2
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+搜索过滤条件的回归测试
+位图之外的向量ID（已删除或比位图更晚加入的向量）不能被当作满足过滤条件；
+格式错误的过滤参数抛出 ValueError（接口返回 400）
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import faiss
+import numpy as np
+import pytest
+
+from services.metadata_filter import BitmapSelector, parse_filters
+
+
+def _id_mapped_index(count, dimension=16):
+    vectors = np.random.default_rng(0).random((count, dimension), dtype='float32')
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    index.add_with_ids(vectors, np.arange(count, dtype='int64'))
+    return index, vectors
+
+
+def test_ids_beyond_mask_are_not_members():
+    mask = np.zeros(10, dtype=bool)
+    mask[[1, 4, 9]] = True
+    selector = BitmapSelector(mask)
+
+    members = [image_id for image_id in range(1000) if selector.selector.is_member(image_id)]
+    assert members == [1, 4, 9]
+
+
+def test_filtered_search_returns_only_masked_ids():
+    """索引中的向量远多于位图长度，搜索结果只能来自位图，数量不超过位图中的向量数"""
+    index, vectors = _id_mapped_index(500)
+    mask = np.zeros(20, dtype=bool)
+    mask[::3] = True
+    selector = BitmapSelector(mask)
+
+    params = faiss.SearchParameters(sel=selector.selector)
+    _, ids = index.search(vectors[:5], 50, params=params)
+
+    expected = set(np.flatnonzero(mask).tolist())
+    for row in ids.tolist():
+        found = [image_id for image_id in row if image_id >= 0]
+        assert set(found) == expected
+        assert len(found) == len(expected)
+
+
+def test_parse_filters_normalizes_formats_and_folders():
+    filters = parse_filters({"formats": ["jpg", "PNG"], "folder": "/photos"})
+    assert filters["formats"] == {"JPEG", "PNG"}
+    assert filters["folders"] == ["/photos"]
+    assert parse_filters({"format": "tif"})["formats"] == {"TIFF"}
+
+
+@pytest.mark.parametrize("raw", [
+    {"formats": [1, 2]},
+    {"formats": ["jpeg", None]},
+    {"formats": {"jpeg": True}},
+    {"formats": 5},
+    {"folder": 3},
+    {"folders": ["/photos", ["/nested"]]},
+])
+def test_parse_filters_rejects_non_string_values(raw):
+    with pytest.raises(ValueError):
+        parse_filters(raw)
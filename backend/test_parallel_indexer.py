@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+多进程索引（parallel_indexer）的回归测试
+工作进程不重新执行服务进程的 __main__，路径按需切分为分片而不是先收集完整列表
+"""
+
+import os
+import sys
+import subprocess
+import textwrap
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import config
+from services import parallel_indexer
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_spawn_workers_do_not_import_main_module(tmp_path):
+    """spawn 启动的工作进程不重新执行父进程的 __main__（服务进程中为 app.py）"""
+    script = tmp_path / "main_script.py"
+    script.write_text(textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {BACKEND_DIR!r})
+        print("main-imported", flush=True)
+        from concurrent.futures import ProcessPoolExecutor
+        from services import parallel_indexer
+
+        if __name__ == "__main__":
+            context = parallel_indexer._process_context("spawn")
+            with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+                pids = set(executor.submit(os.getpid).result() for _ in range(4))
+            print("workers", len(pids), flush=True)
+    """))
+
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.count("main-imported") == 1
+    assert "workers" in result.stdout
+
+
+def _fake_init_worker(model_path, torch_threads, cache_dir):
+    pass
+
+
+def _fake_encode_shard(image_paths, batch_size):
+    features = np.ones((len(image_paths), 4), dtype='float32')
+    return list(image_paths), features, [{} for _ in image_paths], [], 0.0
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="需要 fork 启动方式")
+def test_paths_are_sharded_lazily(monkeypatch):
+    """生成器中的路径按需读取：写入第一个分片时还没有读完所有路径"""
+    # fork 出的工作进程继承这里替换的编码函数，不需要加载模型
+    monkeypatch.setattr(config, "INDEX_PROCESS_START_METHOD", "fork")
+    monkeypatch.setattr(parallel_indexer, "_init_worker", _fake_init_worker)
+    monkeypatch.setattr(parallel_indexer, "_encode_shard", _fake_encode_shard)
+
+    consumed = [0]
+    consumed_at_first_write = []
+    written = []
+    progress = []
+
+    def paths():
+        for i in range(200):
+            consumed[0] += 1
+            yield f"/photos/{i}.jpg"
+
+    def write_fn(paths, features, metadatas, failed):
+        consumed_at_first_write.append(consumed[0])
+        written.extend(paths)
+
+    added = parallel_indexer.index_with_processes(
+        paths(), "model", write_fn, workers=2, shard_size=10, batch_size=5,
+        progress_callback=lambda processed, total, stats: progress.append((processed, total))
+    )
+
+    assert added == 200
+    assert sorted(written) == sorted(f"/photos/{i}.jpg" for i in range(200))
+    # 同时处理的分片不超过工作进程数的两倍
+    assert consumed_at_first_write[0] <= 2 * 2 * 10
+    assert progress[-1] == (200, 200)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+分页搜索结果集缓存的测试：按令牌读取、过期、按大小淘汰和清空
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from services.result_cache import SearchResultCache
+
+
+def _result_set(count):
+    return {"ids": np.arange(count, dtype='int64'), "scores": np.zeros(count, dtype='float32')}
+
+
+def test_get_returns_stored_result_set():
+    cache = SearchResultCache()
+    result_set = _result_set(10)
+    token = cache.put(result_set)
+    assert cache.get(token) is result_set
+    assert cache.get("unknown") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_result_sets_are_dropped():
+    cache = SearchResultCache(ttl=0.05)
+    token = cache.put(_result_set(10))
+    time.sleep(0.1)
+    assert cache.get(token) is None
+
+
+def test_least_recently_used_is_evicted_over_budget():
+    size = _result_set(100)["ids"].nbytes + _result_set(100)["scores"].nbytes
+    cache = SearchResultCache(max_bytes=size * 2)
+    first = cache.put(_result_set(100))
+    second = cache.put(_result_set(100))
+    cache.get(first)
+    third = cache.put(_result_set(100))
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None and cache.get(third) is not None
+    assert cache.stats()["bytes"] <= size * 2
+
+
+def test_replace_and_clear():
+    cache = SearchResultCache()
+    token = cache.put(_result_set(10))
+    deeper = _result_set(40)
+    assert cache.replace(token, deeper)
+    assert cache.get(token) is deeper
+
+    cache.clear()
+    assert cache.get(token) is None
+    assert not cache.replace(token, deeper)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+SemanticSearchService 的行为测试（使用 conftest.py 中的替身模型）
+墓碑过滤与索引压缩、批量搜索的批量编码
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import config
+from conftest import write_image
+
+
+def _add_unit_vectors(service, tmp_path, count):
+    """第 i 张图像的向量是第 i 个单位向量，搜索该向量时它应排在第一"""
+    paths = [str(tmp_path / f"{i}.jpg") for i in range(count)]
+    service.add_embeddings(paths, np.eye(512, dtype='float32')[:count], [{} for _ in paths])
+    return paths
+
+
+def _top_path(service, vector):
+    hits = service._search_ids(vector.reshape(1, -1), top_k=1)
+    return service.id_to_path[hits[0][0]] if hits else None
+
+
+def test_removed_images_are_excluded_until_compaction(tmp_path, monkeypatch, search_service):
+    """删除的图像先作为墓碑留在索引中但不出现在结果里，压缩后从索引中真正删除"""
+    monkeypatch.setattr(config, "COMPACT_MIN_TOMBSTONES", 1000)
+    paths = _add_unit_vectors(search_service, tmp_path, 20)
+    vectors = np.eye(512, dtype='float32')
+
+    removed = search_service.remove_images(paths[:10])
+
+    assert removed == 10
+    assert search_service.index.ntotal == 20
+    assert len(search_service.tombstones) == 10
+    assert _top_path(search_service, vectors[3]) != paths[3]
+    hits = search_service._search_ids(vectors[3].reshape(1, -1), top_k=20)
+    assert {search_service.id_to_path[image_id] for image_id, _ in hits} == set(paths[10:])
+
+    assert search_service.compact_index() == 10
+    assert search_service.index.ntotal == 10
+    assert search_service.tombstones == set()
+    assert _top_path(search_service, vectors[15]) == paths[15]
+
+
+def test_compaction_runs_in_background_after_threshold(tmp_path, monkeypatch, search_service):
+    """墓碑数量达到阈值时自动在后台压缩"""
+    monkeypatch.setattr(config, "COMPACT_MIN_TOMBSTONES", 5)
+    monkeypatch.setattr(config, "COMPACT_TOMBSTONE_RATIO", 0.0)
+    paths = _add_unit_vectors(search_service, tmp_path, 20)
+
+    search_service.remove_images(paths[:4])
+    assert search_service._compaction_thread is None
+    search_service.remove_images(paths[4:6])
+    search_service._compaction_thread.join(timeout=10)
+
+    assert search_service.index.ntotal == 14
+    assert search_service.tombstones == set()
+
+
+def test_readded_path_replaces_old_vector(tmp_path, search_service):
+    """同一路径重新入库时旧向量记为墓碑，搜索只返回新向量"""
+    paths = _add_unit_vectors(search_service, tmp_path, 3)
+    old_id = search_service.path_to_id[paths[0]]
+
+    search_service.add_embeddings([paths[0]], np.eye(512, dtype='float32')[[10]], [{}])
+
+    assert old_id in search_service.tombstones
+    assert _top_path(search_service, np.eye(512, dtype='float32')[10]) == paths[0]
+    hits = search_service._search_ids(np.eye(512, dtype='float32')[0].reshape(1, -1), top_k=10)
+    assert old_id not in [image_id for image_id, _ in hits]
+
+
+def test_search_batch_encodes_image_queries_in_one_forward_pass(tmp_path, monkeypatch, search_service, stub_model):
+    """批量搜索中的所有查询图片在一次前向推理中编码（重复的只编码一次），无法读取的图片返回空结果"""
+    monkeypatch.setattr(search_service.embedding_cache, "enabled", False)
+    paths = [write_image(tmp_path / "photos" / f"{i}.png", seed=i) for i in range(4)]
+    assert search_service.add_images(paths) == 4
+    stub_model.forward_batches.clear()
+
+    queries = [("image", paths[2]), ("image", str(tmp_path / "missing.png")), ("image", paths[0]),
+               ("image", paths[2])]
+    results = search_service.search_batch(queries, top_k=1)
+
+    assert stub_model.forward_batches == [2]
+    assert [[hit["path"] for hit in result] for result in results] == [[paths[2]], [], [paths[0]], [paths[2]]]
+
+
+def test_search_batch_uses_cached_vectors_of_indexed_images(tmp_path, search_service, stub_model):
+    """向量缓存开启时，已入库图片作为查询直接使用缓存的向量，不做前向推理"""
+    assert search_service.embedding_cache.enabled
+    paths = [write_image(tmp_path / "photos" / f"{i}.png", seed=i) for i in range(3)]
+    search_service.add_images(paths)
+    stub_model.forward_batches.clear()
+
+    results = search_service.search_batch([("image", path) for path in paths], top_k=1)
+
+    assert stub_model.forward_batches == []
+    assert [result[0]["path"] for result in results] == paths
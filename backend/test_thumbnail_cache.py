@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+缩略图磁盘缓存（ThumbnailCache）的并发测试
+同一缩略图的并发请求只生成一次，命中/未命中计数不丢失
+"""
+
+import os
+import sys
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from services.thumbnail_cache import ThumbnailCache
+
+
+def _run_threads(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_requests_generate_once(tmp_path):
+    """同一缩略图的并发请求只调用一次 generate()，其余请求读取其结果"""
+    image_path = tmp_path / "photo.jpg"
+    image_path.write_bytes(b"\xff\xd8\xff" + b"\0" * 16)
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+    calls = []
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.2)
+        return b"thumbnail"
+
+    results = _run_threads(8, lambda: cache.get_or_create(str(image_path), (256, 256), generate))
+
+    assert results == [b"thumbnail"] * 8
+    assert len(calls) == 1
+    assert cache._in_flight == {}
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8
+    assert stats["entries"] == 1
+
+
+def test_counters_are_not_lost_under_concurrency(tmp_path):
+    """多线程同时读取时命中与未命中次数准确"""
+    image_path = tmp_path / "photo.jpg"
+    image_path.write_bytes(b"\xff\xd8\xff" + b"\0" * 16)
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+    cache.put(str(image_path), (256, 256), b"thumbnail")
+
+    def read_many():
+        for _ in range(200):
+            cache.get(str(image_path), (256, 256))
+            cache.get(str(image_path), (64, 64))
+
+    _run_threads(8, read_many)
+
+    stats = cache.stats()
+    assert stats["hits"] == 8 * 200
+    assert stats["misses"] == 8 * 200
+
+
+def test_failed_generation_is_not_cached(tmp_path):
+    """generate() 抛出异常时不写入缓存，之后的请求重新生成"""
+    image_path = tmp_path / "photo.jpg"
+    image_path.write_bytes(b"\xff\xd8\xff" + b"\0" * 16)
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+
+    def fail():
+        raise ValueError("bad image")
+
+    with pytest.raises(ValueError):
+        cache.get_or_create(str(image_path), (256, 256), fail)
+    assert cache._in_flight == {}
+    assert cache.get_or_create(str(image_path), (256, 256), lambda: b"thumbnail") == b"thumbnail"
@@ -20,12 +20,24 @@ export const extractFeatures = async (imagePath: string) => {
   }
 }
 
-// 文本搜索
-export const searchByText = async (query: string, topK: number = 10) => {
+// 搜索过滤条件：文件夹（含子文件夹）、拍摄日期范围（YYYY-MM-DD，含边界）、格式、最小分辨率
+export interface SearchFilters {
+  folder?: string | string[]
+  dateFrom?: string
+  dateTo?: string
+  formats?: string[]
+  minWidth?: number
+  minHeight?: number
+}
+
+// 文本搜索；提供 pageSize 时分页返回第一页和游标（cursor / nextOffset），后续页用 fetchSearchPage 获取
+export const searchByText = async (query: string, topK: number = 10, filters?: SearchFilters, pageSize?: number) => {
   try {
     const response = await apiClient.post('/search-by-text', { 
       query,
-      topK 
+      topK,
+      filters,
+      pageSize
     })
     return response.data
   } catch (error) {
@@ -35,12 +47,15 @@ export const searchByText = async (query: string, topK: number = 10) => {
 }
 
 // 以图搜图 - 支持文件上传
-export const searchByImage = async (imageFile: File | string, topK: number = 10) => {
+export const searchByImage = async (imageFile: File | string, topK: number = 10, filters?: SearchFilters, pageSize?: number) => {
   try {
     if (imageFile instanceof File) {
       // 使用FormData上传文件
       const formData = new FormData()
       formData.append('image', imageFile)
+      if (filters) {
+        formData.append('filters', JSON.stringify(filters))
+      }
       
       // 发送multipart/form-data请求，使用apiClient但设置特殊headers
       const response = await apiClient.post('/search-by-image', formData, {
@@ -48,7 +63,8 @@ export const searchByImage = async (imageFile: File | string, topK: number = 10)
           'Content-Type': 'multipart/form-data'
         },
         params: {
-          topK: topK
+          topK: topK,
+          pageSize
         }
       })
       return response.data
@@ -56,7 +72,9 @@ export const searchByImage = async (imageFile: File | string, topK: number = 10)
       // 传入的是文件路径
       const response = await apiClient.post('/search-by-image', { 
         imagePath: imageFile,
-        topK 
+        topK,
+        filters,
+        pageSize
       })
       return response.data
     }
@@ -66,6 +84,38 @@ export const searchByImage = async (imageFile: File | string, topK: number = 10)
   }
 }
 
+// 分页搜索的后续页，直接从服务端缓存的结果集中切片；结果集过期（410）时需要重新搜索
+export const fetchSearchPage = async (cursor: string, offset: number, pageSize: number = 20) => {
+  try {
+    const response = await apiClient.post('/search-results', {
+      cursor,
+      offset,
+      pageSize
+    })
+    return response.data
+  } catch (error) {
+    console.error('获取搜索结果页失败:', error)
+    throw error
+  }
+}
+
+// 批量搜索：多个文本查询和/或图片路径一次请求，返回的 results 与 queries 一一对应
+export type BatchQuery = string | { text: string } | { imagePath: string }
+
+export const searchBatch = async (queries: BatchQuery[], topK: number = 10, filters?: SearchFilters) => {
+  try {
+    const response = await apiClient.post('/search-batch', {
+      queries,
+      topK,
+      filters
+    })
+    return response.data
+  } catch (error) {
+    console.error('批量搜索失败:', error)
+    throw error
+  }
+}
+
 // 处理文件夹
 export const processFolder = async (folderPath: string) => {
   try {
@@ -91,6 +141,17 @@ export const reindexFolder = async (folderPath: string, model?: string) => {
   }
 }
 
+// 删除文件夹索引
+export const removeFolder = async (folderPath: string) => {
+  try {
+    const response = await apiClient.post('/remove-folder', { folderPath })
+    return response.data
+  } catch (error) {
+    console.error('删除文件夹索引失败:', error)
+    throw error
+  }
+}
+
 // 获取处理状态
 export const getProcessingStatus = async (taskId: string) => {
   try {
@@ -102,18 +163,86 @@ export const getProcessingStatus = async (taskId: string) => {
   }
 }
 
-// 获取缩略图
-export const getThumbnail = (imagePath: string) => {
+// 缩略图尺寸档位（像素），服务端会把请求的尺寸向上取整到档位
+export type ThumbnailSize = 'tiny' | 'small' | 'medium' | 'large' | number
+
+// 获取缩略图（默认 small 档位，格式由浏览器的 Accept 头协商为 WebP 或 JPEG）
+export const getThumbnail = (imagePath: string, size?: ThumbnailSize) => {
   try {
     // 使用新的图片代理接口
     const encodedPath = encodeURIComponent(imagePath)
-    return `${API_BASE_URL}/image-proxy?path=${encodedPath}`
+    const sizeParam = size !== undefined ? `&size=${size}` : ''
+    return `${API_BASE_URL}/image-proxy?path=${encodedPath}${sizeParam}`
   } catch (error) {
     console.error('获取缩略图失败:', error)
     throw error
   }
 }
 
+// 获取原图URL（支持分段加载和浏览器缓存）
+export const getOriginalImage = (imagePath: string) => {
+  return `${API_BASE_URL}/image-original?path=${encodeURIComponent(imagePath)}`
+}
+
+// 批量获取缩略图：服务端以 multipart/mixed 流式返回，每收到一张就回调一次（参数为图片路径和 blob URL）
+export const fetchThumbnailsBatch = async (
+  paths: string[],
+  onThumbnail: (path: string, url: string) => void,
+  size?: ThumbnailSize
+) => {
+  const response = await fetch(`${API_BASE_URL}/thumbnails/batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Accept': 'image/avif,image/webp,image/jpeg' },
+    body: JSON.stringify({ paths, size })
+  })
+  const boundary = /boundary=([^;]+)/.exec(response.headers.get('Content-Type') || '')?.[1]
+  if (!response.ok || !response.body || !boundary) {
+    throw new Error(`批量获取缩略图失败: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = new Uint8Array(0)
+
+  // 查找各部分头部结束位置（\r\n\r\n）
+  const headerEnd = (data: Uint8Array) => {
+    for (let i = 0; i + 3 < data.length; i++) {
+      if (data[i] === 13 && data[i + 1] === 10 && data[i + 2] === 13 && data[i + 3] === 10) return i
+    }
+    return -1
+  }
+
+  while (true) {
+    // 解析缓冲区中所有完整的部分，每部分的长度由 Content-Length 给出
+    while (true) {
+      const end = headerEnd(buffer)
+      if (end < 0) break
+      const headers: Record<string, string> = {}
+      for (const line of decoder.decode(buffer.subarray(0, end)).split('\r\n')) {
+        const separator = line.indexOf(':')
+        if (separator > 0) headers[line.slice(0, separator).trim().toLowerCase()] = line.slice(separator + 1).trim()
+      }
+      const length = Number(headers['content-length'] || 0)
+      const bodyStart = end + 4
+      if (buffer.length < bodyStart + length + 2) break
+
+      const body = buffer.slice(bodyStart, bodyStart + length)
+      buffer = buffer.slice(bodyStart + length + 2)
+      const contentType = headers['content-type'] || ''
+      if (contentType.startsWith('image/')) {
+        onThumbnail(decodeURIComponent(headers['x-image-path'] || ''), URL.createObjectURL(new Blob([body], { type: contentType })))
+      }
+    }
+
+    const { done, value } = await reader.read()
+    if (done) break
+    const merged = new Uint8Array(buffer.length + value.length)
+    merged.set(buffer)
+    merged.set(value, buffer.length)
+    buffer = merged
+  }
+}
+
 // 获取时间线数据
 export const getPhotosByTimeline = async () => {
   try {
@@ -1,6 +1,6 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
-import { processFolder, getProcessingStatus, reindexFolder } from '@/api'
+import { processFolder, getProcessingStatus, reindexFolder, removeFolder as removeFolderIndex } from '@/api'
 import { useSettingStore } from '@/stores/settingStore'
 
 interface Folder {
@@ -127,8 +127,12 @@ export const useImageStore = defineStore('image', () => {
     }
   }
   
-  // 移除文件夹
-  const removeFolder = (folderId: number) => {
+  // 移除文件夹（同时删除后端索引中该文件夹下的所有图片）
+  const removeFolder = async (folderId: number) => {
+    const folder = processedFolders.value.find(f => f.id === folderId)
+    if (folder) {
+      await removeFolderIndex(folder.path)
+    }
     processedFolders.value = processedFolders.value.filter(folder => folder.id !== folderId)
   }
   
@@ -1,11 +1,87 @@
 import { defineStore } from 'pinia'
-import { ref } from 'vue'
-import { searchByText, searchByImage, getThumbnail } from '@/api'
+import { computed, ref } from 'vue'
+import { searchByText, searchByImage, fetchSearchPage, getThumbnail, fetchThumbnailsBatch } from '@/api'
+import type { ThumbnailSize } from '@/api'
+
+// 分页搜索每页的结果数
+const PAGE_SIZE = 20
 
 export const useSearchStore = defineStore('search', () => {
   const searchResults = ref<any[]>([])
   const isLoading = ref(false)
+  const isLoadingMore = ref(false)
+  // 服务端缓存的结果集游标和下一页的起始位置（没有更多结果时为 null）
+  const cursor = ref<string | null>(null)
+  const nextOffset = ref<number | null>(null)
+  const hasMore = computed(() => cursor.value !== null && nextOffset.value !== null)
+  let lastQuery = ''
   const searchHistory = ref<string[]>([])
+  // 批量接口返回的缩略图（路径 -> blob URL），以及仍在等待批量结果的路径
+  const thumbnailUrls = ref<Record<string, string>>({})
+  const pendingThumbnails = ref(new Set<string>())
+  let thumbnailBatch = 0
+  
+  // 一次请求加载整页结果的缩略图；批量请求失败的图片回退到单张缩略图接口
+  // append 为 true 时（加载更多）保留已加载的缩略图
+  const loadThumbnails = async (results: any[], append: boolean = false) => {
+    const batch = append ? thumbnailBatch : ++thumbnailBatch
+    if (!append) {
+      Object.values(thumbnailUrls.value).forEach(url => URL.revokeObjectURL(url))
+      thumbnailUrls.value = {}
+      pendingThumbnails.value = new Set()
+    }
+    
+    const paths = results.map(result => result.path).filter(Boolean)
+    paths.forEach(path => pendingThumbnails.value.add(path))
+    if (paths.length === 0) return
+    
+    try {
+      await fetchThumbnailsBatch(paths, (path, url) => {
+        if (batch !== thumbnailBatch) {
+          URL.revokeObjectURL(url)
+          return
+        }
+        thumbnailUrls.value[path] = url
+        pendingThumbnails.value.delete(path)
+      })
+    } catch (error) {
+      console.error('批量加载缩略图失败:', error)
+    } finally {
+      if (batch === thumbnailBatch) {
+        paths.forEach(path => pendingThumbnails.value.delete(path))
+      }
+    }
+  }
+  
+  const setFirstPage = (page: any) => {
+    searchResults.value = page.results || []
+    cursor.value = page.cursor || null
+    nextOffset.value = page.nextOffset ?? null
+    loadThumbnails(searchResults.value)
+  }
+  
+  // 加载更多：从服务端缓存的结果集中取下一页，不重新搜索
+  const loadMore = async () => {
+    if (!hasMore.value || isLoadingMore.value) return
+    isLoadingMore.value = true
+    try {
+      const page = await fetchSearchPage(cursor.value as string, nextOffset.value as number, PAGE_SIZE)
+      const results = page.results || []
+      searchResults.value = [...searchResults.value, ...results]
+      nextOffset.value = page.nextOffset ?? null
+      loadThumbnails(results, true)
+    } catch (error: any) {
+      if (error?.response?.status === 410) {
+        // 结果集已过期或索引已更新：文本搜索重新执行，以图搜图不再提供更多结果
+        cursor.value = null
+        if (lastQuery) await textSearch(lastQuery)
+      } else {
+        console.error('加载更多失败:', error)
+      }
+    } finally {
+      isLoadingMore.value = false
+    }
+  }
   
   // 文本搜索
   const textSearch = async (query: string) => {
@@ -13,8 +89,9 @@ export const useSearchStore = defineStore('search', () => {
     
     isLoading.value = true
     try {
-      const results = await searchByText(query)
-      searchResults.value = results.results || []
+      const results = await searchByText(query, PAGE_SIZE, undefined, PAGE_SIZE)
+      setFirstPage(results)
+      lastQuery = query
       
       // 添加到搜索历史
       if (!searchHistory.value.includes(query)) {
@@ -37,8 +114,9 @@ export const useSearchStore = defineStore('search', () => {
   const imageSearch = async (imageFile: File | string) => {
     isLoading.value = true
     try {
-      const results = await searchByImage(imageFile)
-      searchResults.value = results.results || []
+      const results = await searchByImage(imageFile, PAGE_SIZE, undefined, PAGE_SIZE)
+      setFirstPage(results)
+      lastQuery = ''
       return searchResults.value
     } catch (error) {
       console.error('以图搜图失败:', error)
@@ -48,22 +126,31 @@ export const useSearchStore = defineStore('search', () => {
     }
   }
   
-  // 获取缩略图URL
-  const getThumbnailUrl = (imagePath: string) => {
+  // 获取缩略图URL：默认档位优先使用批量加载的结果，批量请求进行中时先不加载
+  const getThumbnailUrl = (imagePath: string, size?: ThumbnailSize) => {
+    if (size !== undefined) return getThumbnail(imagePath, size)
+    if (thumbnailUrls.value[imagePath]) return thumbnailUrls.value[imagePath]
+    if (pendingThumbnails.value.has(imagePath)) return undefined
     return getThumbnail(imagePath)
   }
   
   // 清除搜索结果
   const clearResults = () => {
     searchResults.value = []
+    cursor.value = null
+    nextOffset.value = null
+    loadThumbnails([])
   }
   
   return {
     searchResults,
     isLoading,
+    isLoadingMore,
+    hasMore,
     searchHistory,
     textSearch,
     imageSearch,
+    loadMore,
     getThumbnailUrl,
     clearResults
   }